@@ -0,0 +1,130 @@
+# Purpose:  This script is to put several paragraphs into one API call and
+#           split the reply back into one translation per paragraph
+
+import json
+from chunker import count_tokens
+
+def make_batches(docs, batch_size = 5, max_batch_tokens = 1000, encoder = None):
+    """This function is to group consecutive paragraphs into batches by count
+    and by tokens.
+
+    Parameters
+    ----------
+    docs : list
+        (file name, paragraph) tuples in page/paragraph order
+    batch_size : int, optional
+        the maximum paragraphs in a batch, by default 5
+    max_batch_tokens : int, optional
+        the maximum input tokens of a batch, by default 1000
+    encoder : Encoding, optional
+        the tiktoken encoding, by default None (estimated tokens)
+
+    Returns
+    -------
+    list
+        the batches, each a list of (file name, paragraph) tuples
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for fname, doc in docs:
+        n_tokens = count_tokens(doc, encoder)
+        if current and ((len(current) >= batch_size) or (current_tokens + n_tokens > max_batch_tokens)):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((fname, doc))
+        current_tokens += n_tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def split_batch_response(content, n_segments):
+    """This function is to split the reply of a batch into the translations.
+
+    Parameters
+    ----------
+    content : str
+        the message content of the reply
+    n_segments : int
+        the number of paragraphs in the batch
+
+    Returns
+    -------
+    list
+        the translations (str), in order
+
+    Raises
+    ------
+    ValueError
+        if the reply is not a JSON array of n_segments strings
+    """
+    # the model sometimes wraps the array in a ```json block or a sentence:
+    start = content.find('[')
+    end = content.rfind(']')
+    if (start == -1) or (end < start):
+        raise ValueError("no JSON array in the reply")
+
+    segments = json.loads(content[start:end + 1])
+
+    if (not isinstance(segments, list)) or (not all(isinstance(i, str) for i in segments)):
+        raise ValueError("the reply is not a JSON array of strings")
+    if len(segments) != n_segments:
+        raise ValueError(f"expected {n_segments} segments, got {len(segments)}")
+
+    return [i.strip() for i in segments]
+
+
+def make_paragraph_results(result, docs, translations):
+    """This function is to turn the result of a batch into one result per
+    paragraph, in the same shape as a ChatCompletion result, so each one can be
+    saved by get_translation. The token usage is shared out by paragraph length.
+
+    Parameters
+    ----------
+    result : dict, JSON
+        the result of the batch
+    docs : list
+        the paragraphs of the batch
+    translations : list
+        the translations from split_batch_response
+
+    Returns
+    -------
+    list
+        the results (dict), one per paragraph
+    """
+    usage = result.get('usage', {})
+    total_chars = sum(len(i) for i in docs) or 1
+    results = []
+    used = {'prompt_tokens': 0, 'completion_tokens': 0}
+
+    for idx, (doc, translation) in enumerate(zip(docs, translations)):
+        share = {}
+        for k in ['prompt_tokens', 'completion_tokens']:
+            if idx == len(docs) - 1:
+                # the last paragraph takes the rounding remainder:
+                share[k] = usage.get(k, 0) - used[k]
+            else:
+                share[k] = int(usage.get(k, 0) * len(doc) / total_chars)
+            used[k] += share[k]
+        share['total_tokens'] = share['prompt_tokens'] + share['completion_tokens']
+
+        paragraph_result = dict(result)
+        paragraph_result['choices'] = [
+            {
+                'index': 0,
+                'message': {'role': 'assistant', 'content': translation},
+                'finish_reason': 'stop'
+            }
+            ]
+        paragraph_result['usage'] = share
+        paragraph_result['batch_id'] = result.get('id')
+        paragraph_result['batch_size'] = len(docs)
+        results.append(paragraph_result)
+
+    return results
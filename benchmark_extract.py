@@ -0,0 +1,59 @@
+# Purpose:  This script is to compare PDF_to_Text.get_txt (serial) with
+#           PDF_to_Text.get_txt_parallel for a growing number of processes
+
+import os
+import time
+import argparse
+
+def time_extraction(module, pdf_path, n_workers):
+    """This function is to time the text extraction of a PDF file.
+
+    Parameters
+    ----------
+    module : module
+        extract_text or extract_text_all
+    pdf_path : str
+        the PDF file
+    n_workers : int
+        the number of worker processes, 0 for the serial get_txt
+
+    Returns
+    -------
+    float, int
+        the wall-clock seconds and the number of pages
+    """
+    t_extractor = module.PDF_to_Text(file_path = pdf_path)
+    t_extractor.read_pdf()
+
+    begin = time.perf_counter()
+    if n_workers == 0:
+        articles = t_extractor.get_txt()
+    else:
+        articles = t_extractor.get_txt_parallel(n_workers = n_workers)
+    elapsed = time.perf_counter() - begin
+
+    return elapsed, len(articles)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "serial vs parallel page extraction")
+    parser.add_argument('pdf', help = "the PDF file")
+    parser.add_argument('--workers', default = "1,2,4,8", help = "comma-separated process counts")
+    parser.add_argument('--all', action = 'store_true', help = "use extract_text_all.py")
+    args = parser.parse_args()
+
+    if args.all:
+        import extract_text_all as module
+    else:
+        import extract_text as module
+
+    pdf_path = os.path.abspath(args.pdf)
+
+    serial, n_pages = time_extraction(module, pdf_path, 0)
+    print(f"serial: {n_pages} pages in {serial:.2f}s ({n_pages / serial:.1f} pages/s)")
+
+    for n_workers in [int(i) for i in args.workers.split(",")]:
+        elapsed, n_pages = time_extraction(module, pdf_path, n_workers)
+        print(f"{n_workers} process(es): {elapsed:.2f}s ({n_pages / elapsed:.1f} pages/s, "
+              f"speedup {serial / elapsed:.2f}x)")
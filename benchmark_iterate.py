@@ -0,0 +1,101 @@
+# Purpose:  This script is to compare the throughput of Translator.iterate
+#           (serial) and Translator.iterate_concurrent against the stub server
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from stub_server import StubServer
+
+def make_workspace(n_paragraphs):
+    """This function is to create a working directory with fake paragraph txt
+    files in before/ and a dummy api_key.py.
+
+    Parameters
+    ----------
+    n_paragraphs : int
+        the number of paragraph files
+
+    Returns
+    -------
+    str
+        the working directory
+    """
+    work_dir = tempfile.mkdtemp(prefix = "translator_bench_")
+    os.makedirs(os.path.join(work_dir, "before"))
+
+    with open(os.path.join(work_dir, "api_key.py"), 'w') as f:
+        f.write("api_key = 'sk-stub'\n")
+
+    sentence = "This is a sentence of a paragraph sent to the stub server. "
+    for i in range(n_paragraphs):
+        location = os.path.join(work_dir, "before", f"page_{i // 5}_{i % 5}.txt")
+        with open(location, 'w') as f:
+            f.write(sentence * 5)
+
+    return work_dir
+
+
+def run(mode, api_base, max_workers, stream = False):
+    """This function is to run one translation mode and time it.
+
+    Parameters
+    ----------
+    mode : str
+        'serial' or 'concurrent'
+    api_base : str
+        the base URL of the stub server
+    max_workers : int
+        the number of API calls in flight for the concurrent mode
+    stream : bool, optional
+        if it is True, the replies are streamed, by default False
+
+    Returns
+    -------
+    float
+        the wall-clock seconds
+    """
+    from translator import Translator
+
+    # no translation cache, so every paragraph is sent and the user's cache is left alone:
+    t = Translator('traditional chinese', api_base = api_base, stream = stream, cache_path = None)
+    t.create_directory()
+    t.get_metadata()
+
+    begin = time.perf_counter()
+    if mode == 'serial':
+        t.iterate()
+    else:
+        t.iterate_concurrent(max_workers = max_workers)
+    elapsed = time.perf_counter() - begin
+
+    t.merge_files()
+    return elapsed
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "serial vs concurrent translation throughput")
+    parser.add_argument('--paragraphs', type = int, default = 10)
+    parser.add_argument('--latency', type = float, default = 1.0, help = "stub seconds per request")
+    parser.add_argument('--workers', type = int, default = 8)
+    parser.add_argument('--stream', action = 'store_true', help = "stream the replies")
+    args = parser.parse_args()
+
+    server = StubServer(latency = args.latency)
+    api_base = server.start()
+
+    # translator.py imports api_key from the working directory:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        for mode in ['serial', 'concurrent']:
+            work_dir = make_workspace(args.paragraphs)
+            sys.path.insert(0, work_dir)
+            os.chdir(work_dir)
+            elapsed = run(mode, api_base, args.workers, args.stream)
+            sys.path.remove(work_dir)
+            print(f"{mode}: {args.paragraphs} paragraphs in {elapsed:.1f}s "
+                  f"({args.paragraphs / elapsed:.2f} paragraphs/s)")
+    finally:
+        server.stop()
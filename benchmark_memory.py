@@ -0,0 +1,120 @@
+# Purpose:  This script is to compare the peak memory of extracting every page
+#           at once (get_txt) with the page stream (iter_pages) on a large
+#           synthetic PDF, for several window sizes
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from synthetic_pdf import make_pdf
+
+def get_rss_mb():
+    """This function is to get the resident memory of this process, which
+    includes what pdfium allocates outside Python (Linux only).
+
+    Returns
+    -------
+    float or None
+        the resident memory in MB, None if /proc is not available
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def measure(pdf_path, mode, window):
+    """This function is to extract all the pages of a PDF file and measure the
+    time and the peak memory, in this process.
+
+    Parameters
+    ----------
+    pdf_path : str
+        the PDF file
+    mode : str
+        'get_txt' keeps every page, 'stream' goes through iter_pages
+    window : int
+        the window of iter_pages, 0 to keep the file open until the end
+
+    Returns
+    -------
+    dict
+        the pages, seconds, Python peak (tracemalloc) and resident memory
+    """
+    from extract_text_all import PDF_to_Text
+
+    t_extractor = PDF_to_Text(file_path = pdf_path, boilerplate = None)
+
+    tracemalloc.start()
+    begin = time.perf_counter()
+    n_pages = 0
+    n_chars = 0
+    if mode == 'get_txt':
+        t_extractor.read_pdf()
+        for text in t_extractor.get_txt().values():
+            n_pages += 1
+            n_chars += len(text)
+    else:
+        for _, text in t_extractor.iter_pages(window = window or None):
+            n_pages += 1
+            n_chars += len(text)
+    seconds = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss = get_rss_mb()
+    t_extractor.close()
+
+    return {
+        'mode': mode,
+        'window': window if mode == 'stream' else None,
+        'pages': n_pages,
+        'characters': n_chars,
+        'seconds': round(seconds, 3),
+        'pages_per_second': round(n_pages / seconds, 1),
+        'python_peak_mb': round(peak / 1024 ** 2, 2),
+        'rss_mb': rss
+        }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "peak memory of get_txt vs the page stream")
+    parser.add_argument('--pdf', default = None, help = "a PDF file, by default a synthetic one")
+    parser.add_argument('--pages', type = int, default = 2000, help = "pages of the synthetic PDF")
+    parser.add_argument('--windows', default = "0,64,256", help = "comma-separated windows, 0 for none")
+    parser.add_argument('--output', default = None, help = "write the results to this JSON file")
+    # one measurement in a fresh process, so the runs do not share memory:
+    parser.add_argument('--run', nargs = 3, metavar = ('PDF', 'MODE', 'WINDOW'), help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        print(json.dumps(measure(args.run[0], args.run[1], int(args.run[2]))))
+        sys.exit(0)
+
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = make_pdf(os.path.join(tempfile.mkdtemp(), f"synthetic_{args.pages}.pdf"), args.pages)
+
+    runs = [('get_txt', 0)] + [('stream', int(i)) for i in args.windows.split(",")]
+    results = []
+    for mode, window in runs:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', pdf_path, mode, str(window)],
+            capture_output = True, text = True, check = True
+            ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{mode} (window {result['window']}): {result['pages']} pages in {result['seconds']:.2f}s, "
+              f"Python peak {result['python_peak_mb']} MB, RSS {result['rss_mb']} MB")
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            json.dump(results, f, indent = 2)
@@ -0,0 +1,145 @@
+# Purpose:  This script is to compare the throughput and the abbreviation
+#           errors of the sentence segmenters (segmenter.py)
+
+import json
+import time
+import random
+import argparse
+from segmenter import SEGMENTERS, DEFAULT_ABBREVIATIONS, get_segmenter
+from synthetic_pdf import page_lines
+
+def make_pages(n_pages, seed = 0):
+    """This function is to make the text of synthetic pages, the same text
+    synthetic_pdf.py writes, without going through a PDF file.
+
+    Parameters
+    ----------
+    n_pages : int
+        the number of pages
+    seed : int, optional
+        the seed of the text, by default 0
+
+    Returns
+    -------
+    list
+        the text of each page, the lines joined by spaces
+    """
+    rng = random.Random(seed)
+    return [" ".join(page_lines(rng, i, n_pages)) for i in range(n_pages)]
+
+
+def read_pages(pdf_path):
+    """This function is to get the text of each page of a PDF file.
+
+    Parameters
+    ----------
+    pdf_path : str
+        the PDF file
+
+    Returns
+    -------
+    list
+        the text of each page, the lines joined by spaces
+    """
+    from extract_text_all import PDF_to_Text
+
+    t_extractor = PDF_to_Text(file_path = pdf_path)
+    t_extractor.read_pdf()
+    articles = t_extractor.get_txt()
+    return [v.replace("\r\n", " ") for v in articles.values()]
+
+
+def count_abbreviation_splits(sentences, abbreviations = DEFAULT_ABBREVIATIONS):
+    """This function is to count the sentences cut off right after an
+    abbreviation (ex: '... shown in Fig.'), which are wrong splits.
+
+    Parameters
+    ----------
+    sentences : list
+        the sentences
+    abbreviations : iterable, optional
+        the abbreviations, by default DEFAULT_ABBREVIATIONS
+
+    Returns
+    -------
+    int
+        the number of wrong splits
+    """
+    count = 0
+    for sentence in sentences[:-1]:
+        words = sentence.split()
+        if words and words[-1].endswith(".") and (words[-1].lower().rstrip(".") in abbreviations):
+            count += 1
+    return count
+
+
+def bench_segmenter(name, pages, repeat = 3):
+    """This function is to time a segmenter on all the pages in one batch.
+
+    Parameters
+    ----------
+    name : str
+        'rule' or 'nltk'
+    pages : list
+        the text of each page
+    repeat : int, optional
+        the runs to take the best time of, by default 3
+
+    Returns
+    -------
+    dict
+        the timings, throughputs and wrong splits
+    """
+    segmenter = get_segmenter(name)
+
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        sentences = segmenter.segment_batch(pages)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+
+    flat = [i for page in sentences for i in page]
+    n_chars = sum(len(i) for i in pages)
+    # the last sentence of a page can be cut off by the page break:
+    wrong_splits = sum(count_abbreviation_splits(page) for page in sentences)
+    return {
+        'segmenter': name,
+        'pages': len(pages),
+        'sentences': len(flat),
+        'seconds': round(best, 4),
+        'pages_per_second': round(len(pages) / best, 1),
+        'sentences_per_second': round(len(flat) / best, 1),
+        'characters_per_second': round(n_chars / best, 1),
+        'abbreviation_splits': wrong_splits
+        }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "sentence segmenter throughput")
+    parser.add_argument('--pdf', default = None, help = "a PDF file, by default synthetic pages")
+    parser.add_argument('--pages', type = int, default = 1000, help = "synthetic pages")
+    parser.add_argument('--segmenters', default = ",".join(SEGMENTERS), help = "comma-separated")
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--output', default = None, help = "write the results to this JSON file")
+    args = parser.parse_args()
+
+    pages = read_pages(args.pdf) if args.pdf else make_pages(args.pages)
+
+    results = []
+    for name in args.segmenters.split(","):
+        try:
+            result = bench_segmenter(name, pages, args.repeat)
+        except (ImportError, LookupError) as err:
+            # NLTK or its Punkt model is not installed:
+            print(f"{name}: skipped ({err})")
+            continue
+        results.append(result)
+        print(f"{name}: {result['pages']} pages in {result['seconds']:.3f}s "
+              f"({result['pages_per_second']:.0f} pages/s, {result['sentences_per_second']:.0f} sentences/s), "
+              f"{result['abbreviation_splits']} split(s) after an abbreviation")
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding = 'utf-8') as f:
+            json.dump(results, f, indent = 2)
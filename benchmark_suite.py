@@ -0,0 +1,347 @@
+# Purpose:  This script is to measure every stage of the extraction and
+#           translation paths on synthetic PDFs against the local mock server,
+#           and write the results as JSON to compare versions
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from synthetic_pdf import make_pdf
+from stub_server import StubServer, LATENCY_DISTRIBUTIONS
+
+# the extraction module and the translator module of each path:
+PATHS = {
+    'extract_text': 'translator',
+    'extract_text_all': 'translator_all',
+    }
+
+def get_version():
+    """This function is to get the git commit of the code being measured.
+
+    Returns
+    -------
+    str or None
+        the short commit hash, with '-dirty' for uncommitted changes, None
+        outside a git repository
+    """
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output = True, text = True,
+            cwd = os.path.dirname(os.path.abspath(__file__)), check = True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rate(count, seconds):
+    """This function is to get a throughput without dividing by zero.
+
+    Parameters
+    ----------
+    count : float
+        the items processed
+    seconds : float
+        the wall-clock seconds
+
+    Returns
+    -------
+    float
+        the items per second, rounded
+    """
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+def bench_extraction(extract_module, pdf_path, n_pages, n_workers):
+    """This function is to time read_pdf, get_txt and get_txt_parallel.
+
+    Parameters
+    ----------
+    extract_module : module
+        extract_text or extract_text_all
+    pdf_path : str
+        the PDF file
+    n_pages : int
+        the number of pages
+    n_workers : int
+        the processes of get_txt_parallel, 0 to leave it out
+
+    Returns
+    -------
+    PDF_to_Text, dict
+        the extractor with the pages extracted, and the timings
+    """
+    t_extractor = extract_module.PDF_to_Text(file_path = pdf_path)
+
+    begin = time.perf_counter()
+    t_extractor.read_pdf()
+    read_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    t_extractor.get_txt()
+    serial_seconds = time.perf_counter() - begin
+
+    result = {
+        'read_pdf_seconds': round(read_seconds, 4),
+        'get_txt_seconds': round(serial_seconds, 4),
+        'pages_per_second': rate(n_pages, serial_seconds)
+        }
+    if t_extractor.boilerplate is not None:
+        result['boilerplate_saved_tokens'] = t_extractor.boilerplate.saved_tokens
+
+    if n_workers:
+        articles = t_extractor.articles
+        begin = time.perf_counter()
+        t_extractor.get_txt_parallel(n_workers = n_workers)
+        parallel_seconds = time.perf_counter() - begin
+        t_extractor.articles = articles
+        result.update({
+            'parallel_workers': n_workers,
+            'get_txt_parallel_seconds': round(parallel_seconds, 4),
+            'parallel_pages_per_second': rate(n_pages, parallel_seconds)
+            })
+
+    return t_extractor, result
+
+
+def bench_text(t_extractor):
+    """This function is to time sentence segmenting and chunking on the text
+    of all the extracted pages.
+
+    Parameters
+    ----------
+    t_extractor : PDF_to_Text
+        the extractor after get_txt
+
+    Returns
+    -------
+    dict
+        the timings and throughputs
+    """
+    pages = [v.replace("\r\n", " ") for v in t_extractor.articles.values()]
+    text = " ".join(pages)
+
+    begin = time.perf_counter()
+    sentences = [i for page in t_extractor.segmenter.segment_batch(pages) for i in page]
+    tokenize_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    chunks = t_extractor.chunker.chunk(sentences)
+    chunk_seconds = time.perf_counter() - begin
+
+    return {
+        'characters': len(text),
+        'segmenter': getattr(t_extractor.segmenter, 'name', type(t_extractor.segmenter).__name__),
+        'sentences': len(sentences),
+        'segment_seconds': round(tokenize_seconds, 4),
+        'sentences_per_second': rate(len(sentences), tokenize_seconds),
+        'characters_per_second': rate(len(text), tokenize_seconds),
+        'chunks': len(chunks),
+        'chunk_seconds': round(chunk_seconds, 4),
+        'chunk_sentences_per_second': rate(len(sentences), chunk_seconds)
+        }
+
+
+def bench_paragraphs(t_extractor, n_pages):
+    """This function is to time splitting all the pages into paragraphs.
+
+    Parameters
+    ----------
+    t_extractor : PDF_to_Text
+        the extractor after get_txt
+    n_pages : int
+        the number of pages
+
+    Returns
+    -------
+    list, dict
+        the Paragraph records and the timings
+    """
+    # extract_text.py translates a range, set it to the whole document by its phrases:
+    begin = time.perf_counter()
+    if hasattr(t_extractor, 'set_page_range'):
+        t_extractor.set_page_range(start = "Synthetic Benchmark Document", end = "End of the synthetic document.")
+    range_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    paragraphs = list(t_extractor.iter_paragraphs())
+    seconds = time.perf_counter() - begin
+
+    return paragraphs, {
+        'paragraphs': len(paragraphs),
+        'range_seconds': round(range_seconds, 4),
+        'split_seconds': round(seconds, 4),
+        'pages_per_second': rate(n_pages, seconds)
+        }
+
+
+def bench_translation(translator_module, paragraphs, work_dir, server, args):
+    """This function is to time iterate_concurrent and merge_files against the
+    mock server.
+
+    Parameters
+    ----------
+    translator_module : module
+        translator or translator_all
+    paragraphs : list
+        the Paragraph records to translate
+    work_dir : str
+        the directory for the 'after' directory
+    server : StubServer
+        the running mock server
+    args : argparse.Namespace
+        the settings of the run
+
+    Returns
+    -------
+    dict
+        the timings, throughputs and the server counters
+    """
+    t = translator_module.Translator(
+        'traditional chinese', api_base = server.api_base, cache_path = None,
+        output_dir = work_dir, request_timeout = args.request_timeout, stream = args.stream
+        )
+    t.create_directory()
+    t.set_paragraphs(paragraphs)
+
+    before = dict(server.stats)
+    begin = time.perf_counter()
+    t.iterate_concurrent(max_workers = args.translate_workers, rpm = args.client_rpm, tpm = args.client_tpm)
+    seconds = time.perf_counter() - begin
+    server_stats = {k: v - before.get(k, 0) for k, v in server.stats.items()}
+
+    begin = time.perf_counter()
+    t.merge_files()
+    merge_seconds = time.perf_counter() - begin
+
+    done = len(paragraphs) - len(t.failed_files)
+    result = {
+        'paragraphs': len(paragraphs),
+        'failed': len(t.failed_files),
+        'translate_seconds': round(seconds, 4),
+        'paragraphs_per_second': rate(done, seconds),
+        'requests_per_second': rate(server_stats.get('requests', 0), seconds),
+        'merge_seconds': round(merge_seconds, 4),
+        'server': server_stats
+        }
+    if t.ttfts:
+        ttfts = sorted(t.ttfts)
+        result['ttft_p50'] = round(ttfts[len(ttfts) // 2], 4)
+        result['ttft_p95'] = round(ttfts[min(int(len(ttfts) * 0.95), len(ttfts) - 1)], 4)
+
+    t.client.close()
+    t.results.close()
+    return result
+
+
+def run_suite(args):
+    """This function is to run every benchmark for every page count and path.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the settings of the run
+
+    Returns
+    -------
+    dict
+        the JSON report
+    """
+    import importlib
+
+    work_root = tempfile.mkdtemp(prefix = "translator_suite_")
+    # the translator modules import api_key from the path:
+    with open(os.path.join(work_root, "api_key.py"), 'w') as f:
+        f.write("api_key = 'sk-stub'\n")
+    sys.path.insert(0, work_root)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    server = StubServer(
+        latency = args.latency, latency_dist = args.latency_dist, rpm = args.server_rpm,
+        tpm = args.server_tpm, error_rate = args.error_rate, timeout_rate = args.timeout_rate,
+        hang_seconds = args.request_timeout + 1, seed = args.seed
+        )
+    server.start()
+
+    report = {
+        'version': get_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': vars(args),
+        'results': []
+        }
+
+    try:
+        for n_pages in [int(i) for i in args.pages.split(",")]:
+            pdf_path = make_pdf(os.path.join(work_root, f"synthetic_{n_pages}.pdf"), n_pages, args.seed)
+
+            for extract_name, translator_name in PATHS.items():
+                extract_module = importlib.import_module(extract_name)
+                translator_module = importlib.import_module(translator_name)
+                work_dir = os.path.join(work_root, f"{extract_name}_{n_pages}")
+
+                t_extractor, extraction = bench_extraction(
+                    extract_module, pdf_path, n_pages, args.extract_workers
+                    )
+                text = bench_text(t_extractor)
+                paragraphs, split = bench_paragraphs(t_extractor, n_pages)
+                translation = bench_translation(
+                    translator_module, paragraphs[:args.max_paragraphs], work_dir, server, args
+                    )
+                t_extractor.close()
+
+                result = {
+                    'pages': n_pages,
+                    'extract_module': extract_name,
+                    'translator_module': translator_name,
+                    'extraction': extraction,
+                    'text': text,
+                    'split': split,
+                    'translation': translation
+                    }
+                report['results'].append(result)
+                print(f"{n_pages} pages, {extract_name}/{translator_name}: "
+                      f"{extraction['pages_per_second']} pages/s, "
+                      f"{text['sentences_per_second']} sentences/s, "
+                      f"{translation['requests_per_second']} requests/s, "
+                      f"merge {translation['merge_seconds']}s")
+    finally:
+        server.stop()
+
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "benchmark extraction and translation on synthetic PDFs")
+    parser.add_argument('--pages', default = "10,100,1000", help = "comma-separated page counts")
+    parser.add_argument('--output', default = "benchmark_results.json", help = "the JSON report")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--extract-workers', type = int, default = 0,
+                        help = "processes for get_txt_parallel, 0 to leave it out")
+    parser.add_argument('--max-paragraphs', type = int, default = 200,
+                        help = "paragraphs translated per document")
+    parser.add_argument('--translate-workers', type = int, default = 8)
+    parser.add_argument('--stream', action = 'store_true', help = "stream the replies")
+    parser.add_argument('--request-timeout', type = float, default = 5.0)
+    parser.add_argument('--client-rpm', type = int, default = 3500)
+    parser.add_argument('--client-tpm', type = int, default = 90000)
+    # the mock server:
+    parser.add_argument('--latency', type = float, default = 0.2, help = "mean seconds per request")
+    parser.add_argument('--latency-dist', default = 'lognormal', choices = LATENCY_DISTRIBUTIONS)
+    parser.add_argument('--server-rpm', type = int, default = None)
+    parser.add_argument('--server-tpm', type = int, default = None)
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = "share of injected 429s")
+    parser.add_argument('--timeout-rate', type = float, default = 0.0, help = "share of unanswered requests")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+
+    with open(args.output, 'w', encoding = 'utf-8') as f:
+        json.dump(report, f, indent = 2)
+    print(f"results written to {args.output}")
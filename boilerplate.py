@@ -0,0 +1,257 @@
+# Purpose:  This script is to find the lines repeated across the pages of a
+#           document (running headers, journal footers, page numbers, license
+#           lines) and take them out before chunking, so they are not
+#           translated again on every page
+
+import re
+import hashlib
+from collections import Counter
+from chunker import count_tokens
+
+BOILERPLATE_MODES = ('drop', 'once')
+
+# the first and last lines of a page looked at when the pages are streamed,
+# where the running headers and footers are:
+STREAM_EDGE_LINES = 5
+
+DIGITS = re.compile(r"\d+")
+SPACES = re.compile(r"\s+")
+
+def normalize_line(line):
+    """This function is to normalize a line so its copies on other pages look
+    the same: lower case, single spaces, and every number replaced by '#'
+    ('Page 3 of 12' and 'Page 4 of 12' are the same line).
+
+    Parameters
+    ----------
+    line : str
+        a line of a page
+
+    Returns
+    -------
+    str
+        the normalized line
+    """
+    line = line.replace("\x02", "-").replace("\x00", " ")
+    return SPACES.sub(" ", DIGITS.sub("#", line.lower())).strip()
+
+
+def hash_line(line):
+    """This function is to get the key of a normalized line, 8 bytes however
+    long the line is, so counting the lines of a long document stays small.
+
+    Parameters
+    ----------
+    line : str
+        the normalized line
+
+    Returns
+    -------
+    bytes
+        the hash of the line
+    """
+    return hashlib.blake2b(line.encode('utf-8'), digest_size = 8).digest()
+
+
+class BoilerplateDetector:
+    """This class is to count, for each normalized line, the pages it is on,
+    and remove from every page the lines found on too many pages to be body
+    text.
+    """
+
+    def __init__(self, mode = 'drop', min_pages = 3, min_ratio = 0.5, edge_lines = None, encoder = None):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        mode : str, optional
+            'drop' removes the repeated lines from every page, 'once' keeps
+            their first copy so they are translated once, by default 'drop'
+        min_pages : int, optional
+            the fewest pages a line has to be on, by default 3
+        min_ratio : float, optional
+            the share of the pages a line has to be on, by default 0.5
+        edge_lines : int, optional
+            only look at the first and last edge_lines lines of a page (where
+            headers and footers are), None for the whole page, by default None
+        encoder : Encoding, optional
+            the tiktoken encoding for the tokens saved, by default estimated
+        """
+        if mode not in BOILERPLATE_MODES:
+            raise ValueError(f"unknown boilerplate mode: {mode}, choose from {', '.join(BOILERPLATE_MODES)}")
+
+        self.mode = mode
+        self.min_pages = min_pages
+        self.min_ratio = min_ratio
+        self.edge_lines = edge_lines
+        self.encoder = encoder
+        self.repeated = set()
+        self.seen = set()
+        self.n_pages = 0
+        self.removed_lines = 0
+        self.removed_chars = 0
+        self.saved_tokens = 0
+
+    def candidate_lines(self, lines):
+        """This function is to get the lines of a page that can be boilerplate.
+
+        Parameters
+        ----------
+        lines : list
+            the lines of a page
+
+        Returns
+        -------
+        list
+            (index, line) tuples
+        """
+        indexed = list(enumerate(lines))
+        if (self.edge_lines is None) or (len(lines) <= 2 * self.edge_lines):
+            return indexed
+        return indexed[:self.edge_lines] + indexed[-self.edge_lines:]
+
+    def fit(self, pages):
+        """This function is to count the pages each line is on and keep the
+        ones on enough pages.
+
+        Parameters
+        ----------
+        pages : iterable
+            the text of each page, the lines separated by '\\r\\n'
+
+        Returns
+        -------
+        set
+            the hashes of the repeated lines
+        """
+        counts = Counter()
+        n_pages = 0
+        for text in pages:
+            n_pages += 1
+            keys = set()
+            for _, line in self.candidate_lines(text.split("\r\n")):
+                normalized = normalize_line(line)
+                if normalized:
+                    keys.add(hash_line(normalized))
+            # a line counts once per page:
+            counts.update(keys)
+
+        threshold = max(self.min_pages, self.min_ratio * n_pages)
+        self.repeated = {k for k, v in counts.items() if v >= threshold}
+        self.n_pages = n_pages
+        # a new document starts the counters again:
+        self.seen = set()
+        self.removed_lines = 0
+        self.removed_chars = 0
+        self.saved_tokens = 0
+
+        return self.repeated
+
+    def clean(self, text):
+        """This function is to remove the repeated lines from the text of a page.
+
+        Parameters
+        ----------
+        text : str
+            the text of a page, the lines separated by '\\r\\n'
+
+        Returns
+        -------
+        str
+            the text without the repeated lines
+        """
+        if not self.repeated:
+            return text
+
+        lines = text.split("\r\n")
+        removed = set()
+        for idx, line in self.candidate_lines(lines):
+            normalized = normalize_line(line)
+            if not normalized:
+                continue
+            key = hash_line(normalized)
+            if key not in self.repeated:
+                continue
+            # the first copy is translated in 'once' mode:
+            if (self.mode == 'once') and (key not in self.seen):
+                self.seen.add(key)
+                continue
+            removed.add(idx)
+            self.removed_lines += 1
+            self.removed_chars += len(line)
+            self.saved_tokens += count_tokens(line, self.encoder)
+
+        if not removed:
+            return text
+        return "\r\n".join(line for idx, line in enumerate(lines) if idx not in removed)
+
+    def clean_pages(self, articles):
+        """This function is to find the repeated lines of all the pages and
+        remove them.
+
+        Parameters
+        ----------
+        articles : dictionary
+            page number as the key and the text content as the value
+
+        Returns
+        -------
+        dictionary
+            the same keys, with the text content without the repeated lines
+        """
+        self.fit(articles.values())
+        return {k: self.clean(v) for k, v in articles.items()}
+
+    def clean_stream(self, open_pages, edge_lines = STREAM_EDGE_LINES):
+        """This function is to find the repeated lines of pages that are not
+        held in memory and remove them, in two passes: the first one over the
+        pages only counts the hashes of their edge lines, the second one
+        yields each page without the repeated lines. The report is printed
+        after the last page.
+
+        Parameters
+        ----------
+        open_pages : callable
+            open_pages() returning a new iterator of (page number, text
+            content), called once per pass
+        edge_lines : int, optional
+            the first and last lines of a page looked at if the detector looks
+            at whole pages, so the counts stay small, by default 5
+
+        Yields
+        ------
+        str, str
+            the page number and the text content without the repeated lines
+        """
+        whole_pages = self.edge_lines is None
+        if whole_pages:
+            self.edge_lines = edge_lines
+        try:
+            self.fit(text for _, text in open_pages())
+            for page_num, text in open_pages():
+                yield page_num, self.clean(text)
+            self.report()
+        finally:
+            if whole_pages:
+                self.edge_lines = None
+
+    def report(self):
+        """This function is to print the repeated lines found and the tokens
+        saved by removing them.
+
+        Returns
+        -------
+        dict
+            the repeated lines, removed lines, removed characters and tokens saved
+        """
+        summary = {
+            'pages': self.n_pages,
+            'repeated_lines': len(self.repeated),
+            'removed_lines': self.removed_lines,
+            'removed_chars': self.removed_chars,
+            'saved_tokens': self.saved_tokens
+            }
+        tokenizer = "tiktoken" if self.encoder is not None else "estimated"
+        print(f"boilerplate: {summary['repeated_lines']} line(s) repeated across {summary['pages']} pages, "
+              f"{summary['removed_lines']} removed, ~{summary['saved_tokens']} input tokens saved ({tokenizer})")
+        return summary
@@ -0,0 +1,201 @@
+# Purpose:  This script is to make ChatCompletion calls through one pooled,
+#           keep-alive HTTP session owned by the translator
+
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+
+class APIStatusError(Exception):
+    """This class is the error of a ChatCompletion call answered with a non-2xx
+    status. It carries the status and headers, so retry.py can tell retryable
+    errors apart and read Retry-After.
+    """
+
+    def __init__(self, message, http_status, headers):
+        super().__init__(message)
+        self.http_status = http_status
+        self.headers = headers
+
+
+class ChatClient:
+    """This class is to send ChatCompletion requests with a keep-alive
+    connection pool, connect and read timeouts and a configurable base URL.
+    One client is shared by all the worker threads of a translator.
+    """
+
+    def __init__(self, api_key, api_base = None, pool_size = 8, connect_timeout = 10,
+                 read_timeout = 120):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        api_key : str or None
+            the OpenAI API key, None sends no Authorization header
+        api_base : str, optional
+            the base URL, ex: 'http://127.0.0.1:8000/v1' for the local stub
+            server, by default the OpenAI API
+        pool_size : int, optional
+            the connections kept open, match it to the number of workers, by default 8
+        connect_timeout : float, optional
+            the seconds to open a connection, by default 10
+        read_timeout : float, optional
+            the seconds to wait for the reply, by default 120
+        """
+        self.api_base = (api_base or DEFAULT_API_BASE).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = None
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, pool_size):
+        """This function is to change the number of connections kept open.
+
+        Parameters
+        ----------
+        pool_size : int
+            the connections kept open
+        """
+        if pool_size == self.pool_size:
+            return
+        # retries are done by retry.py, not by urllib3:
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size, max_retries = 0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_size = pool_size
+
+    def create(self, **params):
+        """This function is to send a ChatCompletion request.
+
+        Parameters
+        ----------
+        **params
+            the request body: model, messages, temperature, max_tokens, ...
+
+        Returns
+        -------
+        dict
+            the ChatCompletion result
+
+        Raises
+        ------
+        APIStatusError
+            if the server answers with a non-2xx status
+        requests.Timeout, requests.ConnectionError
+            if the server cannot be reached in time
+        """
+        response = self.session.post(
+            f"{self.api_base}/chat/completions", json = params, timeout = self.timeout
+            )
+
+        if response.status_code >= 400:
+            try:
+                message = response.json()['error']['message']
+            except (ValueError, KeyError, TypeError):
+                message = response.text[:200]
+            raise APIStatusError(
+                f"{response.status_code}: {message}", response.status_code, response.headers
+                )
+
+        return response.json()
+
+    def create_stream(self, on_delta = None, **params):
+        """This function is to send a ChatCompletion request with stream=True
+        and collect the deltas as they arrive. The result has the same shape
+        as the one of create, plus the time to the first token.
+
+        Parameters
+        ----------
+        on_delta : callable, optional
+            called as on_delta(text) with every piece of the reply, by default None
+        **params
+            the request body: model, messages, temperature, max_tokens, ...
+
+        Returns
+        -------
+        dict
+            the ChatCompletion result, with 'ttft' (seconds to the first
+            token) and 'elapsed' (seconds to the last one)
+
+        Raises
+        ------
+        APIStatusError
+            if the server answers with a non-2xx status or an error event
+        requests.Timeout, requests.ConnectionError
+            if the server cannot be reached in time
+        """
+        params = {**params, 'stream': True, 'stream_options': {'include_usage': True}}
+        begin = time.perf_counter()
+        response = self.session.post(
+            f"{self.api_base}/chat/completions", json = params, timeout = self.timeout,
+            stream = True
+            )
+
+        with response:
+            if response.status_code >= 400:
+                try:
+                    message = response.json()['error']['message']
+                except (ValueError, KeyError, TypeError):
+                    message = response.text[:200]
+                raise APIStatusError(
+                    f"{response.status_code}: {message}", response.status_code, response.headers
+                    )
+
+            pieces = []
+            completion = {'id': None, 'model': params.get('model'), 'usage': None}
+            finish_reason = None
+            ttft = None
+
+            # server-sent events, one 'data: {...}' line per chunk:
+            for line in response.iter_lines(decode_unicode = True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise APIStatusError(
+                        f"stream error: {chunk['error'].get('message')}", 500, response.headers
+                        )
+
+                completion['id'] = chunk.get('id', completion['id'])
+                completion['model'] = chunk.get('model', completion['model'])
+                # the last chunk carries the usage and no choices:
+                if chunk.get('usage'):
+                    completion['usage'] = chunk['usage']
+
+                for choice in chunk.get('choices') or []:
+                    text = (choice.get('delta') or {}).get('content')
+                    if text:
+                        if ttft is None:
+                            ttft = time.perf_counter() - begin
+                        pieces.append(text)
+                        if on_delta is not None:
+                            on_delta(text)
+                    if choice.get('finish_reason'):
+                        finish_reason = choice['finish_reason']
+
+        completion['choices'] = [
+            {
+                'index': 0,
+                'message': {'role': 'assistant', 'content': "".join(pieces)},
+                'finish_reason': finish_reason
+            }
+            ]
+        completion['ttft'] = ttft
+        completion['elapsed'] = time.perf_counter() - begin
+
+        return completion
+
+    def close(self):
+        """This function is to close the pooled connections.
+        """
+        self.session.close()
@@ -0,0 +1,115 @@
+# Purpose:  This script is to check the paragraph extraction on synthetic PDF
+#           files with the pages that used to stop it, and exit non-zero if a
+#           page is lost
+
+import os
+import sys
+import argparse
+import tempfile
+from synthetic_pdf import make_pdf
+
+def extract(module, pdf_path, output_dir, *page_range):
+    """This function is to extract the paragraphs of a PDF file into the
+    'before' directory, as the extract subcommand does.
+
+    Parameters
+    ----------
+    module : module
+        extract_text or extract_text_all
+    pdf_path : str
+        the PDF file
+    output_dir : str
+        the directory for the 'before' directory
+    *page_range
+        start, end, start_heading, end_heading for extract_text.iterate
+
+    Returns
+    -------
+    str, list, PDF_to_Text
+        the last paragraph returned by iterate, the page indices with a
+        paragraph file, sorted, and the extractor
+    """
+    t_extractor = module.PDF_to_Text(file_path = pdf_path, output_dir = output_dir)
+    t_extractor.create_directory()
+    t_extractor.read_pdf()
+    t_extractor.get_txt()
+    doc = t_extractor.iterate(*page_range)
+    t_extractor.close()
+
+    pages = {int(i.split("_")[1]) for i in os.listdir(os.path.join(output_dir, "before")) if i.endswith(".txt")}
+    return doc, sorted(pages), t_extractor
+
+
+def check_empty_page(work_dir):
+    """This function is to check that a page left empty by the boilerplate
+    step (only a running header and footer) is skipped, and the pages after
+    it are still extracted.
+
+    Parameters
+    ----------
+    work_dir : str
+        a directory for the PDF file and the outputs
+
+    Returns
+    -------
+    list
+        the failures (str), empty if the check passes
+    """
+    import extract_text
+    import extract_text_all
+
+    pdf_path = make_pdf(os.path.join(work_dir, "empty_page.pdf"), 6, empty_pages = (2,))
+    failures = []
+    for module in [extract_text, extract_text_all]:
+        doc, pages, _ = extract(module, pdf_path, os.path.join(work_dir, f"empty_page_{module.__name__}"))
+        if (doc is None) or (pages != [0, 1, 3, 4, 5]):
+            failures.append(f"{module.__name__}: header/footer-only page, got pages {pages}")
+    return failures
+
+
+def check_end_heading(work_dir):
+    """This function is to check that a range ending at a heading at the top
+    of a page (the usual References) ends at the page before, without an
+    empty last page.
+
+    Parameters
+    ----------
+    work_dir : str
+        a directory for the PDF file and the outputs
+
+    Returns
+    -------
+    list
+        the failures (str), empty if the check passes
+    """
+    import extract_text
+
+    pdf_path = make_pdf(
+        os.path.join(work_dir, "end_heading.pdf"), 6, empty_pages = (4,), headings = {5: 'References'}
+        )
+    doc, pages, t_extractor = extract(
+        extract_text, pdf_path, os.path.join(work_dir, "end_heading"), None, None, None, 'References'
+        )
+    if (doc is None) or (pages != [0, 1, 2, 3]) or (t_extractor.end_page != "page_3"):
+        return [f"extract_text: range ending at a heading at the top of a page, "
+                f"got pages {pages} to {t_extractor.end_page}"]
+    return []
+
+
+CHECKS = [check_empty_page, check_end_heading]
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "check the paragraph extraction on edge-case pages")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    failures = []
+    for check in CHECKS:
+        found = check(work_dir)
+        print(f"{check.__name__}: {'ok' if not found else 'FAILED'}")
+        failures += found
+
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
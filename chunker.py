@@ -0,0 +1,184 @@
+# Purpose:  This script is to pack sentences into paragraphs by token count,
+#           so each API call is as full as possible without cutting off the reply
+
+import statistics
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# expected translated tokens per English token:
+LANGUAGE_EXPANSION = {
+    'traditional chinese': 1.6,
+    'simplified chinese': 1.5,
+    'chinese': 1.5,
+    'japanese': 1.8,
+    'korean': 1.9,
+    'french': 1.35,
+    'german': 1.35,
+    'spanish': 1.3,
+    'italian': 1.3,
+    'portuguese': 1.3,
+    }
+DEFAULT_EXPANSION = 1.5
+
+# the share of max_tokens a chunk is sized for, the rest left for the variance
+# of the expansion between paragraphs:
+SAFETY_MARGIN = 0.8
+
+def get_expansion(language):
+    """This function is to get the expected translated tokens per English token
+    of a target language.
+
+    Parameters
+    ----------
+    language : str
+        the language you want ChatGPT to translate into
+
+    Returns
+    -------
+    float
+        the expansion ratio, DEFAULT_EXPANSION for a language not in LANGUAGE_EXPANSION
+    """
+    return LANGUAGE_EXPANSION.get(language.lower().strip(), DEFAULT_EXPANSION)
+
+
+def get_encoder(model = "gpt-3.5-turbo"):
+    """This function is to get the local tokenizer of a model.
+
+    Parameters
+    ----------
+    model : str, optional
+        the ChatCompletion model, by default "gpt-3.5-turbo"
+
+    Returns
+    -------
+    Encoding or None
+        the tiktoken encoding, None if tiktoken is not installed
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, encoder = None):
+    """This function is to count the tokens of a text with the local tokenizer,
+    or estimate them (~4 characters per token) if tiktoken is not installed.
+
+    Parameters
+    ----------
+    text : str
+        the text
+    encoder : Encoding, optional
+        the tiktoken encoding from get_encoder, by default None
+
+    Returns
+    -------
+    int
+        the number of tokens
+    """
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special = ()))
+    return int(len(text) / 4) + 1
+
+
+class TokenChunker:
+    """This class is to pack whole sentences into chunks up to an input-token
+    budget, leaving room for the translated reply.
+    """
+
+    def __init__(self, max_input_tokens = None, reply_tokens = 1024, expansion_ratio = None,
+                 model = "gpt-3.5-turbo", language = 'traditional chinese', safety_margin = SAFETY_MARGIN):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        max_input_tokens : int, optional
+            the token budget of a chunk, by default
+            reply_tokens * safety_margin / expansion_ratio
+        reply_tokens : int, optional
+            the max_tokens of the reply, by default 1024
+        expansion_ratio : float, optional
+            the expected translated tokens per source token, by default the one
+            of language in LANGUAGE_EXPANSION
+        model : str, optional
+            the model whose tokenizer is used, by default "gpt-3.5-turbo"
+        language : str, optional
+            the language of the translation, by default 'traditional chinese'
+        safety_margin : float, optional
+            the share of reply_tokens a chunk is sized for, by default 0.8
+        """
+        if expansion_ratio is None:
+            expansion_ratio = get_expansion(language)
+        if max_input_tokens is None:
+            max_input_tokens = int(reply_tokens * safety_margin / expansion_ratio)
+
+        self.max_input_tokens = max_input_tokens
+        self.encoder = get_encoder(model)
+        self.chunk_tokens = []
+
+    def chunk(self, sentences):
+        """This function is to pack sentences into chunks. A sentence longer
+        than the budget becomes a chunk on its own.
+
+        Parameters
+        ----------
+        sentences : list
+            the sentences of a page, in order
+
+        Returns
+        -------
+        list
+            the chunks (str)
+        """
+        chunks = []
+        current = []
+        current_tokens = 0
+
+        for sentence in sentences:
+            # +1 for the joining space:
+            n_tokens = count_tokens(sentence, self.encoder) + 1
+            if current and (current_tokens + n_tokens > self.max_input_tokens):
+                chunks.append(" ".join(current))
+                self.chunk_tokens.append(current_tokens)
+                current = []
+                current_tokens = 0
+            current.append(sentence)
+            current_tokens += n_tokens
+
+        if current:
+            chunks.append(" ".join(current))
+            self.chunk_tokens.append(current_tokens)
+
+        return chunks
+
+    def report(self):
+        """This function is to print the chunk count and token distribution of
+        all the chunks made so far.
+
+        Returns
+        -------
+        dict
+            the chunk count and the min, mean, median, p90, max and total tokens
+        """
+        tokens = sorted(self.chunk_tokens)
+        if not tokens:
+            summary = {'chunks': 0, 'total_tokens': 0}
+        else:
+            summary = {
+                'chunks': len(tokens),
+                'min_tokens': tokens[0],
+                'mean_tokens': round(statistics.mean(tokens), 1),
+                'median_tokens': statistics.median(tokens),
+                'p90_tokens': tokens[min(int(len(tokens) * 0.9), len(tokens) - 1)],
+                'max_tokens': tokens[-1],
+                'total_tokens': sum(tokens)
+                }
+
+        tokenizer = "tiktoken" if self.encoder is not None else "estimated"
+        print(f"chunks: {summary} (budget {self.max_input_tokens} tokens, {tokenizer})")
+        return summary
@@ -0,0 +1,250 @@
+# Purpose:  This script is the command line entry point, with one subcommand per
+#           step: extract, translate, merge and cost. Each subcommand imports
+#           only what it needs, so --help and cost reports start right away
+
+import os
+import sys
+import argparse
+
+def extract(args):
+    """This function is to break a PDF file into paragraph txt files in the
+    'before' directory.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        pdf, output_dir, all, language, segmenter, boilerplate, start, end, start_heading, end_heading
+    """
+    page_range = [args.start, args.end, args.start_heading, args.end_heading]
+    if args.all and any(i is not None for i in page_range):
+        sys.exit("a page range cannot be used with --all, which extracts the whole document")
+    
+    if args.all:
+        from extract_text_all import PDF_to_Text
+    else:
+        from extract_text import PDF_to_Text
+
+    t_extractor = PDF_to_Text(
+        file_path = os.path.abspath(args.pdf), output_dir = args.output_dir, segmenter = args.segmenter,
+        boilerplate = None if args.boilerplate == 'keep' else args.boilerplate, language = args.language
+        )
+    t_extractor.create_directory()
+    t_extractor.read_pdf()
+    t_extractor.get_txt()
+    if args.all:
+        t_extractor.iterate()
+    else:
+        t_extractor.iterate(*page_range)
+
+
+def page_or_phrase(value):
+    """This function is to read an end of the page range: a page number or a phrase.
+
+    Parameters
+    ----------
+    value : str
+        the argument
+
+    Returns
+    -------
+    int or str
+        the page number if the argument is a number, otherwise the phrase
+    """
+    return int(value) if value.isdigit() else value
+
+
+def make_translator(args):
+    """This function is to create the Translator of a working directory.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        language, output_dir, all, api_base, no_cache, stream, memory
+
+    Returns
+    -------
+    Translator
+        the translator, after create_directory
+    """
+    if args.all:
+        from translator_all import Translator
+    else:
+        from translator import Translator
+    from translation_cache import DEFAULT_CACHE_PATH
+
+    t = Translator(
+        args.language, api_base = args.api_base, output_dir = args.output_dir,
+        cache_path = None if args.no_cache else DEFAULT_CACHE_PATH,
+        stream = getattr(args, 'stream', False),
+        memory_path = getattr(args, 'memory', None)
+        )
+    t.create_directory()
+    return t
+
+
+def translate(args):
+    """This function is to translate the paragraph txt files of the 'before'
+    directory and merge the translations.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the translator settings, workers, rpm, tpm, progressive
+    """
+    t = make_translator(args)
+    t.get_metadata()
+    t.iterate_concurrent(
+        max_workers = args.workers, rpm = args.rpm, tpm = args.tpm, progressive = args.progressive
+        )
+    print(f"merged translation: {t.merge_files()}")
+    t.price_calculation()
+
+    if t.failed_files:
+        sys.exit(1)
+
+
+def merge(args):
+    """This function is to merge the translations in the result store into
+    after/merge_translation.txt.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the translator settings
+    """
+    t = make_translator(args)
+    print(f"merged translation: {t.merge_files()}")
+
+
+def cost(args):
+    """This function is to print the tokens and price of the runs so far, from
+    the usage ledger, or to estimate them for a PDF file before translating.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        output_dir, estimate, language, workers, rpm, tpm, all
+    """
+    if args.estimate is not None:
+        from estimator import estimate_run, print_estimate
+        from prompts import PROMPT_TEMPLATE
+        if args.all:
+            from extract_text_all import PDF_to_Text
+        else:
+            from extract_text import PDF_to_Text
+
+        t_extractor = PDF_to_Text(file_path = os.path.abspath(args.estimate), language = args.language)
+        t_extractor.read_pdf()
+        t_extractor.get_txt()
+        texts = [i.text for i in t_extractor.iter_paragraphs()]
+        print_estimate(estimate_run(
+            texts, args.language, PROMPT_TEMPLATE, max_workers = args.workers,
+            rpm = args.rpm, tpm = args.tpm
+            ))
+        return
+
+    from usage_ledger import UsageLedger, print_summary
+
+    output_dir = os.path.abspath(args.output_dir or os.getcwd())
+    path = os.path.join(output_dir, "after", "log", "usage_ledger.jsonl")
+    if not os.path.exists(path):
+        print(f"no usage ledger at {path}")
+        sys.exit(1)
+
+    ledger = UsageLedger(path)
+    ledger.save_totals()
+    print_summary(ledger.summary())
+
+
+def make_parser():
+    """This function is to build the parser of the subcommands.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        the parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = "pdf-translator", description = "translate a PDF file with ChatGPT"
+        )
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    def add_common(subparser):
+        subparser.add_argument('--output-dir', default = None,
+                               help = "the directory with 'before' and 'after', by default the working directory")
+        subparser.add_argument('--all', action = 'store_true',
+                               help = "the whole document (extract_text_all.py / translator_all.py)")
+
+    def add_translator(subparser):
+        add_common(subparser)
+        subparser.add_argument('--language', default = 'traditional chinese')
+        subparser.add_argument('--api-base', default = None,
+                               help = "the base URL of the API, by default OPENAI_API_BASE or the config file")
+        subparser.add_argument('--no-cache', action = 'store_true', help = "do not use the translation cache")
+
+    def add_limits(subparser):
+        subparser.add_argument('--workers', type = int, default = 8)
+        subparser.add_argument('--rpm', type = int, default = 3500)
+        subparser.add_argument('--tpm', type = int, default = 90000)
+
+    p = subparsers.add_parser('extract', help = "break a PDF file into paragraph txt files")
+    p.add_argument('pdf', help = "the PDF file")
+    add_common(p)
+    p.add_argument('--language', default = 'traditional chinese',
+                   help = "the language of the translation, which sets the paragraph size")
+    p.add_argument('--segmenter', default = 'rule', choices = ['rule', 'nltk'],
+                   help = "the sentence segmenter, by default the rule-based one")
+    p.add_argument('--boilerplate', default = 'drop', choices = ['drop', 'once', 'keep'],
+                   help = "the lines repeated on most pages (running headers, footers): drop them, "
+                          "translate them once or keep them, by default drop")
+    p.add_argument('--from', dest = 'start', type = page_or_phrase, default = None,
+                   help = "the first page (1 for the first page) or a phrase in the first paragraph to translate")
+    p.add_argument('--to', dest = 'end', type = page_or_phrase, default = None,
+                   help = "the last page or a phrase in the last paragraph to translate")
+    p.add_argument('--from-heading', dest = 'start_heading', default = None,
+                   help = "the section heading to start at, ex: Introduction")
+    p.add_argument('--to-heading', dest = 'end_heading', default = None,
+                   help = "the section heading to stop before, ex: References")
+    p.set_defaults(func = extract)
+
+    p = subparsers.add_parser('translate', help = "translate the paragraphs and merge them")
+    add_translator(p)
+    add_limits(p)
+    p.add_argument('--stream', action = 'store_true', help = "stream the replies")
+    p.add_argument('--progressive', action = 'store_true',
+                   help = "write merge_translation.txt while the paragraphs are translated")
+    p.add_argument('--memory', default = None, metavar = 'SQLITE',
+                   help = "reuse the translations of similar paragraphs stored in this translation memory")
+    p.set_defaults(func = translate)
+
+    p = subparsers.add_parser('merge', help = "merge the translations into merge_translation.txt")
+    add_translator(p)
+    p.set_defaults(func = merge)
+
+    p = subparsers.add_parser('cost', help = "tokens and price so far, or an estimate for a PDF file")
+    add_common(p)
+    add_limits(p)
+    p.add_argument('--estimate', default = None, metavar = 'PDF',
+                   help = "estimate the cost of a PDF file instead, without API calls")
+    p.add_argument('--language', default = 'traditional chinese')
+    p.set_defaults(func = cost)
+
+    return parser
+
+
+def main(argv = None):
+    """This function is to run a subcommand.
+
+    Parameters
+    ----------
+    argv : list, optional
+        the arguments, by default sys.argv[1:]
+    """
+    args = make_parser().parse_args(argv)
+    # api_key.py in the working directory is still found:
+    sys.path.insert(0, os.getcwd())
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
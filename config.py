@@ -0,0 +1,97 @@
+# Purpose:  This script is to find the API key and the settings of a run from
+#           the environment or a config file, instead of importing api_key.py
+
+import os
+import json
+
+# the environment variables read, in this order before the config file:
+API_KEY_ENV = "OPENAI_API_KEY"
+API_BASE_ENV = "OPENAI_API_BASE"
+CONFIG_ENV = "TRANSLATOR_CONFIG"
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".translator_config.json")
+
+class MissingAPIKeyError(Exception):
+    """This class is the error raised when an API call is needed but no API
+    key was found.
+    """
+
+    def __init__(self):
+        super().__init__(
+            f"no API key: set {API_KEY_ENV}, add \"api_key\" to {DEFAULT_CONFIG_PATH} "
+            f"(or the file in {CONFIG_ENV}), or create api_key.py"
+            )
+
+
+def load_config(path = None):
+    """This function is to read the JSON config file.
+
+    Parameters
+    ----------
+    path : str, optional
+        the config file, by default the file in TRANSLATOR_CONFIG or
+        ~/.translator_config.json
+
+    Returns
+    -------
+    dict
+        the settings, ex: {'api_key': ..., 'api_base': ...}, empty if there is no file
+    """
+    path = path or os.environ.get(CONFIG_ENV) or DEFAULT_CONFIG_PATH
+    if not os.path.exists(path):
+        return dict()
+    with open(path, 'r', encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def get_api_key(api_key = None, config_path = None):
+    """This function is to find the API key: the one given, then
+    OPENAI_API_KEY, then the config file, then api_key.py in the working
+    directory (the old way).
+
+    Parameters
+    ----------
+    api_key : str, optional
+        the API key, by default None
+    config_path : str, optional
+        the config file, by default see load_config
+
+    Returns
+    -------
+    str or None
+        the API key, None if there is none, so runs served from the
+        translation cache do not need one
+    """
+    if api_key:
+        return api_key
+    if os.environ.get(API_KEY_ENV):
+        return os.environ[API_KEY_ENV]
+
+    key = load_config(config_path).get('api_key')
+    if key:
+        return key
+
+    try:
+        import api_key as api_key_module # this is your API key
+        return api_key_module.api_key
+    except (ImportError, AttributeError):
+        return None
+
+
+def get_api_base(api_base = None, config_path = None):
+    """This function is to find the base URL of the API: the one given, then
+    OPENAI_API_BASE, then the config file.
+
+    Parameters
+    ----------
+    api_base : str, optional
+        the base URL, by default None
+    config_path : str, optional
+        the config file, by default see load_config
+
+    Returns
+    -------
+    str or None
+        the base URL, None for the OpenAI API
+    """
+    return api_base or os.environ.get(API_BASE_ENV) or load_config(config_path).get('api_base')
@@ -0,0 +1,195 @@
+# Purpose:  This script is to translate every PDF file under a directory with
+#           one shared, rate-limited pool of API calls
+
+import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from extract_text_all import PDF_to_Text
+from translator_all import Translator
+from rate_limiter import RateLimiter
+from translation_cache import TranslationCache, DEFAULT_CACHE_PATH
+from chat_client import ChatClient
+from config import get_api_key, get_api_base
+from metrics import METRICS, MetricsServer, JSONFlusher
+
+def find_pdfs(root):
+    """This function is to find every PDF file under a directory.
+
+    Parameters
+    ----------
+    root : str
+        the directory to search, including its sub-directories
+
+    Returns
+    -------
+    list
+        the paths of the PDF files, sorted
+    """
+    pdfs = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        for i in file_names:
+            if i.lower().endswith(".pdf"):
+                pdfs.append(os.path.join(dir_path, i))
+
+    return sorted(pdfs)
+
+
+def get_document_dir(output_dir, root, pdf_path):
+    """This function is to get the output directory of a document, named
+    after its path under root, ex: root/2023/paper.pdf -> output_dir/2023/paper/
+
+    Parameters
+    ----------
+    output_dir : str
+        the output directory of the corpus
+    root : str
+        the directory searched for PDF files
+    pdf_path : str
+        the PDF file
+
+    Returns
+    -------
+    str
+        the directory holding the 'before' and 'after' directories of the document
+    """
+    relative = os.path.relpath(os.path.abspath(pdf_path), os.path.abspath(root))
+    return os.path.join(output_dir, os.path.splitext(relative)[0])
+
+
+def translate_corpus(root, language, output_dir = None, max_workers = 16, rpm = 3500, tpm = 90000,
+                     cache_path = DEFAULT_CACHE_PATH, api_base = None):
+    """This function is to translate every PDF file under root. The paragraphs
+    of all documents go through one thread pool, one rate limiter and one HTTP
+    connection pool, so the pool stays busy even when the documents are small,
+    and the next document is extracted while the paragraphs of the previous
+    ones are translated.
+
+    Parameters
+    ----------
+    root : str
+        the directory with the PDF files
+    language : str
+        the language you want ChatGPT to translate into
+    output_dir : str, optional
+        the output directory, each document gets its own sub-directory with
+        'before' and 'after', by default root/translations
+    max_workers : int, optional
+        the number of API calls in flight, by default 16
+    rpm : int, optional
+        the requests-per-minute limit of your OpenAI account, by default 3500
+    tpm : int, optional
+        the tokens-per-minute limit of your OpenAI account, by default 90000
+    cache_path : str, optional
+        the SQLite translation cache, None turns it off, by default ~/.translator_cache.sqlite
+    api_base : str, optional
+        the base URL of the API, by default None (the OpenAI API)
+
+    Returns
+    -------
+    dict
+        the PDF path as the key and its Translator as the value
+    """
+    if output_dir is None:
+        output_dir = os.path.join(root, "translations")
+
+    pdfs = find_pdfs(root)
+    print(f"found {len(pdfs)} PDF file(s) under {root}")
+
+    # shared by every document:
+    limiter = RateLimiter(rpm = rpm, tpm = tpm)
+    cache = TranslationCache(cache_path) if cache_path is not None else None
+    client = ChatClient(get_api_key(), api_base = get_api_base(api_base), pool_size = max_workers)
+    # a few paragraphs queued behind each worker keep the pool busy without
+    # holding the whole corpus in the executor:
+    free_slots = threading.BoundedSemaphore(max_workers * 2)
+    translators = dict()
+    progress = tqdm(desc = "paragraphs", unit = "paragraph")
+
+    def on_done(future, t, fname):
+        free_slots.release()
+        progress.update(1)
+        try:
+            future.result()
+        except Exception as err:
+            t.log_failure(fname, err)
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        for pdf_path in pdfs:
+            try:
+                doc_dir = get_document_dir(output_dir, root, pdf_path)
+
+                # the pages are streamed, iter_paragraphs opens the file itself:
+                t_extractor = PDF_to_Text(file_path = pdf_path, output_dir = doc_dir, language = language)
+
+                t = Translator(
+                    language, api_base = api_base, cache_path = None, output_dir = doc_dir, client = client
+                    )
+                t.cache = cache
+                t.limiter = limiter
+                t.create_directory()
+                t.set_paragraphs(t_extractor.iter_paragraphs())
+                translators[pdf_path] = t
+
+                pending = t.get_pending_files()
+                progress.total = (progress.total or 0) + len(pending)
+                for fname in pending:
+                    free_slots.acquire()
+                    future = executor.submit(t.translate_file, fname)
+                    future.add_done_callback(lambda f, t = t, fname = fname: on_done(f, t, fname))
+
+            except Exception as err:
+                print(f"{pdf_path}: {err}")
+
+    progress.close()
+
+    # merge each document into its own after/merge_translation.txt and save
+    # its failures and usage totals in its after/log directory:
+    for pdf_path, t in translators.items():
+        t.merge_files()
+        if t.failed_files:
+            print(f"{pdf_path}:")
+        t.report_failures(run_totals = False)
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"translation cache: {stats['hits']} hits, {stats['misses']} misses")
+
+    # the metrics are shared by every document, written once for the run:
+    METRICS.write_json(os.path.join(output_dir, "metrics.json"))
+
+    return translators
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "translate every PDF file under a directory")
+    parser.add_argument('root', help = "the directory with the PDF files")
+    parser.add_argument('--language', default = 'traditional chinese')
+    parser.add_argument('--output-dir', default = None)
+    parser.add_argument('--workers', type = int, default = 16)
+    parser.add_argument('--rpm', type = int, default = 3500)
+    parser.add_argument('--tpm', type = int, default = 90000)
+    parser.add_argument('--metrics-port', type = int, default = None,
+                        help = "serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--metrics-json', default = None, help = "write the metrics to this JSON file")
+    parser.add_argument('--metrics-interval', type = float, default = 10, help = "seconds between JSON writes")
+    args = parser.parse_args()
+
+    exporters = []
+    if args.metrics_port is not None:
+        exporters.append(MetricsServer(port = args.metrics_port))
+    if args.metrics_json is not None:
+        exporters.append(JSONFlusher(args.metrics_json, interval = args.metrics_interval))
+    for exporter in exporters:
+        print(f"metrics: {exporter.start()}")
+
+    try:
+        translate_corpus(
+            args.root, args.language, output_dir = args.output_dir, max_workers = args.workers,
+            rpm = args.rpm, tpm = args.tpm
+            )
+    finally:
+        for exporter in exporters:
+            exporter.stop()
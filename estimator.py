@@ -0,0 +1,128 @@
+# Purpose:  This script is to estimate the tokens, price and wall-clock time of
+#           a translation run before any API call is made
+
+import os
+import argparse
+from chunker import get_encoder, count_tokens, get_expansion
+from usage_ledger import get_price
+from prompts import PROMPT_TEMPLATE
+
+def estimate_run(texts, language, prompt_template, model = "gpt-3.5-turbo", max_tokens = 1024,
+                 max_workers = 8, rpm = 3500, tpm = 90000, latency = 0.5, output_tokens_per_second = 50,
+                 expansion_ratio = None):
+    """This function is to estimate a translation run offline, with the local
+    tokenizer and the expected expansion of the target language.
+
+    Parameters
+    ----------
+    texts : list
+        the paragraphs for translation, one API call each
+    language : str
+        the language you want ChatGPT to translate into
+    prompt_template : str
+        the prompt with {language} and {text} to fill in
+    model : str, optional
+        the ChatCompletion model, by default "gpt-3.5-turbo"
+    max_tokens : int, optional
+        the max_tokens of a reply, by default 1024
+    max_workers : int, optional
+        the number of API calls in flight, by default 8
+    rpm : int, optional
+        the requests-per-minute limit, by default 3500
+    tpm : int, optional
+        the tokens-per-minute limit, by default 90000
+    latency : float, optional
+        the seconds before the first token of a reply, by default 0.5
+    output_tokens_per_second : float, optional
+        the generation speed of the model, by default 50
+    expansion_ratio : float, optional
+        the translated tokens per source token, by default from LANGUAGE_EXPANSION
+
+    Returns
+    -------
+    dict
+        requests, input/output tokens, price (US dollars) and seconds
+    """
+    if expansion_ratio is None:
+        expansion_ratio = get_expansion(language)
+    encoder = get_encoder(model)
+
+    input_tokens = 0
+    output_tokens = 0
+    request_seconds = 0.0
+    for text in texts:
+        prompt = prompt_template.format(language = language, text = text)
+        # +7 for the chat message formatting:
+        input_tokens += count_tokens(prompt, encoder) + 7
+        reply_tokens = min(int(count_tokens(text, encoder) * expansion_ratio), max_tokens)
+        output_tokens += reply_tokens
+        request_seconds += latency + reply_tokens / output_tokens_per_second
+
+    n_requests = len(texts)
+    price = get_price(model)
+    if price is None:
+        cost = None
+    else:
+        cost = (input_tokens / 1000) * price['input'] + (output_tokens / 1000) * price['output']
+
+    # the slowest of: the workers, the requests-per-minute limit and the
+    # tokens-per-minute limit (which also counts max_tokens of every reply):
+    seconds = max(
+        request_seconds / max_workers,
+        n_requests / rpm * 60,
+        (input_tokens + n_requests * max_tokens) / tpm * 60
+        )
+
+    return {
+        'requests': n_requests,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'expansion_ratio': expansion_ratio,
+        'price': cost,
+        'seconds': seconds,
+        'tokenizer': "tiktoken" if encoder is not None else "estimated"
+        }
+
+
+def print_estimate(summary):
+    """This function is to print the result of estimate_run.
+
+    Parameters
+    ----------
+    summary : dict
+        the result of estimate_run
+    """
+    price = f"${summary['price']:.4f} (US)" if summary['price'] is not None else "unknown"
+    minutes, seconds = divmod(int(summary['seconds']), 60)
+    print("\nHere is the estimate for this translation (no API call was made):")
+    print(f"requests: {summary['requests']}")
+    print(f"input tokens: {summary['input_tokens']}, expected output tokens: {summary['output_tokens']} "
+          f"(x{summary['expansion_ratio']}, {summary['tokenizer']} tokens)")
+    print(f"price: {price}")
+    print(f"wall-clock time: {minutes} min {seconds} s")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "offline cost and time estimate of a translation")
+    parser.add_argument('pdf', help = "the PDF file")
+    parser.add_argument('--language', default = 'traditional chinese')
+    parser.add_argument('--workers', type = int, default = 8)
+    parser.add_argument('--rpm', type = int, default = 3500)
+    parser.add_argument('--tpm', type = int, default = 90000)
+    parser.add_argument('--all', action = 'store_true', help = "use extract_text_all.py")
+    args = parser.parse_args()
+
+    if args.all:
+        from extract_text_all import PDF_to_Text
+    else:
+        from extract_text import PDF_to_Text
+
+    t_extractor = PDF_to_Text(file_path = os.path.abspath(args.pdf), language = args.language)
+    t_extractor.read_pdf()
+    t_extractor.get_txt()
+    texts = [i.text for i in t_extractor.iter_paragraphs()]
+
+    print_estimate(estimate_run(
+        texts, args.language, PROMPT_TEMPLATE, max_workers = args.workers, rpm = args.rpm, tpm = args.tpm
+        ))
@@ -1,22 +1,88 @@
 # Purpose:  This script is to extract text from a PDF file
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 import platform
-import numpy as np
 import pypdfium2 as pdfium
-from nltk.tokenize import sent_tokenize
+from chunker import TokenChunker
+from segmenter import get_segmenter, DEFAULT_ABBREVIATIONS
+from boilerplate import BoilerplateDetector
+from page_stream import iter_pdf_pages
+from layout import get_layout
+from page_index import PageIndex, locate_phrase, locate_heading
+from records import Paragraph
+from metrics import timed
+
+def extract_pages(file, start, stop, boxes = None):
+    """This function is to extract the text of a range of pages in a worker
+    process. Each worker opens its own PdfDocument, because pdfium handles
+    cannot be shared between threads or processes.
+
+    Parameters
+    ----------
+    file : str
+        the path of the PDF file
+    start : int
+        the first page index
+    stop : int
+        the page index after the last page
+    boxes : dict, optional
+        the content boxes already known, page index as the key, by default None
+
+    Returns
+    -------
+    dictionary, dictionary
+        A dictionary with page number as the key and the text content as 
+        the value, and the content box of each page of the range.
+    """
+    layout = get_layout(file)
+    layout.boxes.update(boxes or {})
+    
+    # the text inside the content box of each page, the handles closed page by page:
+    articles = dict(iter_pdf_pages(file, start, stop, window = None, get_text = layout.get_text))
+    
+    return articles, {i: layout.boxes[i] for i in range(start, stop)}
 
 class PDF_to_Text:
     """This class is to extract text from a PDF file.
     """
     
-    def __init__(self):
+    def __init__(self, max_input_tokens = None, expansion_ratio = None, file_path = None,
+                 output_dir = None, segmenter = 'rule', abbreviations = DEFAULT_ABBREVIATIONS,
+                 boilerplate = 'drop', language = 'traditional chinese'):
         """Initiate the class.
+
+        Parameters
+        ----------
+        max_input_tokens : int, optional
+            the token budget of a paragraph, by default what leaves room for
+            the translated reply within max_tokens=1024
+        expansion_ratio : float, optional
+            the expected translated tokens per source token, by default the one
+            of language (LANGUAGE_EXPANSION in chunker.py)
+        file_path : str, optional
+            the PDF file, by default the first PDF in the working directory
+        output_dir : str, optional
+            the directory for the 'before' directory, by default the working
+            directory
+        segmenter : str or object, optional
+            the sentence segmenter, 'rule' (fast, see segmenter.py) or 'nltk',
+            by default 'rule'
+        abbreviations : iterable, optional
+            the abbreviations a period does not end a sentence after, by
+            default DEFAULT_ABBREVIATIONS (Fig., et al., e.g., Eq., i.e., ...)
+        boilerplate : str, optional
+            what to do with the lines repeated on most pages (running headers,
+            footers, page numbers, see boilerplate.py): 'drop' them, translate
+            them 'once', or None to keep them, by default 'drop'
+        language : str, optional
+            the language of the translation, which sets the token budget of a
+            paragraph, by default 'traditional chinese'
         """
         # get OS
         os_type = platform.system()
         # get current working directory
-        parent_dir = os.path.abspath(os.getcwd())
+        parent_dir = os.path.abspath(output_dir if output_dir is not None else os.getcwd())
 
         if os_type == 'Windows':
             parent_dir = parent_dir + "\\"
@@ -24,10 +90,24 @@ class PDF_to_Text:
         else:
             parent_dir = parent_dir + "/" 
 
-        file_name = [i for i in os.listdir(parent_dir) if i.endswith(".pdf")][0]
+        if file_path is not None:
+            pdf_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), "")
+            file_name = os.path.basename(file_path)
+        else:
+            pdf_dir = parent_dir
+            file_name = [i for i in os.listdir(parent_dir) if i.endswith(".pdf")][0]
         
         self.parent_dir = parent_dir
+        self.pdf_dir = pdf_dir
         self.file_name = file_name
+        self.chunker = TokenChunker(max_input_tokens, expansion_ratio = expansion_ratio, language = language)
+        self.segmenter = get_segmenter(segmenter, abbreviations)
+        self.boilerplate = None
+        if boilerplate is not None:
+            self.boilerplate = BoilerplateDetector(boilerplate, encoder = self.chunker.encoder)
+        self.index = None
+        self.start_page = None
+        self.end_page = None
     
     def create_directory(self):
         """This function is to create a directory in the parent_dir.
@@ -50,12 +130,13 @@ class PDF_to_Text:
             # print(self.path)
             
             # create a directory called 'before' under the parent_dir:
-            os.mkdir(self.path)
+            os.makedirs(self.path, exist_ok = True)
         
         except FileExistsError:
             pass
         
      
+    @timed('read_pdf')
     def read_pdf(self):
         """This funciton is to read a PDF file.
 
@@ -65,7 +146,7 @@ class PDF_to_Text:
             the PDF document read from pdfium
         """
         try:
-            file = self.parent_dir + self.file_name
+            file = self.pdf_dir + self.file_name
             pdf = pdfium.PdfDocument(file)
             
             self.pdf = pdf
@@ -75,6 +156,15 @@ class PDF_to_Text:
         except Exception as err:
             print(err)
     
+    def close(self):
+        """This function is to close the PDF file opened by read_pdf, which
+        frees what pdfium holds for it.
+        """
+        if getattr(self, 'pdf', None) is not None:
+            self.pdf.close()
+            self.pdf = None
+    
+    @timed('get_txt')
     def get_txt(self):
         """This function is to extract the text from a PDF file.
 
@@ -88,10 +178,8 @@ class PDF_to_Text:
             n_pages = len(self.pdf)  # get the number of pages in the document
             page_indices = [i for i in range(n_pages)]  # all pages
             
-            # use the first page size as a standard size
-            page_size = pdfium.PdfPage(self.pdf[0], self.pdf).get_size()
-            width = page_size[0]
-            height = page_size[1]
+            # the content box of each page, from the boxes of its text:
+            self.layout = get_layout(self.pdf_dir + self.file_name)
             
             # extract the text page by page
             articles = dict()
@@ -99,59 +187,195 @@ class PDF_to_Text:
                 page = self.pdf[i]
                 # Load a text page helper
                 textpage = page.get_textpage()
-                text_part = textpage.get_text_bounded(
-                    left = 30, right = width-30, top = height-40, bottom = 30
-                    )
+                text_part = self.layout.get_text(i, page, textpage)
                 key_name = f"page_{i}"
                 articles[key_name] = text_part
+                # free the pdfium handles of the page now, not at exit:
+                textpage.close()
+                page.close()
             
-            self.articles = articles
+            self.articles = self.remove_boilerplate(articles)
+            self.index = self.build_index()
             
             return self.articles
         
         except Exception as err:
             print(err)
     
-    def get_page_range(self):
-        """This function is to get the page range for translation.
+    @timed('get_txt')
+    def get_txt_parallel(self, n_workers = None, chunks_per_worker = 4):
+        """This function is to extract the text from a PDF file with several
+        worker processes, each taking a range of pages. The result is the same
+        as get_txt.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            the number of worker processes, by default the number of CPU cores
+        chunks_per_worker : int, optional
+            the page ranges per worker, more ranges balance the load better
+            when some pages are slower, by default 4
 
         Returns
         -------
-        str
-            the start & end pages and being & end translation words
+        dictionary
+            A dictionary with page number as the key and the text content as 
+            the value.
         """
         try:
-            begin_words = input(
-                "Please type in 3 words in the first paragraph \
-                you'd like to start translating (type 'q' to quit): "
-                )
-            end_words = input(
-                "Please type in 3 words in the paragraph you'd \
-                    like to end translating (type 'q' to quit): "
-                    )
+            file = self.pdf_dir + self.file_name
+            n_pages = len(self.pdf)  # get the number of pages in the document
+            n_workers = n_workers or os.cpu_count() or 1
             
-            print(f"the begin words you type in: {begin_words}")
-            print(f"the end words you type in: {end_words}")
-
-            if (begin_words != 'q') and (end_words != 'q'):
-                for k, v in self.articles.items():
-                    if begin_words in v:
-                        start_page = k
-                    if end_words in v:
-                        end_page = k
-                
-                self.start_page = start_page
-                self.end_page = end_page
-                self.begin_words = begin_words
-                self.end_words = end_words
-                
-                return self.start_page, self.end_page, self.begin_words, self.end_words
-            else:
-                pass
+            # the workers measure the pages not measured yet:
+            self.layout = get_layout(file)
+            
+            # split the pages into ranges:
+            step = max(1, -(-n_pages // (n_workers * chunks_per_worker)))
+            starts = list(range(0, n_pages, step))
+            stops = [min(i + step, n_pages) for i in starts]
+            
+            # map keeps the order of the ranges, so the pages stay in order:
+            articles = dict()
+            known = [
+                {i: self.layout.boxes[i] for i in range(start, stop) if i in self.layout.boxes}
+                for start, stop in zip(starts, stops)
+                ]
+            with ProcessPoolExecutor(max_workers = n_workers) as executor:
+                for part, boxes in executor.map(extract_pages, [file] * len(starts), starts, stops, known):
+                    articles.update(part)
+                    self.layout.boxes.update(boxes)
+            
+            self.articles = self.remove_boilerplate(articles)
+            self.index = self.build_index()
+            
+            return self.articles
         
         except Exception as err:
             print(err)
     
+    @timed('index')
+    def build_index(self):
+        """This function is to build the inverted index of the pages (see
+        page_index.py), once per extraction, so a page range given by phrases
+        or headings is found without scanning every page.
+
+        Returns
+        -------
+        PageIndex
+            the index of the words and headings of the pages
+        """
+        self.index = PageIndex.from_articles(self.articles)
+        
+        return self.index
+    
+    def set_page_range(self, start = None, end = None, start_heading = None, end_heading = None):
+        """This function is to set the page range for translation. Each end is
+        a page number, a phrase in the first/last paragraph or a section
+        heading; the first match after the start is used. Call it after get_txt.
+
+        Parameters
+        ----------
+        start : int or str, optional
+            the first page (1 for the first page of the PDF), or a phrase in
+            the paragraph to start at, by default the first page
+        end : int or str, optional
+            the last page, or a phrase in the paragraph to end at, by default
+            the last page
+        start_heading : str, optional
+            the section heading to start at (ex: 'Introduction'), instead of start
+        end_heading : str, optional
+            the section heading to stop before (ex: 'References'), instead of end
+
+        Returns
+        -------
+        str
+            the start & end pages ('page_N') and the start & end positions in
+            their text
+
+        Raises
+        ------
+        ValueError
+            if a page number is out of the document or a phrase or heading is
+            not found after the start
+        """
+        if self.index is None:
+            self.build_index()
+        n_pages = len(self.articles)
+        
+        def check_page(number):
+            if not 1 <= number <= n_pages:
+                raise ValueError(f"page {number} is not in {self.file_name} ({n_pages} pages)")
+            return number - 1
+        
+        def find(value, heading, first_page = 0, pos = 0):
+            # the first page with a match after the start:
+            if heading:
+                pages, locate = self.index.find_heading(value, first_page), locate_heading
+            else:
+                pages, locate = self.index.find(value, first_page), locate_phrase
+            for page in pages:
+                span = locate(self.articles[f"page_{page}"], value, pos if page == first_page else 0)
+                if span is not None:
+                    return page, span
+            raise ValueError(f"{'heading' if heading else 'phrase'} '{value}' is not found in {self.file_name}")
+        
+        if start_heading is not None:
+            start_idx, (start_offset, _) = find(start_heading, True)
+        elif isinstance(start, str):
+            start_idx, (start_offset, _) = find(start, False)
+        else:
+            start_idx, start_offset = check_page(start) if start is not None else 0, 0
+        
+        if end_heading is not None:
+            end_idx, (end_offset, _) = find(end_heading, True, start_idx, start_offset + 1)
+        elif isinstance(end, str):
+            end_idx, (_, end_offset) = find(end, False, start_idx, start_offset)
+        else:
+            end_idx = check_page(end) if end is not None else n_pages - 1
+            end_offset = len(self.articles[f"page_{end_idx}"])
+            if end_idx < start_idx:
+                raise ValueError(f"the last page {end} is before the first page")
+        
+        # a heading at the top of the last page (ex: References) leaves nothing
+        # of it, so the range ends at the last page before with text:
+        while (end_idx > start_idx) and (not self.articles[f"page_{end_idx}"][:end_offset].strip()):
+            end_idx -= 1
+            end_offset = len(self.articles[f"page_{end_idx}"])
+        
+        self.start_page, self.end_page = f"page_{start_idx}", f"page_{end_idx}"
+        self.start_offset, self.end_offset = start_offset, end_offset
+        self.begin_words = start_heading if start_heading is not None else start
+        self.end_words = end_heading if end_heading is not None else end
+        print(f"translation range: {self.start_page} to {self.end_page}")
+        
+        return self.start_page, self.end_page, self.start_offset, self.end_offset
+    
+    @timed('boilerplate')
+    def remove_boilerplate(self, articles):
+        """This function is to find the lines repeated across the pages and
+        take them out before the pages are split into paragraphs, and print
+        the tokens saved.
+
+        Parameters
+        ----------
+        articles : dictionary
+            A dictionary with page number as the key and the text content as 
+            the value.
+
+        Returns
+        -------
+        dictionary
+            the same dictionary without the repeated lines
+        """
+        if self.boilerplate is None:
+            return articles
+        
+        articles = self.boilerplate.clean_pages(articles)
+        self.boilerplate.report()
+        
+        return articles
+    
     def save_text(self, page_num, idx, doc):
         """This function is to save each paragraph as a txt file.
 
@@ -179,6 +403,46 @@ class PDF_to_Text:
             print(err)
         
     
+    @timed('split_paragraphs')
+    def split_paragraphs(self, text, page_num):
+        """This function is to break the text contents of a page into paragraphs.
+
+        Parameters
+        ----------
+        text : str
+            the text contents of a page
+        page_num : str
+            the page number in a dictionary
+
+        Returns
+        -------
+        list
+            the paragraphs (str) of the page
+        """
+        # cut the first and last pages at the range found by set_page_range,
+        # the end first so the start position stays the same:
+        if page_num == self.end_page:
+            text = text[:self.end_offset]
+        if page_num == self.start_page:
+            text = text[self.start_offset:]
+        
+        # check if '\x02' is in the text, if it is, using '-' to join the words
+        if ("\x02" in text):
+            text = text.replace("\x02", "-")
+        
+        splitted_docs = text.split("\r\n")
+        joined_doc = " ".join(splitted_docs)
+        
+        # tokenize a document into sentences level, a period after Fig., et al.
+        # or e.g. does not end a sentence:
+        t_sent = self.segmenter.segment(joined_doc)
+        
+        # pack whole sentences into paragraphs up to the token budget:
+        chunks = self.chunker.chunk(t_sent)
+
+        return chunks
+    
+    @timed('get_paragraph')
     def get_paragraph(self, text, page_num):
         """This function is to break the text contents into paragraph levels.
 
@@ -192,60 +456,17 @@ class PDF_to_Text:
         Returns
         -------
         str
-            a paragraph
+            a paragraph, None if the page has no text left (ex: a figure page
+            with only a running header and footer, taken out as boilerplate)
         """
         try:
-            # remove "." in Fig. or fig. in the sentences cause it will affect splitting paragraphs
-            # and this will affect ChatGPT translation performance
-            if ("Fig." in text):
-                text = text.replace("Fig.", 'Fig')
-            if ("fig." in text):
-                text = text.replace("fig.", "fig")
-            # check if '\x02' is in the text, if it is, using '-' to join the words
-            if ("\x02" in text):
-                text = text.replace("\x02", "-")
-            
-            splitted_docs = text.split("\r\n")
-            
-            # check the text content from which page:
-            if page_num == self.start_page:
-                for i, j in enumerate(splitted_docs):
-                    if self.begin_words in j:
-                        start_trans_idx = i
-                    # print(start_trans_idx)
-                joined_doc = " ".join(splitted_docs[start_trans_idx:])
-                
-            elif page_num == self.end_page:
-                for i, j in enumerate(splitted_docs):
-                    if self.end_words in j:
-                        end_trans_idx = i + 1
-                    # print(start_trans_idx)
-                joined_doc = " ".join(splitted_docs[:end_trans_idx])   
-                
-            else:
-                joined_doc = " ".join(splitted_docs)
-            
-            # Using NLTK to tokenize a document into sentences level:
-            t_sent = sent_tokenize(joined_doc)
-            
-        
-            # get every 5 sentences as a paragraph:
-            end = end = int((np.ceil(len(t_sent) / 5)) * 5)
-            multiples_5 = np.arange(0, end , 5)
+            chunks = self.split_paragraphs(text, page_num)
+            if not chunks:
+                return None, self.path
 
             # get the paragraph and save it in a text file:
-            for idx, i in enumerate(multiples_5):
-                first_idx = i
-                last_idx = i + 5
-                if first_idx != multiples_5[-1]:
-                    doc = " ".join(t_sent[first_idx:last_idx])
-                    # save text:
-                    self.path = self.save_text(page_num, idx, doc)
-
-                else:
-                    doc = " ".join(t_sent[i:])
-                    # save text:
-                    self.path = self.save_text(page_num, idx, doc) 
+            for idx, doc in enumerate(chunks):
+                self.path = self.save_text(page_num, idx, doc)
             
             return doc, self.path
         
@@ -253,12 +474,15 @@ class PDF_to_Text:
             print(err)
     
 
-    def iterate(self):
+    def iterate(self, start = None, end = None, start_heading = None, end_heading = None):
         """This function is to iterate each page content and save each paragraph
         as a text file.
 
         Parameters
         ----------
+        start, end, start_heading, end_heading : optional
+            the page range for translation (see set_page_range), by default
+            the range already set, or the whole document
 
         Returns
         -------
@@ -269,32 +493,81 @@ class PDF_to_Text:
         try:
             # get the translation page range:
             try:
-                self.start_page, self.end_page, self.begin_words, self.end_words = self.get_page_range()
+                if (self.start_page is None) or any(
+                    i is not None for i in [start, end, start_heading, end_heading]
+                    ):
+                    self.set_page_range(start, end, start_heading, end_heading)
                 
-            except Exception as err:
+            except ValueError as err:
                 print(err)
-                print("Please check your input words")
+                print("Please check the page range")
                 print("Stopping program")
                 pass
             
             else:
-                # get page index:
-                start_page_idx = int(self.start_page.split("_")[1])
-                end_page_idx = int(self.end_page.split("_")[1]) + 1
-
-                # re-construct the articles dictionary (to get only the pages we want for translation):
-                new_articles = dict()
-                for i in range(start_page_idx, end_page_idx):
-                    key_name = f"page_{i}"
-                    new_articles[key_name] = self.articles[key_name]
+                new_articles = self.get_range_articles()
 
-                # get paragraphs in each of pages:
+                # get paragraphs in each of pages, a page left empty has none:
+                doc = None
                 for k, v in new_articles.items():
-                    doc, self.path  = self.get_paragraph(v, k)
+                    page_doc, self.path  = self.get_paragraph(v, k)
+                    if page_doc is not None:
+                        doc = page_doc
                     
                 print("finishing extracting")
+                self.chunker.report()
                 return doc
         
         except Exception as err:
             print(err)
 
+    def get_range_articles(self):
+        """This function is to get only the pages we want for translation.
+
+        Returns
+        -------
+        dictionary
+            A dictionary with page number as the key and the text content as 
+            the value, from start_page to end_page.
+        """
+        # get page index:
+        start_page_idx = int(self.start_page.split("_")[1])
+        end_page_idx = int(self.end_page.split("_")[1]) + 1
+
+        # re-construct the articles dictionary (to get only the pages we want for translation):
+        new_articles = dict()
+        for i in range(start_page_idx, end_page_idx):
+            key_name = f"page_{i}"
+            new_articles[key_name] = self.articles[key_name]
+        
+        return new_articles
+
+    def iter_paragraphs(self, save = False):
+        """This function is to yield the paragraphs of the translation range one
+        by one, in page/paragraph order, so they can go straight to the
+        Translator without the before directory. Call it after read_pdf and
+        get_txt, and set_page_range if only a part is translated.
+
+        Parameters
+        ----------
+        save : bool, optional
+            if it is True, each paragraph is also saved as a txt file in the
+            'before' directory (for debugging), by default False
+
+        Yields
+        ------
+        Paragraph
+            the document, page, index and text of a paragraph
+        """
+        if self.start_page is None:
+            self.set_page_range()
+        if save:
+            self.create_directory()
+
+        for page_num, text in self.get_range_articles().items():
+            for idx, doc in enumerate(self.split_paragraphs(text, page_num)):
+                if save:
+                    self.save_text(page_num, idx, doc)
+                yield Paragraph(self.file_name, int(page_num.split("_")[1]), idx, doc)
+
+        self.chunker.report()
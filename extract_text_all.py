@@ -1,26 +1,94 @@
 # Purpose:  This script is to whole extract text from a PDF file
 
 import os
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pypdfium2 as pdfium
-from nltk.tokenize import sent_tokenize
+from chunker import TokenChunker
+from segmenter import get_segmenter, DEFAULT_ABBREVIATIONS
+from boilerplate import BoilerplateDetector
+from page_stream import iter_pdf_pages, DEFAULT_WINDOW
+from records import Paragraph
+from metrics import timed
+
+def extract_pages(file, start, stop):
+    """This function is to extract the text of a range of pages in a worker
+    process. Each worker opens its own PdfDocument, because pdfium handles
+    cannot be shared between threads or processes.
+
+    Parameters
+    ----------
+    file : str
+        the path of the PDF file
+    start : int
+        the first page index
+    stop : int
+        the page index after the last page
+
+    Returns
+    -------
+    dictionary
+        A dictionary with page number as the key and the text content as 
+        the value.
+    """
+    # the handles are closed page by page:
+    return dict(iter_pdf_pages(file, start, stop, window = None))
 
 class PDF_to_Text:
     """This class is to extract text from a PDF file.
     """
     
-    def __init__(self):
+    def __init__(self, max_input_tokens = None, expansion_ratio = None, file_path = None,
+                 output_dir = None, segmenter = 'rule', abbreviations = DEFAULT_ABBREVIATIONS,
+                 boilerplate = 'drop', language = 'traditional chinese'):
         """Initiate the class.
+
+        Parameters
+        ----------
+        max_input_tokens : int, optional
+            the token budget of a paragraph, by default what leaves room for
+            the translated reply within max_tokens=1024
+        expansion_ratio : float, optional
+            the expected translated tokens per source token, by default the one
+            of language (LANGUAGE_EXPANSION in chunker.py)
+        file_path : str, optional
+            the PDF file, by default the first PDF in the working directory
+        output_dir : str, optional
+            the directory for the 'before' directory, by default the working
+            directory
+        segmenter : str or object, optional
+            the sentence segmenter, 'rule' (fast, see segmenter.py) or 'nltk',
+            by default 'rule'
+        abbreviations : iterable, optional
+            the abbreviations a period does not end a sentence after, by
+            default DEFAULT_ABBREVIATIONS (Fig., et al., e.g., Eq., i.e., ...)
+        boilerplate : str, optional
+            what to do with the lines repeated on most pages (running headers,
+            footers, page numbers, see boilerplate.py): 'drop' them, translate
+            them 'once', or None to keep them, by default 'drop'
+        language : str, optional
+            the language of the translation, which sets the token budget of a
+            paragraph, by default 'traditional chinese'
         """
         # get current working directory
-        parent_dir = os.path.abspath(os.getcwd())
+        parent_dir = os.path.abspath(output_dir if output_dir is not None else os.getcwd())
 
         parent_dir += "/" 
 
-        file_name = [i for i in os.listdir(parent_dir) if i.endswith(".pdf")][0]
+        if file_path is not None:
+            pdf_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), "")
+            file_name = os.path.basename(file_path)
+        else:
+            pdf_dir = parent_dir
+            file_name = [i for i in os.listdir(parent_dir) if i.endswith(".pdf")][0]
         
         self.parent_dir = parent_dir
+        self.pdf_dir = pdf_dir
         self.file_name = file_name
+        self.chunker = TokenChunker(max_input_tokens, expansion_ratio = expansion_ratio, language = language)
+        self.segmenter = get_segmenter(segmenter, abbreviations)
+        self.boilerplate = None
+        if boilerplate is not None:
+            self.boilerplate = BoilerplateDetector(boilerplate, encoder = self.chunker.encoder)
     
     def create_directory(self):
         """This function is to create a directory in the parent_dir.
@@ -39,12 +107,13 @@ class PDF_to_Text:
             # print(self.path)
             
             # create a directory called 'before' under the parent_dir:
-            os.mkdir(self.path)
+            os.makedirs(self.path, exist_ok = True)
         
         except FileExistsError:
             pass
         
      
+    @timed('read_pdf')
     def read_pdf(self):
         """This funciton is to read a PDF file.
 
@@ -54,7 +123,7 @@ class PDF_to_Text:
             the PDF document read from pdfium
         """
         try:
-            file = self.parent_dir + self.file_name
+            file = self.pdf_dir + self.file_name
             pdf = pdfium.PdfDocument(file)
             
             self.pdf = pdf
@@ -64,6 +133,15 @@ class PDF_to_Text:
         except Exception as err:
             print(err)
     
+    def close(self):
+        """This function is to close the PDF file opened by read_pdf, which
+        frees what pdfium holds for it.
+        """
+        if getattr(self, 'pdf', None) is not None:
+            self.pdf.close()
+            self.pdf = None
+    
+    @timed('get_txt')
     def get_txt(self):
         """This function is to extract the text from a PDF file.
 
@@ -77,11 +155,6 @@ class PDF_to_Text:
             n_pages = len(self.pdf)  # get the number of pages in the document
             page_indices = [i for i in range(n_pages)]  # all pages
             
-            # use the first page size as a standard size
-            page_size = pdfium.PdfPage(self.pdf[0], self.pdf).get_size()
-            width = page_size[0]
-            height = page_size[1]
-            
             # extract the text page by page
             articles = dict()
             for i in page_indices:
@@ -92,14 +165,85 @@ class PDF_to_Text:
                 text_all = textpage.get_text_range()
                 key_name = f"page_{i}"
                 articles[key_name] = text_all
+                # free the pdfium handles of the page now, not at exit:
+                textpage.close()
+                page.close()
+            
+            self.articles = self.remove_boilerplate(articles)
+            
+            return self.articles
+        
+        except Exception as err:
+            print(err)
+    
+    @timed('get_txt')
+    def get_txt_parallel(self, n_workers = None, chunks_per_worker = 4):
+        """This function is to extract the text from a PDF file with several
+        worker processes, each taking a range of pages. The result is the same
+        as get_txt.
+
+        Parameters
+        ----------
+        n_workers : int, optional
+            the number of worker processes, by default the number of CPU cores
+        chunks_per_worker : int, optional
+            the page ranges per worker, more ranges balance the load better
+            when some pages are slower, by default 4
+
+        Returns
+        -------
+        dictionary
+            A dictionary with page number as the key and the text content as 
+            the value.
+        """
+        try:
+            file = self.pdf_dir + self.file_name
+            n_pages = len(self.pdf)  # get the number of pages in the document
+            n_workers = n_workers or os.cpu_count() or 1
+            
+            # split the pages into ranges:
+            step = max(1, -(-n_pages // (n_workers * chunks_per_worker)))
+            starts = list(range(0, n_pages, step))
+            stops = [min(i + step, n_pages) for i in starts]
             
-            self.articles = articles
+            # map keeps the order of the ranges, so the pages stay in order:
+            articles = dict()
+            with ProcessPoolExecutor(max_workers = n_workers) as executor:
+                for part in executor.map(extract_pages, [file] * len(starts), starts, stops):
+                    articles.update(part)
+            
+            self.articles = self.remove_boilerplate(articles)
             
             return self.articles
         
         except Exception as err:
             print(err)
     
+    @timed('boilerplate')
+    def remove_boilerplate(self, articles):
+        """This function is to find the lines repeated across the pages and
+        take them out before the pages are split into paragraphs, and print
+        the tokens saved.
+
+        Parameters
+        ----------
+        articles : dictionary
+            A dictionary with page number as the key and the text content as 
+            the value.
+
+        Returns
+        -------
+        dictionary
+            the same dictionary without the repeated lines
+        """
+        if self.boilerplate is None:
+            return articles
+        
+        articles = self.boilerplate.clean_pages(articles)
+        self.boilerplate.report()
+        
+        return articles
+    
     def save_text(self, page_num, idx, doc):
         """This function is to save each paragraph as a txt file.
 
@@ -127,6 +271,77 @@ class PDF_to_Text:
             print(err)
         
     
+    @timed('split_paragraphs')
+    def split_paragraphs(self, text, page_num):
+        """This function is to break the text contents of a page into paragraphs.
+
+        Parameters
+        ----------
+        text : str
+            the text contents of a page
+        page_num : str
+            the page number in a dictionary
+
+        Returns
+        -------
+        list
+            the paragraphs (str) of the page
+        """
+        # check if '\x02' is in the text, if it is, using '-' to join the words
+        if ("\x02" in text):
+            text = text.replace("\x02", "-")
+        # check if '\x00' is in the text, if it is, using " " to replace the words
+        if ("\x00" in text):
+            text = text.replace("\x00", " ")   
+        splitted_docs = text.split("\r\n")
+        
+        # replace "\r\n" with blank:
+        splitted_docs = text.split("\r\n")
+        joined_doc = " ".join(splitted_docs)
+        
+        # tokenize a document into sentences level, a period after Fig., et al.
+        # or e.g. does not end a sentence:
+        t_sent = self.segmenter.segment(joined_doc)
+        
+        # pack whole sentences into paragraphs up to the token budget:
+        chunks = self.chunker.chunk(t_sent)
+
+        return chunks
+    
+    def iter_pages(self, window = DEFAULT_WINDOW):
+        """This function is to yield the text of each page, extracting a page
+        only when it is needed, so the paragraphs of the first pages can be
+        translated while the later pages are still being extracted. Only one
+        page is held at a time and its pdfium handles are closed before it is
+        yielded (see page_stream.py), so memory stays flat on huge files.
+        With boilerplate set, the pages are read twice: once to find the
+        lines repeated at their top and bottom, once to yield them without.
+
+        Parameters
+        ----------
+        window : int, optional
+            the pages read before the PDF file is opened again, which frees
+            what pdfium cached for the pages before, by default 256
+
+        Yields
+        ------
+        str, str
+            the page number ('page_N') and the text content of the page
+        """
+        # get_txt was called, the pages are already extracted:
+        if getattr(self, 'articles', None) is not None:
+            yield from self.articles.items()
+            return
+
+        def open_pages():
+            return iter_pdf_pages(self.pdf_dir + self.file_name, window = window)
+
+        if self.boilerplate is None:
+            yield from open_pages()
+        else:
+            yield from self.boilerplate.clean_stream(open_pages)
+    
+    @timed('get_paragraph')
     def get_paragraph(self, text, page_num):
         """This function is to break the text contents into paragraph levels.
 
@@ -140,48 +355,17 @@ class PDF_to_Text:
         Returns
         -------
         str
-            a paragraph
+            a paragraph, None if the page has no text left (ex: a figure page
+            with only a running header and footer, taken out as boilerplate)
         """
         try:
-            # remove "." in Fig. or fig. in the sentences cause it will affect splitting paragraphs
-            # and this will affect ChatGPT translation performance
-            if ("Fig." in text):
-                text = text.replace("Fig.", 'Fig')
-            if ("fig." in text):
-                text = text.replace("fig.", "fig")
-            # check if '\x02' is in the text, if it is, using '-' to join the words
-            if ("\x02" in text):
-                text = text.replace("\x02", "-")
-            # check if '\x00' is in the text, if it is, using " " to replace the words
-            if ("\x00" in text):
-                text = text.replace("\x00", " ")   
-            splitted_docs = text.split("\r\n")
-            
-            # replace "\r\n" with blank:
-            splitted_docs = text.split("\r\n")
-            joined_doc = " ".join(splitted_docs)
-            
-            # Using NLTK to tokenize a document into sentences level:
-            t_sent = sent_tokenize(joined_doc)
-            
-        
-            # get every 5 sentences as a paragraph:
-            end = end = int((np.ceil(len(t_sent) / 5)) * 5)
-            multiples_5 = np.arange(0, end , 5)
+            chunks = self.split_paragraphs(text, page_num)
+            if not chunks:
+                return None, self.path
 
             # get the paragraph and save it in a text file:
-            for idx, i in enumerate(multiples_5):
-                first_idx = i
-                last_idx = i + 5
-                if first_idx != multiples_5[-1]:
-                    doc = " ".join(t_sent[first_idx:last_idx])
-                    # save text:
-                    self.path = self.save_text(page_num, idx, doc)
-
-                else:
-                    doc = " ".join(t_sent[i:])
-                    # save text:
-                    self.path = self.save_text(page_num, idx, doc) 
+            for idx, doc in enumerate(chunks):
+                self.path = self.save_text(page_num, idx, doc)
             
             return doc, self.path
         
@@ -203,13 +387,47 @@ class PDF_to_Text:
             paragraph txt files
         """
         try:
-            # get paragraphs in each of pages:
+            # get paragraphs in each of pages, a page left empty has none:
+            doc = None
             for k, v in self.articles.items():
-                doc, self.path  = self.get_paragraph(v, k)
+                page_doc, self.path  = self.get_paragraph(v, k)
+                if page_doc is not None:
+                    doc = page_doc
                 
             print(f"finishing extracting paper {self.file_name}\n\n")
+            self.chunker.report()
             return doc
         
         except Exception as err:
             print(err)
 
+    def iter_paragraphs(self, save = False, window = DEFAULT_WINDOW):
+        """This function is to yield the paragraphs of every page one by one,
+        in page/paragraph order, so they can go straight to the Translator
+        without the before directory. If get_txt was not called, the pages
+        are extracted as they are needed and not kept.
+
+        Parameters
+        ----------
+        save : bool, optional
+            if it is True, each paragraph is also saved as a txt file in the
+            'before' directory (for debugging), by default False
+        window : int, optional
+            the pages read before the PDF file is opened again (see
+            iter_pages), by default 256
+
+        Yields
+        ------
+        Paragraph
+            the document, page, index and text of a paragraph
+        """
+        if save:
+            self.create_directory()
+
+        for page_num, text in self.iter_pages(window):
+            for idx, doc in enumerate(self.split_paragraphs(text, page_num)):
+                if save:
+                    self.save_text(page_num, idx, doc)
+                yield Paragraph(self.file_name, int(page_num.split("_")[1]), idx, doc)
+
+        self.chunker.report()
@@ -0,0 +1,160 @@
+# Purpose:  This script is to keep a crash-safe record of each paragraph's
+#           translation state, so an interrupted job can be resumed
+
+import os
+import json
+import hashlib
+import threading
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobManifest:
+    """This class is to record the state (pending, in_flight, done, failed) of
+    every paragraph of a translation job in an append-only journal. Each state
+    change is one JSON line flushed to disk, and the journal is compacted into
+    a snapshot with an atomic rename when it is opened again.
+    """
+
+    def __init__(self, path):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str
+            the journal file, ex: after/job_manifest.jsonl
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+        self.compact()
+        self.journal = open(self.path, 'a', encoding = 'utf-8')
+
+    def load(self):
+        """This function is to replay the journal, the last line of a
+        paragraph wins. A line cut off by a crash is skipped.
+
+        Returns
+        -------
+        dict
+            the file name as the key and {'state', 'sha', 'error'} as the value
+        """
+        entries = dict()
+        if not os.path.exists(self.path):
+            return entries
+
+        with open(self.path, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                entries[record['file_name']] = {
+                    'state': record['state'],
+                    'sha': record.get('sha'),
+                    'error': record.get('error')
+                    }
+
+        return entries
+
+    def compact(self):
+        """This function is to rewrite the journal with one line per paragraph.
+        The snapshot is written to a temporary file and renamed over the
+        journal, so a crash leaves either the old or the new one.
+        """
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding = 'utf-8') as f:
+            for fname, entry in self.entries.items():
+                f.write(json.dumps({'file_name': fname, **entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def set_state(self, fname, state, sha = None, error = None):
+        """This function is to record a state change of a paragraph.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        state : str
+            pending, in_flight, done or failed
+        sha : str, optional
+            the hash of the paragraph text, by default the one already recorded
+        error : str, optional
+            the error message of a failed paragraph, by default None
+        """
+        with self.lock:
+            entry = self.entries.get(fname, {})
+            entry = {
+                'state': state,
+                'sha': sha if sha is not None else entry.get('sha'),
+                'error': error
+                }
+            self.entries[fname] = entry
+
+            self.journal.write(json.dumps({'file_name': fname, **entry}) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def register(self, fname, text):
+        """This function is to add a paragraph to the job. A paragraph whose
+        text changed since the last run goes back to pending.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        text : str
+            the paragraph text
+
+        Returns
+        -------
+        str
+            the state of the paragraph
+        """
+        sha = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        entry = self.entries.get(fname)
+
+        if (entry is None) or (entry['sha'] != sha):
+            self.set_state(fname, PENDING, sha = sha)
+            return PENDING
+
+        return entry['state']
+
+    def get_state(self, fname):
+        """This function is to get the state of a paragraph.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+
+        Returns
+        -------
+        str or None
+            the state, None if the paragraph is not in the job
+        """
+        entry = self.entries.get(fname)
+        return entry['state'] if entry is not None else None
+
+    def summary(self):
+        """This function is to count the paragraphs in each state.
+
+        Returns
+        -------
+        dict
+            the state as the key and the number of paragraphs as the value
+        """
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        for entry in self.entries.values():
+            counts[entry['state']] = counts.get(entry['state'], 0) + 1
+        return counts
+
+    def close(self):
+        """This function is to close the journal.
+        """
+        with self.lock:
+            self.journal.close()
@@ -0,0 +1,235 @@
+# Purpose:  This script is to find the content box of each page from the
+#           boxes of its text, instead of fixed margins taken from the first
+#           page, so landscape and mixed-size pages are not clipped and text in
+#           the side margins (line numbers, arXiv stamps) is left out
+
+import os
+import sys
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+# left, bottom, right, top, the margins used before the layout stage, kept
+# for pages without any text box:
+DEFAULT_MARGINS = (30, 30, 30, 40)
+
+def get_text_rects(textpage):
+    """This function is to get the boxes of the text of a page. pdfium merges
+    the boxes of the characters of each text run into one rectangle, so a page
+    has tens of boxes instead of thousands.
+
+    Parameters
+    ----------
+    textpage : PdfTextPage
+        the text page from page.get_textpage()
+
+    Returns
+    -------
+    numpy.ndarray
+        an (n, 4) array of left, bottom, right, top
+    """
+    n_rects = textpage.count_rects()
+    return np.array([textpage.get_rect(i) for i in range(n_rects)], dtype = float).reshape(-1, 4)
+
+
+def content_box(rects, bounds, side_edge = 0.08, padding = 2.0):
+    """This function is to get the box around the text of a page, leaving out
+    the boxes that lie wholly in a side margin. Everything is in the
+    coordinates of the text boxes, before the page is rotated for display
+    (page.get_size() is after), so a rotated page is measured like any other.
+
+    Parameters
+    ----------
+    rects : numpy.ndarray
+        an (n, 4) array of left, bottom, right, top from get_text_rects
+    bounds : tuple
+        left, bottom, right, top of the crop box of the page, which does not
+        always start at (0, 0)
+    side_edge : float, optional
+        the share of the page taken as the margins at both ends of the lines,
+        by default 0.08
+    padding : float, optional
+        the points added around the box, so the characters at its edges are
+        not cut off, by default 2.0
+
+    Returns
+    -------
+    tuple
+        left, bottom, right, top of the content box
+    """
+    x0, y0, x1, y1 = bounds
+
+    # clip to the page and drop the empty boxes:
+    rects = np.clip(rects, [x0, y0, x0, y0], [x1, y1, x1, y1])
+    rects = rects[(rects[:, 2] > rects[:, 0]) & (rects[:, 3] > rects[:, 1])]
+
+    if len(rects) == 0:
+        left, bottom, right, top = DEFAULT_MARGINS
+        return (x0 + left, y0 + bottom, x1 - right, y1 - top)
+
+    # text that stays in the side margins is line numbers or a vertical stamp,
+    # unless it is all the text there is. The side margins are at both ends
+    # of the lines: along x, or along y if most text runs are taller than
+    # wide (text drawn turned by 90 degrees, ex: a landscape page in a
+    # portrait box):
+    sizes = rects[:, 2:] - rects[:, :2]
+    axis = 0 if np.median(sizes[:, 0] - sizes[:, 1]) >= 0 else 1
+    low, high = bounds[axis], bounds[axis + 2]
+    edge = side_edge * (high - low)
+    in_margin = (rects[:, axis + 2] < low + edge) | (rects[:, axis] > high - edge)
+    if not in_margin.all():
+        rects = rects[~in_margin]
+
+    left, bottom = rects[:, :2].min(axis = 0) - padding
+    right, top = rects[:, 2:].max(axis = 0) + padding
+
+    return (max(x0, float(left)), max(y0, float(bottom)), min(x1, float(right)), min(y1, float(top)))
+
+
+class PageLayout:
+    """This class is to keep the content box of each page of a document, so a
+    page is measured once however many times it is extracted.
+    """
+
+    def __init__(self, side_edge = 0.08, padding = 2.0):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        side_edge : float, optional
+            the share of the page taken as the margins at both ends of the lines, by default 0.08
+        padding : float, optional
+            the points added around the content box, by default 2.0
+        """
+        self.side_edge = side_edge
+        self.padding = padding
+        self.boxes = dict()
+
+    def get_box(self, index, page, textpage):
+        """This function is to get the content box of a page.
+
+        Parameters
+        ----------
+        index : int
+            the page index
+        page : PdfPage
+            the page
+        textpage : PdfTextPage
+            the text page of the page
+
+        Returns
+        -------
+        tuple
+            left, bottom, right, top of the content box
+        """
+        box = self.boxes.get(index)
+        if box is None:
+            # the crop box is in the coordinates of the text boxes, unlike
+            # page.get_size() which is rotated:
+            box = content_box(get_text_rects(textpage), page.get_cropbox(), self.side_edge, self.padding)
+            self.boxes[index] = box
+        return box
+
+    def get_text(self, index, page, textpage):
+        """This function is to get the text inside the content box of a page.
+
+        Parameters
+        ----------
+        index : int
+            the page index
+        page : PdfPage
+            the page
+        textpage : PdfTextPage
+            the text page of the page
+
+        Returns
+        -------
+        str
+            the text content of the page
+        """
+        left, bottom, right, top = self.get_box(index, page, textpage)
+        return textpage.get_text_bounded(left = left, bottom = bottom, right = right, top = top)
+
+
+LAYOUTS = dict()
+LAYOUTS_LOCK = threading.Lock()
+
+def get_layout(file):
+    """This function is to get the PageLayout of a PDF file, shared by every
+    extraction of the same file in this process until the file changes.
+
+    Parameters
+    ----------
+    file : str
+        the path of the PDF file
+
+    Returns
+    -------
+    PageLayout
+        the layout of the document
+    """
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+    with LAYOUTS_LOCK:
+        if key not in LAYOUTS:
+            LAYOUTS[key] = PageLayout()
+        return LAYOUTS[key]
+
+
+def check_pages(file):
+    """This function is to check that the content box of each page keeps all
+    its text, on a PDF file without text in the side margins.
+
+    Parameters
+    ----------
+    file : str
+        the PDF file
+
+    Returns
+    -------
+    list
+        (page index, rotation, characters of the page, characters in the box)
+        of the pages that lost text
+    """
+    import pypdfium2 as pdfium
+    from page_stream import get_text_range
+
+    layout = PageLayout()
+    pdf = pdfium.PdfDocument(file)
+    lost = []
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            full = get_text_range(i, page, textpage)
+            boxed = layout.get_text(i, page, textpage)
+            if boxed != full:
+                lost.append((i, page.get_rotation(), len(full), len(boxed)))
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return lost
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "check the content boxes of rotated and shifted pages")
+    parser.add_argument('--pages', type = int, default = 3, help = "pages of each synthetic PDF")
+    args = parser.parse_args()
+
+    from synthetic_pdf import make_pdf
+
+    work_dir = tempfile.mkdtemp()
+    failed = False
+    for rotate, origin in [(0, (0, 0)), (90, (0, 0)), (180, (0, 0)), (270, (0, 0)), (90, (-100, -50))]:
+        path = make_pdf(
+            os.path.join(work_dir, f"rotate_{rotate}_{origin[0]}_{origin[1]}.pdf"), args.pages,
+            rotate = rotate, origin = origin
+            )
+        lost = check_pages(path)
+        print(f"rotate {rotate}, origin {origin}: {'ok' if not lost else lost}")
+        failed = failed or bool(lost)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,442 @@
+# Purpose:  This script is to collect live metrics of the extraction and
+#           translation stages and expose them as a Prometheus text endpoint
+#           or a JSON file flushed every few seconds
+
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds, from a fast page extraction to a slow API call:
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+DESCRIPTIONS = {
+    'stage_seconds': "seconds spent in each stage of the extraction and translation",
+    'request_seconds': "seconds per ChatCompletion call, including retries",
+    'requests_total': "ChatCompletion calls by outcome",
+    'requests_in_flight': "ChatCompletion calls waiting for a reply",
+    'queue_depth': "paragraphs waiting in a queue",
+    'paragraphs_remaining': "paragraphs not translated yet in the current run",
+    'tokens_total': "tokens used by the API calls, by kind",
+    'tokens_per_second': "tokens used per second over the last minute",
+    'errors_total': "errors by type and HTTP status",
+    'cache_total': "translation cache lookups by result",
+    'memory_total': "translation memory lookups by result (hit, partial, miss)",
+    }
+
+def format_labels(labels, **extra):
+    """This function is to write the labels of a sample in the Prometheus text format.
+
+    Parameters
+    ----------
+    labels : tuple
+        (name, value) pairs
+    **extra
+        more labels, ex: le for a histogram bucket
+
+    Returns
+    -------
+    str
+        ex: '{stage="translate",le="0.5"}', '' without labels
+    """
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = [
+        (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in pairs
+        ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def make_key(name, labels):
+    """This function is to get the key of a sample. Label values are kept as
+    strings, so samples sort the same way whatever type they were given as.
+
+    Parameters
+    ----------
+    name : str
+        the metric
+    labels : dict
+        the labels of the sample
+
+    Returns
+    -------
+    tuple
+        (name, sorted (label, value) pairs), a missing value (ex: no HTTP
+        status) becomes an empty string
+    """
+    return (name, tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items())))
+
+
+class Metrics:
+    """This class is to keep counters, gauges and histograms keyed by name and
+    labels. Every function is thread-safe, so the worker threads can record
+    into one shared registry (METRICS).
+    """
+
+    def __init__(self, buckets = DEFAULT_BUCKETS, rate_window = 60):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        buckets : tuple, optional
+            the upper bounds of the histogram buckets in seconds, by default DEFAULT_BUCKETS
+        rate_window : float, optional
+            the seconds the per-second rates are measured over, by default 60
+        """
+        self.buckets = tuple(buckets)
+        self.rate_window = rate_window
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """This function is to clear every metric.
+        """
+        with self.lock:
+            self.started = time.time()
+            self.counters = dict()
+            self.gauges = dict()
+            self.histograms = dict()
+            # (time, amount) of the recent counter increments, for the rates:
+            self.recent = dict()
+
+    def inc(self, name, value = 1, **labels):
+        """This function is to add to a counter.
+
+        Parameters
+        ----------
+        name : str
+            the counter, ex: 'tokens_total'
+        value : float, optional
+            the amount to add, by default 1
+        **labels
+            the labels of the sample, ex: kind='prompt'
+        """
+        key = make_key(name, labels)
+        now = time.monotonic()
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            recent = self.recent.setdefault(name, deque())
+            recent.append((now, value))
+            while recent and (recent[0][0] < now - self.rate_window):
+                recent.popleft()
+
+    def set_gauge(self, name, value, **labels):
+        """This function is to set a gauge.
+
+        Parameters
+        ----------
+        name : str
+            the gauge, ex: 'queue_depth'
+        value : float
+            the current value
+        **labels
+            the labels of the sample
+        """
+        with self.lock:
+            self.gauges[make_key(name, labels)] = value
+
+    def add_gauge(self, name, value, **labels):
+        """This function is to move a gauge up or down.
+
+        Parameters
+        ----------
+        name : str
+            the gauge, ex: 'requests_in_flight'
+        value : float
+            the amount to add, negative to take away
+        **labels
+            the labels of the sample
+        """
+        key = make_key(name, labels)
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """This function is to add a value to a histogram.
+
+        Parameters
+        ----------
+        name : str
+            the histogram, ex: 'request_seconds'
+        value : float
+            the observed value
+        **labels
+            the labels of the sample
+        """
+        key = make_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self.histograms[key] = histogram
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        """This function is to time a block of code as one stage.
+
+        Parameters
+        ----------
+        stage : str
+            the stage, ex: 'get_txt'
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - begin, stage = stage)
+
+    def rate(self, name):
+        """This function is to get how fast a counter went up over the rate window.
+
+        Parameters
+        ----------
+        name : str
+            the counter, ex: 'tokens_total'
+
+        Returns
+        -------
+        float
+            the amount per second, all labels together
+        """
+        now = time.monotonic()
+        with self.lock:
+            recent = [v for t, v in self.recent.get(name, ()) if t >= now - self.rate_window]
+        seconds = min(self.rate_window, max(time.time() - self.started, 1e-9))
+        return sum(recent) / seconds
+
+    def render_prometheus(self):
+        """This function is to write every metric in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            the text served at /metrics
+        """
+        tokens_per_second = self.rate('tokens_total')
+        lines = []
+        with self.lock:
+            groups = [
+                ('counter', self.counters),
+                ('gauge', {**self.gauges, ('tokens_per_second', ()): tokens_per_second})
+                ]
+            for kind, samples in groups:
+                for name in sorted({k[0] for k in samples}):
+                    lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, labels), value in sorted(samples.items()):
+                        if n == name:
+                            lines.append(f"{name}{format_labels(labels)} {value}")
+
+            for name in sorted({k[0] for k in self.histograms}):
+                lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), histogram in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    # the buckets of the text format are cumulative:
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram['buckets']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels, le = bound)} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels, le = '+Inf')} {histogram['count']}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """This function is to get every metric as a dictionary for the JSON file.
+
+        Returns
+        -------
+        dict
+            the counters, gauges and histograms, with the labels written as in
+            the text format, ex: 'stage_seconds{stage="translate"}'
+        """
+        tokens_per_second = self.rate('tokens_total')
+        with self.lock:
+            histograms = dict()
+            for (name, labels), histogram in self.histograms.items():
+                histograms[name + format_labels(labels)] = {
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 6),
+                    'mean': round(histogram['sum'] / histogram['count'], 6),
+                    'buckets': dict(zip([str(i) for i in self.buckets], histogram['buckets']))
+                    }
+            return {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'counters': {n + format_labels(l): v for (n, l), v in self.counters.items()},
+                'gauges': {
+                    **{n + format_labels(l): v for (n, l), v in self.gauges.items()},
+                    'tokens_per_second': round(tokens_per_second, 3)
+                    },
+                'histograms': histograms
+                }
+
+    def write_json(self, path):
+        """This function is to write the snapshot to a temporary file and rename
+        it, so a reader never sees half a file.
+
+        Parameters
+        ----------
+        path : str
+            the JSON file
+        """
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding = 'utf-8') as f:
+            json.dump(self.snapshot(), f, indent = 2)
+        os.replace(tmp, path)
+
+
+# the registry shared by the extractor, the translator and the pipeline:
+METRICS = Metrics()
+
+def timed(stage):
+    """This function is to time every call of a function as a stage in METRICS.
+
+    Parameters
+    ----------
+    stage : str
+        the stage, ex: 'read_pdf'
+
+    Returns
+    -------
+    callable
+        the decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """This class is to answer GET /metrics in the Prometheus text format.
+    """
+
+    # set by MetricsServer:
+    metrics = METRICS
+
+    def do_GET(self):
+        """This function is to answer a scrape.
+        """
+        if self.path.split("?")[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        payload = self.metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        """This function is to keep the request log quiet.
+        """
+        pass
+
+
+class MetricsServer:
+    """This class is to serve /metrics in a background thread.
+    """
+
+    def __init__(self, host = '127.0.0.1', port = 9100, metrics = METRICS):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        host : str, optional
+            the host to bind, by default '127.0.0.1'
+        port : int, optional
+            the port to bind, 0 picks a free port, by default 9100
+        metrics : Metrics, optional
+            the registry to serve, by default METRICS
+        """
+        handler = type('Handler', (MetricsHandler,), {'metrics': metrics})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/metrics"
+
+    def start(self):
+        """This function is to serve scrapes in a background thread.
+
+        Returns
+        -------
+        str
+            the URL of the endpoint
+        """
+        thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        thread.start()
+        return self.url
+
+    def stop(self):
+        """This function is to shut the server down.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class JSONFlusher:
+    """This class is to write the metrics to a JSON file every few seconds in
+    a background thread.
+    """
+
+    def __init__(self, path, interval = 10, metrics = METRICS):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str
+            the JSON file, ex: after/log/metrics.json
+        interval : float, optional
+            the seconds between two writes, by default 10
+        metrics : Metrics, optional
+            the registry to write, by default METRICS
+        """
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def run(self):
+        """This function is to write the file until stop is called.
+        """
+        while not self.stopped.wait(self.interval):
+            self.metrics.write_json(self.path)
+
+    def start(self):
+        """This function is to start writing in a background thread.
+
+        Returns
+        -------
+        str
+            the path of the JSON file
+        """
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        return self.path
+
+    def stop(self):
+        """This function is to stop the thread and write the file one last time.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.metrics.write_json(self.path)
@@ -0,0 +1,98 @@
+# Purpose:  This script is to write the translated paragraphs to the merged
+#           output as soon as they are finished, in page/paragraph order
+
+import threading
+
+class OrderedWriter:
+    """This class is to append the translations to the merged file while the
+    workers are still running. Paragraphs finish out of order, so a finished
+    paragraph is held until all the paragraphs before it are written, then
+    the whole run of them is flushed at once.
+    """
+
+    def __init__(self, path, file_lst, page_lst):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str
+            the merged file, ex: after/merge_translation.txt
+        file_lst : list
+            the text files of all the paragraphs, in page/paragraph order
+        page_lst : list
+            the page number of each of them
+        """
+        self.path = path
+        self.position = {fname: i for i, fname in enumerate(file_lst)}
+        self.page_lst = list(page_lst)
+        self.done = dict()
+        self.next = 0
+        # the page of the last paragraph written:
+        self.last_page = None
+        self.lock = threading.Lock()
+        self.file = open(path, 'w', encoding = 'utf-8')
+
+    def add(self, fname, translation):
+        """This function is to hand over a finished paragraph.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        translation : str or None
+            the translation, None for a paragraph that failed
+        """
+        with self.lock:
+            if (fname not in self.position) or (self.file is None):
+                return
+            self.done[self.position[fname]] = translation
+            self.flush()
+
+    def skip(self, fname):
+        """This function is to let the paragraphs after a failed one through.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph that failed
+        """
+        self.add(fname, None)
+
+    def flush(self):
+        """This function is to write the finished paragraphs following the last
+        one written. Call it with the lock held.
+        """
+        written = False
+        while self.next in self.done:
+            doc = self.done.pop(self.next)
+            if doc is not None:
+                # one line break within a page, two between pages, the same
+                # as merge_files (a failed paragraph is left out):
+                page = self.page_lst[self.next]
+                if self.last_page is not None:
+                    self.file.write("\n" if page == self.last_page else "\n\n")
+                # break lines
+                self.file.write(doc.replace("。", "。\n"))
+                self.last_page = page
+                written = True
+            self.next += 1
+
+        # make it visible to the reader right away:
+        if written:
+            self.file.flush()
+
+    def close(self):
+        """This function is to close the merged file.
+
+        Returns
+        -------
+        int
+            the number of paragraphs written in order
+        """
+        with self.lock:
+            if self.file is not None:
+                if self.last_page is not None:
+                    self.file.write("\n")
+                self.file.close()
+                self.file = None
+            return self.next
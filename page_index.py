@@ -0,0 +1,226 @@
+# Purpose:  This script is to find the pages of a phrase or a section heading
+#           through an inverted index over the normalized text of the pages,
+#           so the translation range can be given as arguments (page numbers,
+#           phrases or headings) instead of typed in
+
+import re
+
+WORD = re.compile(r"\w+")
+
+# the numbering before a section heading: '1', '2.3', '2.3.', 'IV.', 'A.'
+NUMBERING = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.|[A-Z]\.)\s+")
+
+# a heading is a short line, not the end of a sentence:
+MAX_HEADING_WORDS = 6
+
+def normalize_words(text):
+    """This function is to get the words of a text in lower case, so case,
+    punctuation, spaces and line breaks do not matter.
+
+    Parameters
+    ----------
+    text : str
+        the text
+
+    Returns
+    -------
+    list
+        the words (str)
+    """
+    return WORD.findall(text.lower())
+
+
+def normalize_heading(line):
+    """This function is to get the heading of a line without its numbering
+    ('2. Related Work' -> 'related work'), if the line looks like a heading.
+
+    Parameters
+    ----------
+    line : str
+        a line of a page, or a heading given by the user
+
+    Returns
+    -------
+    str or None
+        the words of the heading joined by spaces, None if it is not a heading
+    """
+    line = NUMBERING.sub("", line).strip()
+    words = normalize_words(line)
+    if (not words) or (len(words) > MAX_HEADING_WORDS) or line.endswith((".", ",", ";")):
+        return None
+    return " ".join(words)
+
+
+def iter_lines(text):
+    """This function is to yield the lines of a page with their position.
+
+    Parameters
+    ----------
+    text : str
+        the text of a page, the lines separated by '\\r\\n'
+
+    Yields
+    ------
+    int, int, str
+        the start and end of the line in text, and the line
+    """
+    start = 0
+    for line in text.split("\r\n"):
+        yield start, start + len(line), line
+        start += len(line) + 2
+
+
+def locate_phrase(text, phrase, pos = 0):
+    """This function is to find a phrase in the text of a page, whatever the
+    case and the spaces or line breaks between its words.
+
+    Parameters
+    ----------
+    text : str
+        the text of a page
+    phrase : str
+        the phrase
+    pos : int, optional
+        the position to search from, by default 0
+
+    Returns
+    -------
+    tuple or None
+        the start and end of the line(s) with the phrase, None if it is not found
+    """
+    words = normalize_words(phrase)
+    if not words:
+        return None
+
+    pattern = r"(?<!\w)" + r"\W+".join(re.escape(i) for i in words) + r"(?!\w)"
+    match = re.compile(pattern, re.IGNORECASE).search(text, pos)
+    if match is None:
+        return None
+
+    # the whole lines, as the range was cut before:
+    start = text.rfind("\r\n", 0, match.start())
+    end = text.find("\r\n", match.end())
+    return (start + 2 if start != -1 else 0, end if end != -1 else len(text))
+
+
+def locate_heading(text, heading, pos = 0):
+    """This function is to find a section heading line in the text of a page.
+
+    Parameters
+    ----------
+    text : str
+        the text of a page
+    heading : str
+        the heading, with or without its numbering
+    pos : int, optional
+        the position to search from, by default 0
+
+    Returns
+    -------
+    tuple or None
+        the start and end of the heading line, None if it is not found
+    """
+    key = normalize_heading(heading)
+    for start, end, line in iter_lines(text):
+        if (start >= pos) and (normalize_heading(line) == key):
+            return (start, end)
+    return None
+
+
+class PageIndex:
+    """This class is to keep, for each word, the pages it is on, and for each
+    heading line, the pages it starts, so a phrase is only searched for on the
+    pages that have all its words.
+    """
+
+    def __init__(self):
+        """Initiate the class.
+        """
+        self.postings = dict()
+        self.headings = dict()
+        self.pages = dict()
+
+    @classmethod
+    def from_articles(cls, articles):
+        """This function is to build the index of the pages of a document.
+
+        Parameters
+        ----------
+        articles : dictionary
+            page number ('page_N') as the key and the text content as the value
+
+        Returns
+        -------
+        PageIndex
+            the index
+        """
+        index = cls()
+        for k, v in articles.items():
+            index.add(int(k.split("_")[1]), v)
+        return index
+
+    def add(self, page, text):
+        """This function is to add a page to the index.
+
+        Parameters
+        ----------
+        page : int
+            the page index
+        text : str
+            the text content of the page
+        """
+        words = normalize_words(text)
+        # the words joined by single spaces, to check a phrase on its pages:
+        self.pages[page] = " ".join(words)
+
+        for word in set(words):
+            self.postings.setdefault(word, set()).add(page)
+
+        for _, _, line in iter_lines(text):
+            heading = normalize_heading(line)
+            if heading is not None:
+                self.headings.setdefault(heading, set()).add(page)
+
+    def find(self, phrase, start = 0):
+        """This function is to find the pages with a phrase.
+
+        Parameters
+        ----------
+        phrase : str
+            the phrase
+        start : int, optional
+            the first page index to look at, by default 0
+
+        Returns
+        -------
+        list
+            the page indices in order, empty if the phrase is not found
+        """
+        words = normalize_words(phrase)
+        if not words:
+            return []
+
+        # the pages with every word, starting from the rarest word:
+        postings = sorted((self.postings.get(i, set()) for i in set(words)), key = len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        needle = f" {' '.join(words)} "
+        return sorted(i for i in candidates if (i >= start) and (needle in f" {self.pages[i]} "))
+
+    def find_heading(self, heading, start = 0):
+        """This function is to find the pages with a section heading.
+
+        Parameters
+        ----------
+        heading : str
+            the heading, ex: 'Introduction' or '5 Conclusion'
+        start : int, optional
+            the first page index to look at, by default 0
+
+        Returns
+        -------
+        list
+            the page indices in order, empty if the heading is not found
+        """
+        key = normalize_heading(heading)
+        return sorted(i for i in self.headings.get(key, set()) if i >= start)
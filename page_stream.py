@@ -0,0 +1,81 @@
+# Purpose:  This script is to extract the text of a PDF file one page at a
+#           time, closing every pdfium handle as soon as its page is done, so
+#           memory stays flat however many pages the file has
+
+import pypdfium2 as pdfium
+from metrics import METRICS
+
+# the pages read before the document is closed and opened again:
+DEFAULT_WINDOW = 256
+
+def get_text_range(index, page, textpage):
+    """This function is to get all the text of a page.
+
+    Parameters
+    ----------
+    index : int
+        the page index
+    page : PdfPage
+        the page
+    textpage : PdfTextPage
+        the text page of the page
+
+    Returns
+    -------
+    str
+        the text content of the page
+    """
+    return textpage.get_text_range()
+
+
+def iter_pdf_pages(file, start = 0, stop = None, window = DEFAULT_WINDOW, get_text = get_text_range):
+    """This function is to yield the text of the pages of a PDF file one by
+    one. The text page and the page are closed before the text is yielded, and
+    the document is closed and opened again every window pages, because pdfium
+    keeps the fonts and objects it parsed until the document is closed.
+
+    Parameters
+    ----------
+    file : str
+        the path of the PDF file
+    start : int, optional
+        the first page index, by default 0
+    stop : int, optional
+        the page index after the last page, by default the end of the document
+    window : int, optional
+        the pages read per opening of the document, None to keep it open until
+        the end; a smaller window holds less memory but opens the file more
+        often, by default 256
+    get_text : callable, optional
+        get_text(index, page, textpage) returning the text of a page, by
+        default all the text of the page
+
+    Yields
+    ------
+    str, str
+        the page number ('page_N') and the text content of the page
+    """
+    pdf = pdfium.PdfDocument(file)
+    try:
+        if stop is None:
+            stop = len(pdf)
+
+        for i in range(start, stop):
+            if (window is not None) and (i > start) and ((i - start) % window == 0):
+                pdf.close()
+                pdf = pdfium.PdfDocument(file)
+
+            with METRICS.timer('extract_page'):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                try:
+                    text = get_text(i, page, textpage)
+                finally:
+                    textpage.close()
+                    page.close()
+
+            yield f"page_{i}", text
+
+    finally:
+        # also when the caller stops early:
+        pdf.close()
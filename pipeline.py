@@ -0,0 +1,79 @@
+# Purpose:  This script is to run the extraction and the translation at the
+#           same time, connected by a bounded queue
+
+import queue
+import threading
+from metrics import METRICS
+
+# put on the queue by the extractor when there are no more paragraphs:
+END = object()
+
+def iter_queue(paragraph_queue):
+    """This function is to yield the paragraphs from the queue until the
+    extractor is finished.
+
+    Parameters
+    ----------
+    paragraph_queue : Queue
+        the queue between the extractor and the translator
+
+    Yields
+    ------
+    Paragraph
+        the next paragraph
+    """
+    while True:
+        paragraph = paragraph_queue.get()
+        METRICS.set_gauge('queue_depth', paragraph_queue.qsize(), queue = 'paragraphs')
+        if paragraph is END:
+            return
+        yield paragraph
+
+
+def run_pipeline(extractor, translator, max_queue = 64, save = False, **kwargs):
+    """This function is to translate the paragraphs of page 1 while the later
+    pages are still being extracted. The extractor runs in its own thread and
+    waits when the queue is full, so memory stays flat however fast it is.
+
+    Parameters
+    ----------
+    extractor : PDF_to_Text
+        the extractor, after read_pdf
+    translator : Translator
+        the translator, after create_directory
+    max_queue : int, optional
+        the maximum paragraphs waiting for translation, by default 64
+    save : bool, optional
+        if it is True, the paragraphs are also saved in the 'before'
+        directory, by default False
+    **kwargs
+        passed on to Translator.iterate_stream (max_workers, rpm, tpm)
+
+    Returns
+    -------
+    Pandas Dataframe
+        the metadata of all the paragraphs, ready for merge_files
+    """
+    paragraph_queue = queue.Queue(maxsize = max_queue)
+    errors = []
+
+    def produce():
+        try:
+            for paragraph in extractor.iter_paragraphs(save = save):
+                paragraph_queue.put(paragraph)
+                METRICS.set_gauge('queue_depth', paragraph_queue.qsize(), queue = 'paragraphs')
+        except Exception as err:
+            errors.append(err)
+        finally:
+            paragraph_queue.put(END)
+
+    producer = threading.Thread(target = produce, daemon = True)
+    producer.start()
+
+    metadata = translator.iterate_stream(iter_queue(paragraph_queue), **kwargs)
+    producer.join()
+
+    if errors:
+        raise errors[0]
+
+    return metadata
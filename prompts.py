@@ -0,0 +1,17 @@
+# Purpose:  This script is to keep the prompts sent to ChatGPT, so they can be
+#           used without importing the translator (ex: for estimates)
+
+# the prompt sent with every paragraph:
+PROMPT_TEMPLATE = (
+    "Please translate the text from English to {language}, "
+    "and return only translated text, not include the origin text, "
+    "here is the text: {text}"
+    )
+
+# the prompt of a batch, the paragraphs are sent as a JSON array:
+BATCH_PROMPT_TEMPLATE = (
+    "Please translate each item of the following JSON array from English to {language}. "
+    "Return only a JSON array of the translated texts, with exactly {n_segments} items "
+    "in the same order, and do not include the origin text. "
+    "Here is the JSON array: {text}"
+    )
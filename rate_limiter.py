@@ -0,0 +1,112 @@
+# Purpose:  This script is to keep the API calls under the requests-per-minute
+#           and tokens-per-minute limits of the OpenAI account
+
+import time
+import threading
+
+class RateLimiter:
+    """This class is to throttle API calls with two token buckets, one for
+    requests per minute and one for tokens per minute.
+    """
+
+    def __init__(self, rpm = 3500, tpm = 90000):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        rpm : int, optional
+            the maximum number of requests per minute, by default 3500
+        tpm : int, optional
+            the maximum number of tokens per minute, by default 90000
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        # both buckets start full, the same way the API allows a burst
+        # after an idle minute:
+        self.request_allowance = float(rpm)
+        self.token_allowance = float(tpm)
+        self.last_refill = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self):
+        """This function is to top up both buckets for the time passed since
+        the last refill. The caller has to hold the lock.
+        """
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+
+        self.request_allowance = min(
+            self.rpm, self.request_allowance + elapsed * self.rpm / 60
+            )
+        self.token_allowance = min(
+            self.tpm, self.token_allowance + elapsed * self.tpm / 60
+            )
+
+    def pause(self, seconds):
+        """This function is to hold back every request for a while, ex: when
+        the server answers 429 with a Retry-After header.
+
+        Parameters
+        ----------
+        seconds : float
+            the seconds to wait before the next request
+        """
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def acquire(self, tokens = 1):
+        """This function is to block until a request with the given number of
+        tokens can be sent without going over the limits.
+
+        Parameters
+        ----------
+        tokens : int, optional
+            the estimated tokens (prompt + max completion) of the request, by default 1
+
+        Returns
+        -------
+        float
+            the seconds this call waited
+        """
+        # a single request larger than the whole minute budget would wait forever:
+        tokens = min(tokens, self.tpm)
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                self.refill()
+                paused = self.resume_at - time.monotonic()
+                if (paused <= 0) and (self.request_allowance >= 1) and (self.token_allowance >= tokens):
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return waited
+
+                # how long until both buckets have enough:
+                request_wait = (1 - self.request_allowance) * 60 / self.rpm
+                token_wait = (tokens - self.token_allowance) * 60 / self.tpm
+                wait = max(paused, request_wait, token_wait, 0.01)
+
+            time.sleep(wait)
+            waited += wait
+
+
+def estimate_tokens(text, completion_tokens = 0):
+    """This function is to roughly estimate the tokens of a request, which is
+    about 4 characters per token for English text.
+
+    Parameters
+    ----------
+    text : str
+        the prompt text
+    completion_tokens : int, optional
+        the max_tokens reserved for the reply, the API counts it towards the
+        tokens-per-minute limit, by default 0
+
+    Returns
+    -------
+    int
+        the estimated tokens
+    """
+    return int(len(text) / 4) + 1 + completion_tokens
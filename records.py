@@ -0,0 +1,41 @@
+# Purpose:  This script is to define the paragraph record passed from the
+#           extractor to the translator
+
+from collections import namedtuple
+
+class Paragraph(namedtuple('Paragraph', ['document', 'page', 'index', 'text'])):
+    """This class is a paragraph of a PDF file: the PDF file name, the page
+    number, the number of the paragraph in the page and the paragraph text.
+    """
+
+    __slots__ = ()
+
+    @property
+    def file_name(self):
+        """This function is to get the name the paragraph has in the before
+        directory, which is also its key in the translator.
+
+        Returns
+        -------
+        str
+            ex: 'page_3_0.txt'
+        """
+        return f"page_{self.page}_{self.index}.txt"
+
+
+def parse_file_name(file_name):
+    """This function is to get the page and paragraph numbers from the name of
+    a paragraph txt file.
+
+    Parameters
+    ----------
+    file_name : str
+        ex: 'page_3_0.txt'
+
+    Returns
+    -------
+    int, int
+        the page number and the number of the paragraph in the page
+    """
+    parts = file_name.split(".")[0].split("_")
+    return int(parts[1]), int(parts[2])
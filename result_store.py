@@ -0,0 +1,166 @@
+# Purpose:  This script is to keep all the translations of a job in one
+#           indexed SQLite file instead of one pickle per paragraph
+
+import sqlite3
+import threading
+
+class ResultStore:
+    """This class is to store the translations keyed by (document, page,
+    paragraph). Worker threads share one connection behind a lock, and WAL
+    mode lets several processes append to the same file.
+    """
+
+    def __init__(self, path):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str
+            the SQLite file, ex: after/results.sqlite
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # the primary key is the index for lookups and for the ordered merge:
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                document TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                paragraph INTEGER NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (document, page, paragraph)
+            )"""
+            )
+        self.conn.commit()
+
+    def put(self, document, page, paragraph, translation):
+        """This function is to save a translation, replacing the one of an
+        earlier run.
+
+        Parameters
+        ----------
+        document : str
+            the PDF file name
+        page : int
+            the page number
+        paragraph : int
+            the number of the paragraph in the page
+        translation : str
+            the translated paragraph
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (document, page, paragraph, translation)
+                )
+            self.conn.commit()
+
+    def get(self, document, page, paragraph):
+        """This function is to look up a translation.
+
+        Parameters
+        ----------
+        document : str
+            the PDF file name
+        page : int
+            the page number
+        paragraph : int
+            the number of the paragraph in the page
+
+        Returns
+        -------
+        str or None
+            the translated paragraph, None if it is not translated yet
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT translation FROM results WHERE document = ? AND page = ? AND paragraph = ?",
+                (document, page, paragraph)
+                ).fetchone()
+
+        return row[0] if row is not None else None
+
+    def contains(self, document, page, paragraph):
+        """This function is to check if a paragraph is translated.
+
+        Parameters
+        ----------
+        document : str
+            the PDF file name
+        page : int
+            the page number
+        paragraph : int
+            the number of the paragraph in the page
+
+        Returns
+        -------
+        bool
+            True if the translation is in the store
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM results WHERE document = ? AND page = ? AND paragraph = ?",
+                (document, page, paragraph)
+                ).fetchone()
+
+        return row is not None
+
+    def keys(self, document):
+        """This function is to get the translated paragraphs of a document in
+        page/paragraph order.
+
+        Parameters
+        ----------
+        document : str
+            the PDF file name
+
+        Returns
+        -------
+        list
+            (page, paragraph) tuples
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT page, paragraph FROM results WHERE document = ? ORDER BY page, paragraph",
+                (document,)
+                ).fetchall()
+
+    def iter_translations(self, document, batch_size = 256):
+        """This function is to yield the translations of a document in
+        page/paragraph order, a few rows at a time.
+
+        Parameters
+        ----------
+        document : str
+            the PDF file name
+        batch_size : int, optional
+            the rows fetched at a time, by default 256
+
+        Yields
+        ------
+        int, int, str
+            the page, the paragraph and the translation
+        """
+        # a separate connection, so the workers can keep writing meanwhile:
+        conn = sqlite3.connect(self.path, timeout = 30)
+        try:
+            cursor = conn.execute(
+                "SELECT page, paragraph, translation FROM results WHERE document = ? "
+                "ORDER BY page, paragraph",
+                (document,)
+                )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def close(self):
+        """This function is to close the SQLite connection.
+        """
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,192 @@
+# Purpose:  This script is to retry the API calls with exponential backoff,
+#           jitter and the server's Retry-After header
+
+import time
+import random
+import requests
+from email.utils import parsedate_to_datetime
+
+# HTTP status codes worth another try, every other 4xx is fatal:
+RETRYABLE_STATUS = {408, 409, 429}
+
+# errors without a status code (timeouts, dropped connections):
+RETRYABLE_ERRORS = (
+    requests.Timeout,
+    requests.ConnectionError,
+    # a stream cut off half way:
+    requests.exceptions.ChunkedEncodingError,
+    TimeoutError,
+    ConnectionError,
+    )
+
+class RetryError(Exception):
+    """This class is the error raised when an API call fails for good, either
+    because the error is fatal or because the retries run out.
+    """
+
+    def __init__(self, message, attempts, last_error):
+        super().__init__(message)
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+def get_status(err):
+    """This function is to get the HTTP status code of an error.
+
+    Parameters
+    ----------
+    err : Exception
+        the error raised by the API call
+
+    Returns
+    -------
+    int or None
+        the HTTP status code, None if the error has no response
+    """
+    status = getattr(err, 'http_status', None)
+    if status is None:
+        status = getattr(err, 'status_code', None)
+    return status
+
+
+def is_retryable(err):
+    """This function is to tell retryable errors (429, 5xx, timeouts) apart
+    from fatal ones (auth, bad request).
+
+    Parameters
+    ----------
+    err : Exception
+        the error raised by the API call
+
+    Returns
+    -------
+    bool
+        True if the call is worth another try
+    """
+    status = get_status(err)
+    if status is not None:
+        return (status in RETRYABLE_STATUS) or (status >= 500)
+
+    return isinstance(err, RETRYABLE_ERRORS)
+
+
+def get_retry_after(err):
+    """This function is to read the Retry-After header of an error response.
+
+    Parameters
+    ----------
+    err : Exception
+        the error raised by the API call
+
+    Returns
+    -------
+    float or None
+        the seconds the server asks us to wait, None if there is no header
+    """
+    headers = getattr(err, 'headers', None) or {}
+    # header names are case-insensitive:
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+
+        if 'retry-after' in headers:
+            value = headers['retry-after']
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                # an HTTP date:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+
+    except (TypeError, ValueError):
+        pass
+
+    return None
+
+
+class RetryPolicy:
+    """This class is to call a function again with exponential backoff and
+    full jitter until it succeeds or fails with a fatal error.
+    """
+
+    def __init__(self, max_retries = 6, base_delay = 1.0, max_delay = 60.0):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        max_retries : int, optional
+            the number of retries after the first attempt, by default 6
+        base_delay : float, optional
+            the backoff ceiling of the first retry in seconds, by default 1.0
+        max_delay : float, optional
+            the largest backoff in seconds, by default 60.0
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt, err):
+        """This function is to get the wait time before the next attempt.
+
+        Parameters
+        ----------
+        attempt : int
+            the number of attempts that failed so far, starting from 1
+        err : Exception
+            the error of the last attempt
+
+        Returns
+        -------
+        float
+            the seconds to wait
+        """
+        retry_after = get_retry_after(err)
+        if retry_after is not None:
+            # the server knows best, only add a little jitter so the
+            # workers do not come back at the same moment:
+            return retry_after + random.uniform(0, self.base_delay)
+
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def call(self, func, *args, on_retry = None, **kwargs):
+        """This function is to call func and retry it on retryable errors.
+
+        Parameters
+        ----------
+        func : callable
+            the function making the API call
+        on_retry : callable, optional
+            called as on_retry(attempt, err, wait) before each retry, by default None
+
+        Returns
+        -------
+        object
+            whatever func returns
+
+        Raises
+        ------
+        RetryError
+            if the error is fatal or the retries run out
+        """
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+
+            except Exception as err:
+                attempt += 1
+                if not is_retryable(err):
+                    raise RetryError(
+                        f"fatal error on attempt {attempt}: {err!r}", attempt, err
+                        ) from err
+                if attempt > self.max_retries:
+                    raise RetryError(
+                        f"giving up after {attempt} attempts: {err!r}", attempt, err
+                        ) from err
+
+                wait = self.get_delay(attempt, err)
+                if on_retry is not None:
+                    on_retry(attempt, err, wait)
+                time.sleep(wait)
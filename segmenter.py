@@ -0,0 +1,224 @@
+# Purpose:  This script is to split the text of a page into sentences, with a
+#           fast rule-based segmenter or NLTK, both aware of the abbreviations
+#           common in papers
+
+import re
+
+# lower case, without the final period; 'et al.' is caught by 'al'. Words
+# that often end a sentence (no, min, etc) are left out, a number after them
+# (No. 5) never starts a sentence anyway:
+DEFAULT_ABBREVIATIONS = frozenset([
+    'al', 'approx', 'cf', 'ch', 'chap', 'dept', 'dr', 'e.g', 'eds', 'eq', 'eqs', 'esp',
+    'fig', 'figs', 'i.e', 'jr', 'mr', 'mrs', 'nos', 'pp', 'prof', 'ref', 'refs', 'resp',
+    'sec', 'secs', 'sect', 'suppl', 'tab', 'vol', 'vols', 'vs', 'viz', 'w.r.t',
+    ])
+
+# the end of a sentence: . ! or ? (and closing quotes/brackets), spaces,
+# then the start of the next one (a capital letter, maybe after an opening
+# quote or bracket):
+BOUNDARY = re.compile(r"""([.!?]+)["')\]]*\s+(?=["'(\[]?[A-Z])""")
+
+# a dotted acronym, lower case without the final period: U.S., U.K., Ph.D.:
+ACRONYM = re.compile(r"[a-z]{1,2}(?:\.[a-z]{1,2})+")
+
+# the first word of the next sentence, maybe after an opening quote or bracket:
+NEXT_WORD = re.compile(r"""["'(\[]?([A-Za-z]+)""")
+
+# words that start a sentence far more often than they follow an acronym, so
+# 'in the U.S. The results' is split but 'the U.S. Army' is not:
+SENTENCE_STARTERS = frozenset([
+    'a', 'after', 'also', 'an', 'as', 'at', 'but', 'by', 'finally', 'first', 'for', 'from',
+    'furthermore', 'he', 'hence', 'her', 'his', 'however', 'i', 'if', 'in', 'it', 'its',
+    'moreover', 'on', 'our', 'she', 'since', 'so', 'such', 'that', 'the', 'their', 'then',
+    'there', 'these', 'they', 'this', 'those', 'thus', 'to', 'we', 'when', 'while', 'with',
+    ])
+
+class RuleSegmenter:
+    """This class is to split text into sentences with one regular expression
+    and an abbreviation list. A period does not end a sentence after a known
+    abbreviation (Fig., et al., e.g.), a single letter (an initial, J. Smith)
+    or a dotted acronym (U.S., Ph.D.) unless the next word starts a sentence.
+    """
+
+    name = 'rule'
+
+    def __init__(self, abbreviations = DEFAULT_ABBREVIATIONS):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        abbreviations : iterable, optional
+            the abbreviations, lower case without the final period, by default
+            DEFAULT_ABBREVIATIONS
+        """
+        self.abbreviations = frozenset(i.lower().rstrip('.') for i in abbreviations)
+
+    def is_abbreviation(self, text, end, next_start = None):
+        """This function is to check if the period at text[end] belongs to an
+        abbreviation instead of ending the sentence.
+
+        Parameters
+        ----------
+        text : str
+            the text
+        end : int
+            the index of the period
+        next_start : int, optional
+            the index of the next word, to tell if it starts a sentence after
+            a dotted acronym, by default None (an acronym never ends a sentence)
+
+        Returns
+        -------
+        bool
+            True if the word before the period is an abbreviation, an initial
+            or a dotted acronym not followed by the start of a sentence
+        """
+        start = text.rfind(" ", 0, end) + 1
+        # '(Fig.' or '[e.g.' -> 'fig', 'e.g':
+        word = text[start:end].lstrip("([\"'").lower()
+        if len(word) == 1 and word.isalpha():
+            return True
+        if word in self.abbreviations:
+            return True
+        if ACRONYM.fullmatch(word) is None:
+            return False
+        if next_start is None:
+            return True
+        next_word = NEXT_WORD.match(text, next_start)
+        return (next_word is None) or (next_word.group(1).lower() not in SENTENCE_STARTERS)
+
+    def segment(self, text):
+        """This function is to split a text into sentences.
+
+        Parameters
+        ----------
+        text : str
+            the text, ex: all the lines of a page joined by spaces
+
+        Returns
+        -------
+        list
+            the sentences (str)
+        """
+        sentences = []
+        start = 0
+        for match in BOUNDARY.finditer(text):
+            # only a single period can be part of an abbreviation:
+            if (match.group(1) == ".") and self.is_abbreviation(text, match.start(), match.end()):
+                continue
+            sentence = text[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+
+        rest = text[start:].strip()
+        if rest:
+            sentences.append(rest)
+
+        return sentences
+
+    def segment_batch(self, texts):
+        """This function is to split many texts (ex: all the pages) into sentences.
+
+        Parameters
+        ----------
+        texts : iterable
+            the texts
+
+        Returns
+        -------
+        list
+            the sentences of each text, in the same order
+        """
+        segment = self.segment
+        return [segment(text) for text in texts]
+
+
+class NLTKSegmenter:
+    """This class is to split text into sentences with NLTK's Punkt model,
+    with the same abbreviation list added to the ones it learned.
+    """
+
+    name = 'nltk'
+
+    def __init__(self, abbreviations = DEFAULT_ABBREVIATIONS, language = 'english'):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        abbreviations : iterable, optional
+            the abbreviations, lower case without the final period, by default
+            DEFAULT_ABBREVIATIONS
+        language : str, optional
+            the Punkt model, by default 'english'
+        """
+        # only loaded when this segmenter is used:
+        try:
+            from nltk.tokenize import PunktTokenizer
+            tokenizer = PunktTokenizer(language)
+        except ImportError:
+            # NLTK before 3.8.2:
+            import nltk
+            tokenizer = nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+        tokenizer._params.abbrev_types.update(i.lower().rstrip('.') for i in abbreviations)
+        self.tokenizer = tokenizer
+
+    def segment(self, text):
+        """This function is to split a text into sentences.
+
+        Parameters
+        ----------
+        text : str
+            the text, ex: all the lines of a page joined by spaces
+
+        Returns
+        -------
+        list
+            the sentences (str)
+        """
+        return self.tokenizer.tokenize(text)
+
+    def segment_batch(self, texts):
+        """This function is to split many texts (ex: all the pages) into sentences.
+
+        Parameters
+        ----------
+        texts : iterable
+            the texts
+
+        Returns
+        -------
+        list
+            the sentences of each text, in the same order
+        """
+        tokenize = self.tokenizer.tokenize
+        return [tokenize(text) for text in texts]
+
+
+SEGMENTERS = {
+    'rule': RuleSegmenter,
+    'nltk': NLTKSegmenter,
+    }
+
+def get_segmenter(segmenter = 'rule', abbreviations = DEFAULT_ABBREVIATIONS):
+    """This function is to get a segmenter by name.
+
+    Parameters
+    ----------
+    segmenter : str or object, optional
+        'rule' or 'nltk', or any object with segment(text) and
+        segment_batch(texts), which is returned as it is, by default 'rule'
+    abbreviations : iterable, optional
+        the abbreviations, by default DEFAULT_ABBREVIATIONS
+
+    Returns
+    -------
+    RuleSegmenter, NLTKSegmenter or the given object
+        the segmenter
+    """
+    if not isinstance(segmenter, str):
+        return segmenter
+    if segmenter not in SEGMENTERS:
+        raise ValueError(f"unknown segmenter: {segmenter}, choose from {', '.join(SEGMENTERS)}")
+    return SEGMENTERS[segmenter](abbreviations)
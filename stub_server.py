@@ -0,0 +1,374 @@
+# Purpose:  This script is to run a local stand-in of the ChatCompletion API,
+#           so the translation loop can be timed without calling OpenAI
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+def sample_latency(rng, latency, distribution = 'fixed'):
+    """This function is to draw the latency of one request.
+
+    Parameters
+    ----------
+    rng : random.Random
+        the random number generator
+    latency : float
+        the mean latency in seconds
+    distribution : str, optional
+        'fixed', 'uniform' (0 to 2x latency), 'exponential' or 'lognormal'
+        (a long tail, sigma 0.5), by default 'fixed'
+
+    Returns
+    -------
+    float
+        the seconds to wait before answering
+    """
+    if (latency <= 0) or (distribution == 'fixed'):
+        return max(latency, 0.0)
+    if distribution == 'uniform':
+        return rng.uniform(0, 2 * latency)
+    if distribution == 'exponential':
+        return rng.expovariate(1 / latency)
+    if distribution == 'lognormal':
+        sigma = 0.5
+        # mu is chosen so that the mean is latency:
+        return rng.lognormvariate(math.log(latency) - sigma ** 2 / 2, sigma)
+    raise ValueError(f"unknown latency distribution: {distribution}")
+
+
+class UsageWindow:
+    """This class is to enforce requests-per-minute and tokens-per-minute
+    limits on the server side over a sliding window of one minute, the way
+    the API answers 429 when an account goes over its limits.
+    """
+
+    def __init__(self, rpm = None, tpm = None):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        rpm : int, optional
+            the requests per minute, None for no limit, by default None
+        tpm : int, optional
+            the tokens per minute, None for no limit, by default None
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.calls = deque()
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def admit(self, tokens):
+        """This function is to count a request if it fits in the limits.
+
+        Parameters
+        ----------
+        tokens : int
+            the tokens of the request
+
+        Returns
+        -------
+        float
+            0 if the request is admitted, otherwise the seconds until it would fit
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and (self.calls[0][0] <= now - 60):
+                self.tokens -= self.calls.popleft()[1]
+
+            over_rpm = (self.rpm is not None) and (len(self.calls) + 1 > self.rpm)
+            over_tpm = (self.tpm is not None) and (self.tokens + tokens > self.tpm) and (len(self.calls) > 0)
+            if over_rpm or over_tpm:
+                return max(self.calls[0][0] + 60 - now, 0.001)
+
+            self.calls.append((now, tokens))
+            self.tokens += tokens
+            return 0.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """This class is to answer POST /v1/chat/completions with a fake
+    translation after a latency drawn from a distribution. It can also answer
+    429 over its rate limits or at random, and hang on a request to make the
+    client time out.
+    """
+
+    # set by StubServer:
+    latency = 1.0
+    latency_dist = 'fixed'
+    error_rate = 0.0
+    timeout_rate = 0.0
+    hang_seconds = 30.0
+    window = None
+    rng = random.Random()
+    stats = None
+    stats_lock = threading.Lock()
+
+    def count(self, name):
+        """This function is to add one to a server counter.
+
+        Parameters
+        ----------
+        name : str
+            'requests', 'ok', 'rate_limited', 'injected_429' or 'timeouts'
+        """
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def draw(self):
+        """This function is to draw a random number shared by the handler threads.
+
+        Returns
+        -------
+        float
+            a number in [0, 1)
+        """
+        with self.stats_lock:
+            return self.rng.random()
+
+    def send_json(self, status, payload, headers = None):
+        """This function is to send a JSON reply.
+
+        Parameters
+        ----------
+        status : int
+            the HTTP status
+        payload : dict
+            the JSON body
+        headers : dict, optional
+            extra headers, by default None
+        """
+        payload = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_rate_limited(self, retry_after, message):
+        """This function is to answer 429 with a Retry-After header.
+
+        Parameters
+        ----------
+        retry_after : float
+            the seconds the client should wait
+        message : str
+            the error message
+        """
+        self.send_json(
+            429,
+            {'error': {'message': message, 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+            {'retry-after-ms': str(int(retry_after * 1000)), 'retry-after': str(math.ceil(retry_after))}
+            )
+
+    def do_POST(self):
+        """This function is to answer a ChatCompletion request.
+        """
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        messages = body.get('messages', [])
+        prompt = " ".join(m.get('content', '') for m in messages)
+        self.count('requests')
+
+        # pretend the reply is the prompt text, ~4 characters per token:
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = min(prompt_tokens, body.get('max_tokens', 1024))
+
+        if self.draw() < self.error_rate:
+            self.count('injected_429')
+            self.send_rate_limited(0.2, "injected rate limit error")
+            return
+
+        if self.window is not None:
+            retry_after = self.window.admit(prompt_tokens + body.get('max_tokens', 1024))
+            if retry_after:
+                self.count('rate_limited')
+                self.send_rate_limited(retry_after, "rate limit reached for requests")
+                return
+
+        if self.draw() < self.timeout_rate:
+            # never answer, the client's read timeout has to fire:
+            self.count('timeouts')
+            time.sleep(self.hang_seconds)
+            self.close_connection = True
+            return
+
+        time.sleep(sample_latency(self.rng, self.latency, self.latency_dist))
+        self.count('ok')
+
+        content = prompt[-completion_tokens * 4:]
+        # a batch asks for a JSON array back:
+        if 'JSON array: [' in prompt:
+            content = prompt[prompt.index('JSON array: [') + len('JSON array: '):]
+        completion = {
+            'id': f"chatcmpl-stub-{time.time_ns()}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-3.5-turbo'),
+            'choices': [
+                {
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }
+            ],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+        if body.get('stream'):
+            self.send_stream(completion)
+            return
+
+        self.send_json(200, completion)
+
+    def send_stream(self, completion, piece_size = 16):
+        """This function is to send the reply as server-sent events, a few
+        characters per chunk, ending with the usage and [DONE].
+
+        Parameters
+        ----------
+        completion : dict
+            the reply of the request
+        piece_size : int, optional
+            the characters per chunk, by default 16
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        content = completion['choices'][0]['message']['content']
+        head = {k: completion[k] for k in ('id', 'created', 'model')}
+        chunks = [
+            {'choices': [{'index': 0, 'delta': {'content': content[i:i + piece_size]},
+                          'finish_reason': None}]}
+            for i in range(0, len(content), piece_size)
+            ]
+        chunks.append({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        chunks.append({'choices': [], 'usage': completion['usage']})
+
+        for chunk in chunks:
+            event = {**head, 'object': 'chat.completion.chunk', **chunk}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        """This function is to keep the request log quiet.
+        """
+        pass
+
+
+class StubServer:
+    """This class is to start and stop the stub server in a background thread.
+    """
+
+    def __init__(self, host = '127.0.0.1', port = 0, latency = 1.0, latency_dist = 'fixed',
+                 rpm = None, tpm = None, error_rate = 0.0, timeout_rate = 0.0, hang_seconds = 30.0,
+                 seed = None):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        host : str, optional
+            the host to bind, by default '127.0.0.1'
+        port : int, optional
+            the port to bind, 0 picks a free port, by default 0
+        latency : float, optional
+            the mean seconds each request takes, by default 1.0
+        latency_dist : str, optional
+            'fixed', 'uniform', 'exponential' or 'lognormal', by default 'fixed'
+        rpm : int, optional
+            answer 429 over this many requests per minute, by default None (no limit)
+        tpm : int, optional
+            answer 429 over this many tokens per minute (prompt + max_tokens),
+            by default None (no limit)
+        error_rate : float, optional
+            the share of requests answered with an injected 429, by default 0.0
+        timeout_rate : float, optional
+            the share of requests never answered, by default 0.0
+        hang_seconds : float, optional
+            how long a request that is never answered holds the connection,
+            keep it above the client's read timeout, by default 30.0
+        seed : int, optional
+            the seed of the latency and injection draws, by default None
+        """
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution: {latency_dist}")
+
+        self.stats = dict()
+        window = UsageWindow(rpm, tpm) if (rpm is not None) or (tpm is not None) else None
+        handler = type('Handler', (StubHandler,), {
+            'latency': latency,
+            'latency_dist': latency_dist,
+            'error_rate': error_rate,
+            'timeout_rate': timeout_rate,
+            'hang_seconds': hang_seconds,
+            'window': window,
+            'rng': random.Random(seed),
+            'stats': self.stats,
+            'stats_lock': threading.Lock()
+            })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.api_base = f"http://{host}:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        """This function is to serve requests in a background thread.
+
+        Returns
+        -------
+        str
+            the api_base to give to Translator
+        """
+        thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        thread.start()
+        return self.api_base
+
+    def stop(self):
+        """This function is to shut the server down.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "local ChatCompletion stub server")
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--latency', type = float, default = 1.0, help = "mean seconds per request")
+    parser.add_argument('--latency-dist', default = 'fixed', choices = LATENCY_DISTRIBUTIONS)
+    parser.add_argument('--rpm', type = int, default = None, help = "requests-per-minute limit")
+    parser.add_argument('--tpm', type = int, default = None, help = "tokens-per-minute limit")
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = "share of injected 429s")
+    parser.add_argument('--timeout-rate', type = float, default = 0.0, help = "share of unanswered requests")
+    parser.add_argument('--hang-seconds', type = float, default = 30.0)
+    parser.add_argument('--seed', type = int, default = None)
+    args = parser.parse_args()
+
+    server = StubServer(
+        args.host, args.port, args.latency, args.latency_dist, rpm = args.rpm, tpm = args.tpm,
+        error_rate = args.error_rate, timeout_rate = args.timeout_rate,
+        hang_seconds = args.hang_seconds, seed = args.seed
+        )
+    print(f"serving on {server.api_base}")
+    server.httpd.serve_forever()
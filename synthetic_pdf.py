@@ -0,0 +1,219 @@
+# Purpose:  This script is to write synthetic PDF files of any number of pages
+#           for the benchmarks, without a PDF library
+
+import random
+import argparse
+
+WORDS = (
+    "the model translation paragraph sentence result method data layer network training "
+    "accuracy error sample value table figure section approach baseline experiment token "
+    "attention encoder decoder corpus language performance measure signal analysis system "
+    "we show that this is a of in for with on by from to and or as are was were be"
+    ).split()
+
+# sentences that break naive sentence splitting:
+TRICKY = (
+    "As shown in Fig. 3, the error drops quickly.",
+    "Smith et al. report similar values, e.g. in Table 2.",
+    "The rate is approx. 3.5 times higher than in Sec. 4.1 of the paper.",
+    )
+
+# US letter, in points:
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+def make_sentence(rng, min_words = 8, max_words = 24):
+    """This function is to make a random English-looking sentence.
+
+    Parameters
+    ----------
+    rng : random.Random
+        the random number generator
+    min_words : int, optional
+        the fewest words, by default 8
+    max_words : int, optional
+        the most words, by default 24
+
+    Returns
+    -------
+    str
+        the sentence
+    """
+    if rng.random() < 0.1:
+        return rng.choice(TRICKY)
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def wrap(text, width = 95):
+    """This function is to break a paragraph into lines of at most width characters.
+
+    Parameters
+    ----------
+    text : str
+        the paragraph
+    width : int, optional
+        the characters per line, by default 95
+
+    Returns
+    -------
+    list
+        the lines
+    """
+    lines, line = [], ""
+    for word in text.split():
+        if line and (len(line) + 1 + len(word) > width):
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def escape(text):
+    """This function is to escape a string for a PDF text operator.
+
+    Parameters
+    ----------
+    text : str
+        the text
+
+    Returns
+    -------
+    str
+        the text with backslashes and parentheses escaped
+    """
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, page_num, n_pages, lines_per_page = 46):
+    """This function is to make the body lines of a page: paragraphs of
+    random sentences, separated by an empty line.
+
+    Parameters
+    ----------
+    rng : random.Random
+        the random number generator
+    page_num : int
+        the page index
+    n_pages : int
+        the number of pages of the document
+    lines_per_page : int, optional
+        the body lines of a page, by default 46
+
+    Returns
+    -------
+    list
+        the lines of the page, '' for the space between paragraphs
+    """
+    lines = []
+    if page_num == 0:
+        lines += ["Synthetic Benchmark Document", "", "Abstract", ""]
+    while len(lines) < lines_per_page:
+        paragraph = " ".join(make_sentence(rng) for _ in range(rng.randint(2, 6)))
+        lines += wrap(paragraph) + [""]
+    lines = lines[:lines_per_page]
+    if page_num == n_pages - 1:
+        lines += ["", "End of the synthetic document."]
+    return lines
+
+
+def make_pdf(path, n_pages, seed = 0, running_header = True, rotate = 0, origin = (0, 0),
+             empty_pages = (), headings = None):
+    """This function is to write a PDF file of n_pages pages of text in the
+    standard Helvetica font, readable by pdfium.
+
+    Parameters
+    ----------
+    path : str
+        the PDF file to write
+    n_pages : int
+        the number of pages
+    seed : int, optional
+        the seed of the text, the same seed gives the same file, by default 0
+    running_header : bool, optional
+        if it is True, every page has the same header line and a page number
+        footer, like a journal paper, by default True
+    rotate : int, optional
+        the /Rotate of every page, 0, 90, 180 or 270 degrees, by default 0
+    origin : tuple, optional
+        the lower-left corner of the media box, the text moving with it, by
+        default (0, 0)
+    empty_pages : iterable, optional
+        the page indices without body text, only the running header and
+        footer, like a figure page, by default ()
+    headings : dictionary, optional
+        page index as the key and a section heading put at the top of the page
+        as the value, ex: {5: 'References'}, by default None
+
+    Returns
+    -------
+    str
+        the path of the PDF file
+    """
+    rng = random.Random(seed)
+
+    # objects 1-3 are the catalog, the page tree and the font, then a page
+    # and its content stream for each page:
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_num in range(n_pages):
+        ops = [f"1 0 0 1 {origin[0]} {origin[1]} cm", "BT", "/F1 10 Tf", "13 TL", f"60 {PAGE_HEIGHT - 60} Td"]
+        lines = page_lines(rng, page_num, n_pages) if page_num not in empty_pages else []
+        if (headings is not None) and (page_num in headings):
+            lines = [headings[page_num], ""] + lines
+        for line in lines:
+            ops.append(f"({escape(line)}) Tj T*")
+        ops.append("ET")
+        if running_header:
+            ops += [
+                "BT /F1 8 Tf 60 760 Td (Synthetic Journal of Benchmarks, Vol. 1) Tj ET",
+                f"BT /F1 8 Tf 300 36 Td ({page_num + 1}) Tj ET"
+                ]
+        stream = "\n".join(ops).encode('latin-1')
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [%d %d %d %d] /Rotate %d "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (origin[0], origin[1], origin[0] + PAGE_WIDTH, origin[1] + PAGE_HEIGHT, rotate, content_id)
+            )
+        page_ids.append(len(objects))
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode('ascii')
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % n_pages
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for i, obj in enumerate(objects, start = 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n" % (len(objects) + 1))
+        f.write(b"0000000000 65535 f \n")
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objects) + 1))
+        f.write(b"startxref\n%d\n%%%%EOF\n" % xref)
+
+    return path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "write a synthetic PDF file")
+    parser.add_argument('path', help = "the PDF file to write")
+    parser.add_argument('--pages', type = int, default = 10)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--no-header', action = 'store_true', help = "leave out the running header")
+    parser.add_argument('--rotate', type = int, default = 0, choices = [0, 90, 180, 270])
+    args = parser.parse_args()
+
+    make_pdf(args.path, args.pages, args.seed, running_header = not args.no_header, rotate = args.rotate)
+    print(f"wrote {args.pages} pages to {args.path}")
@@ -0,0 +1,259 @@
+# Purpose:  This script is to keep the translation results in an on-disk SQLite
+#           cache, so the same paragraph is never sent to the API twice
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# shared by every run and every document of the user:
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".translator_cache.sqlite")
+
+class TranslationCache:
+    """This class is to store API results keyed by a hash of everything that
+    changes the translation: the paragraph text, target language, model,
+    prompt template and sampling parameters.
+    """
+
+    def __init__(self, path = DEFAULT_CACHE_PATH, max_bytes = 512 * 1024 ** 2, max_age_days = 180):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str, optional
+            the SQLite file, by default ~/.translator_cache.sqlite
+        max_bytes : int, optional
+            the size of the cached results before the least recently used
+            ones are evicted, by default 512 MB
+        max_age_days : float, optional
+            the age of an entry before it is evicted, None keeps entries
+            forever, by default 180
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.puts_since_evict = 0
+        self.lock = threading.Lock()
+
+        # one connection shared by the worker threads, guarded by the lock:
+        self.conn = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        # WAL lets several runs read and write the same file:
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+            )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_used ON translations (last_used)"
+            )
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(text, language, model, prompt_template, params):
+        """This function is to hash everything that changes the translation.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph for translation
+        language : str
+            the target language
+        model : str
+            the ChatCompletion model
+        prompt_template : str
+            the prompt before the text is filled in
+        params : dict
+            the sampling parameters (temperature, max_tokens, ...)
+
+        Returns
+        -------
+        str
+            the sha256 hex digest
+        """
+        payload = json.dumps(
+            {
+                'text': text,
+                'language': language,
+                'model': model,
+                'prompt_template': prompt_template,
+                'params': params
+            },
+            sort_keys = True, ensure_ascii = False
+            )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """This function is to look up a cached result.
+
+        Parameters
+        ----------
+        key : str
+            the key from make_key
+
+        Returns
+        -------
+        dict or None
+            the cached API result, None on a miss
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+
+            if (row is not None) and self.is_expired(row[1]):
+                self.conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+            self.conn.commit()
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """This function is to store an API result.
+
+        Parameters
+        ----------
+        key : str
+            the key from make_key
+        value : dict
+            the API result (JSON serializable)
+        """
+        data = json.dumps(value, ensure_ascii = False)
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), now, now)
+                )
+            self.conn.commit()
+            self.puts_since_evict += 1
+            run_evict = self.puts_since_evict >= 100
+
+        if run_evict:
+            self.evict()
+
+    def is_expired(self, created):
+        """This function is to check if an entry is older than max_age_days.
+
+        Parameters
+        ----------
+        created : float
+            the timestamp the entry was stored
+
+        Returns
+        -------
+        bool
+            True if the entry is too old
+        """
+        if self.max_age_days is None:
+            return False
+        return (time.time() - created) > self.max_age_days * 86400
+
+    def evict(self):
+        """This function is to drop the entries older than max_age_days, then
+        the least recently used ones until the cache fits in max_bytes.
+
+        Returns
+        -------
+        int
+            the number of evicted entries
+        """
+        with self.lock:
+            self.puts_since_evict = 0
+            evicted = 0
+
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                cur = self.conn.execute("DELETE FROM translations WHERE created < ?", (cutoff,))
+                evicted += cur.rowcount
+
+            if self.max_bytes is not None:
+                total = self.conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM translations"
+                    ).fetchone()[0]
+
+                if total > self.max_bytes:
+                    # walk from the least recently used entry until enough is freed:
+                    rows = self.conn.execute(
+                        "SELECT key, size FROM translations ORDER BY last_used"
+                        )
+                    drop = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        drop.append((key,))
+                        total -= size
+                    self.conn.executemany("DELETE FROM translations WHERE key = ?", drop)
+                    evicted += len(drop)
+
+            self.conn.commit()
+
+        return evicted
+
+    def stats(self):
+        """This function is to get the hit/miss counters and the cache size.
+
+        Returns
+        -------
+        dict
+            hits, misses, hit_rate, entries and bytes
+        """
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translations"
+                ).fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'entries': entries,
+            'bytes': size
+            }
+
+    def close(self):
+        """This function is to close the SQLite connection.
+        """
+        with self.lock:
+            self.conn.close()
+
+
+def mark_cache_hit(result):
+    """This function is to turn a cached API result into the result of this
+    request: no tokens were spent, so the usage is zero.
+
+    Parameters
+    ----------
+    result : dict
+        the cached API result
+
+    Returns
+    -------
+    dict
+        the result with zero usage and 'cached' set to True
+    """
+    result = dict(result)
+    result['usage'] = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    result['cached'] = True
+    return result
@@ -0,0 +1,375 @@
+# Purpose:  This script is to find stored translations of near-duplicate
+#           paragraphs (MinHash/LSH over word n-grams), so repeated methods
+#           sections and acknowledgements are not translated again
+
+import os
+import re
+import json
+import time
+import zlib
+import random
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import namedtuple
+from segmenter import RuleSegmenter
+
+DEFAULT_MEMORY_PATH = os.path.join(os.path.expanduser("~"), ".translator_memory.sqlite")
+
+# a Mersenne prime larger than any 32-bit shingle hash:
+PRIME = (1 << 61) - 1
+
+WORD = re.compile(r"\w+")
+
+# a stored paragraph found by lookup; sentences/translations are None when the
+# translation is not aligned sentence by sentence:
+MemoryMatch = namedtuple(
+    'MemoryMatch', ['similarity', 'source', 'translation', 'sentences', 'translations']
+    )
+
+def normalize(sentence):
+    """This function is to normalize a sentence for exact comparison, so
+    spacing and case differences from the PDF extraction do not matter.
+
+    Parameters
+    ----------
+    sentence : str
+        the sentence
+
+    Returns
+    -------
+    str
+        the lower-case words joined by single spaces
+    """
+    return " ".join(WORD.findall(sentence.lower()))
+
+
+def get_shingles(text, n = 3):
+    """This function is to get the word n-grams of a text.
+
+    Parameters
+    ----------
+    text : str
+        the paragraph
+    n : int, optional
+        the words per n-gram, by default 3
+
+    Returns
+    -------
+    set
+        the n-grams joined by spaces, the words if the text is shorter than n
+    """
+    words = WORD.findall(text.lower())
+    if len(words) < n:
+        return set(words)
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+class TranslationMemory:
+    """This class is to store paragraph translations in SQLite with a
+    MinHash signature, and find the most similar stored paragraph of the same
+    language and model. The signature is cut into bands; a paragraph is a
+    candidate when one of its bands lands in the same bucket (an indexed
+    integer column), so a lookup is a handful of index reads however many
+    paragraphs are stored.
+    """
+
+    def __init__(self, path = DEFAULT_MEMORY_PATH, reuse_threshold = 0.9, partial_threshold = 0.5,
+                 n_bands = 16, rows_per_band = 4, shingle_size = 3, max_candidates = 50):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str, optional
+            the SQLite file, by default ~/.translator_memory.sqlite
+        reuse_threshold : float, optional
+            the similarity (Jaccard of the word n-grams) from which the stored
+            translation is used as it is, by default 0.9
+        partial_threshold : float, optional
+            the similarity from which the sentences found in the stored
+            paragraph are reused and only the other sentences are sent, by default 0.5
+        n_bands : int, optional
+            the LSH bands, by default 16
+        rows_per_band : int, optional
+            the MinHash values per band, more rows find fewer but closer
+            candidates, by default 4
+        shingle_size : int, optional
+            the words per n-gram, by default 3
+        max_candidates : int, optional
+            the candidates compared per lookup, by default 50
+        """
+        self.path = path
+        self.reuse_threshold = reuse_threshold
+        self.partial_threshold = partial_threshold
+        self.n_bands = n_bands
+        self.rows_per_band = rows_per_band
+        self.shingle_size = shingle_size
+        self.max_candidates = max_candidates
+        self.segmenter = RuleSegmenter()
+        self.lock = threading.Lock()
+
+        # the same seed in every run, so the stored signatures stay comparable:
+        rng = random.Random(20230601)
+        n_hashes = n_bands * rows_per_band
+        self.hash_params = [(rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(n_hashes)]
+
+        # one connection shared by the worker threads, guarded by the lock:
+        self.conn = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                language TEXT NOT NULL,
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                sentences TEXT,
+                translations TEXT,
+                signature BLOB NOT NULL,
+                created REAL NOT NULL
+            )"""
+            )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands (bucket INTEGER NOT NULL, segment_id INTEGER NOT NULL)"
+            )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_bucket ON bands (bucket)")
+        self.conn.commit()
+
+    def split(self, text):
+        """This function is to split a paragraph into sentences, the unit the
+        partial matches work with.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph
+
+        Returns
+        -------
+        list
+            the sentences (str)
+        """
+        return self.segmenter.segment(text)
+
+    def get_signature(self, text):
+        """This function is to get the MinHash signature of a paragraph.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph
+
+        Returns
+        -------
+        list
+            n_bands * rows_per_band minimum hash values
+        """
+        # crc32 is stable between runs, unlike hash():
+        hashes = [zlib.crc32(i.encode('utf-8')) for i in get_shingles(text, self.shingle_size)]
+        if not hashes:
+            hashes = [0]
+        return [min((a * h + b) % PRIME for h in hashes) for a, b in self.hash_params]
+
+    def get_buckets(self, signature, language, model):
+        """This function is to get the LSH bucket of each band of a signature.
+
+        Parameters
+        ----------
+        signature : list
+            from get_signature
+        language : str
+            the target language, paragraphs of other languages never share a bucket
+        model : str
+            the ChatCompletion model
+
+        Returns
+        -------
+        list
+            one signed 64-bit bucket number per band
+        """
+        buckets = []
+        r = self.rows_per_band
+        for band in range(self.n_bands):
+            key = f"{language}|{model}|{band}|" + ",".join(map(str, signature[band * r:(band + 1) * r]))
+            digest = hashlib.blake2b(key.encode('utf-8'), digest_size = 8).digest()
+            buckets.append(int.from_bytes(digest, 'big', signed = True))
+        return buckets
+
+    def lookup(self, text, language, model):
+        """This function is to find the stored paragraph most similar to text.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph for translation
+        language : str
+            the target language
+        model : str
+            the ChatCompletion model
+
+        Returns
+        -------
+        MemoryMatch or None
+            the best match, None if no stored paragraph reaches partial_threshold
+        """
+        signature = self.get_signature(text)
+        buckets = self.get_buckets(signature, language, model)
+
+        # the candidates sharing the most bands first, the closest ones:
+        with self.lock:
+            ids = [i[0] for i in self.conn.execute(
+                f"SELECT segment_id FROM bands WHERE bucket IN ({','.join('?' * len(buckets))}) "
+                f"GROUP BY segment_id ORDER BY COUNT(*) DESC LIMIT {int(self.max_candidates)}",
+                buckets
+                )]
+            if not ids:
+                return None
+            rows = self.conn.execute(
+                f"SELECT id, signature FROM segments WHERE id IN ({','.join('?' * len(ids))}) "
+                "AND language = ? AND model = ?",
+                ids + [language, model]
+                ).fetchall()
+
+        # the share of equal MinHash values estimates the Jaccard similarity:
+        best_id, best = None, -1.0
+        for segment_id, blob in rows:
+            stored = array('Q', blob)
+            similarity = sum(1 for x, y in zip(signature, stored) if x == y) / len(signature)
+            if similarity > best:
+                best_id, best = segment_id, similarity
+
+        if (best_id is None) or (best < self.partial_threshold):
+            return None
+
+        with self.lock:
+            source, translation, sentences, translations = self.conn.execute(
+                "SELECT source, translation, sentences, translations FROM segments WHERE id = ?",
+                (best_id,)
+                ).fetchone()
+
+        # an exact copy needs no estimate:
+        if source == text:
+            best = 1.0
+
+        return MemoryMatch(
+            best, source, translation,
+            json.loads(sentences) if sentences is not None else None,
+            json.loads(translations) if translations is not None else None
+            )
+
+    def add(self, text, translation, language, model, sentences = None, translations = None):
+        """This function is to store the translation of a paragraph.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph
+        translation : str
+            its translation
+        language : str
+            the target language
+        model : str
+            the ChatCompletion model
+        sentences : list, optional
+            the sentences of the paragraph, by default None
+        translations : list, optional
+            the translation of each sentence, None if the translation is not
+            aligned sentence by sentence, by default None
+        """
+        signature = self.get_signature(text)
+        buckets = self.get_buckets(signature, language, model)
+        aligned = (sentences is not None) and (translations is not None)
+
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT INTO segments (language, model, source, translation, sentences, translations, "
+                "signature, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    language, model, text, translation,
+                    json.dumps(sentences, ensure_ascii = False) if aligned else None,
+                    json.dumps(translations, ensure_ascii = False) if aligned else None,
+                    array('Q', signature).tobytes(), time.time()
+                )
+                )
+            self.conn.executemany(
+                "INSERT INTO bands VALUES (?, ?)", [(i, cur.lastrowid) for i in buckets]
+                )
+            self.conn.commit()
+
+    def stats(self):
+        """This function is to get the number of stored paragraphs.
+
+        Returns
+        -------
+        dict
+            segments and bands
+        """
+        with self.lock:
+            segments = self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            bands = self.conn.execute("SELECT COUNT(*) FROM bands").fetchone()[0]
+        return {'segments': segments, 'bands': bands}
+
+    def close(self):
+        """This function is to close the SQLite connection.
+        """
+        with self.lock:
+            self.conn.close()
+
+
+def join_sentences(parts):
+    """This function is to join translated sentences into a paragraph, with a
+    space between them unless both sides are CJK characters.
+
+    Parameters
+    ----------
+    parts : list
+        the translated sentences
+
+    Returns
+    -------
+    str
+        the paragraph
+    """
+    text = ""
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if text and not (ord(text[-1]) >= 0x2E80 and ord(part[0]) >= 0x2E80):
+            text += " "
+        text += part
+    return text
+
+
+def make_memory_result(translation, model):
+    """This function is to make a ChatCompletion-shaped result for a
+    translation taken from the memory, so it is saved like any other. No
+    tokens were spent, so the usage is zero.
+
+    Parameters
+    ----------
+    translation : str
+        the stored translation
+    model : str
+        the ChatCompletion model
+
+    Returns
+    -------
+    dict
+        the result with zero usage and 'cached' set to True
+    """
+    return {
+        'id': None,
+        'object': 'chat.completion',
+        'model': model,
+        'choices': [
+            {
+                'index': 0,
+                'message': {'role': 'assistant', 'content': translation},
+                'finish_reason': 'stop'
+            }
+        ],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        'cached': True
+        }
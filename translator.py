@@ -1,31 +1,89 @@
 # This script is to make an API call and ask ChatGPT 3.5 to translate
 
 import os
+import json
 import time
-import pickle
-import openai
-import api_key # this is your API key
+import threading
 import platform
-import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rate_limiter import RateLimiter, estimate_tokens
+from retry import RetryPolicy, get_status
+from chat_client import ChatClient
+from config import get_api_key, get_api_base, MissingAPIKeyError
+from translation_cache import TranslationCache, DEFAULT_CACHE_PATH, mark_cache_hit
+from translation_memory import TranslationMemory, normalize, join_sentences, make_memory_result
+from job_manifest import JobManifest, IN_FLIGHT, DONE, FAILED
+from usage_ledger import UsageLedger, print_summary
+from result_store import ResultStore
+from records import parse_file_name
+from chunker import get_encoder, count_tokens
+from segmenter import RuleSegmenter
+from batching import make_batches, split_batch_response, make_paragraph_results
+from prompts import PROMPT_TEMPLATE, BATCH_PROMPT_TEMPLATE
+from estimator import estimate_run, print_estimate
+from ordered_writer import OrderedWriter
+from metrics import METRICS, timed
 
 class Translator:
     """This class is to use ChatGPT 3.5 to translate English to Traditional Chinese.
     """
     
-    def __init__(self, language):
+    def __init__(self, language, api_base = None, request_timeout = 120,
+                 cache_path = DEFAULT_CACHE_PATH, output_dir = None, document = "",
+                 pool_size = 8, connect_timeout = 10, stream = False, api_key = None,
+                 memory_path = None, memory_reuse = 0.9, memory_partial = 0.5, client = None):
         """Initiate the class
 
         Parameters
         ----------
         language : str
             the language you want ChatGPT to translate into
+        api_base : str, optional
+            the base URL of the API, ex: 'http://127.0.0.1:8000/v1' for the
+            local stub server, by default OPENAI_API_BASE, the config file or
+            the OpenAI API (see config.py)
+        request_timeout : float, optional
+            the seconds to wait for a reply before the API call is retried, by default 120
+        cache_path : str, optional
+            the SQLite translation cache shared by all runs and documents, None
+            turns the cache off, by default ~/.translator_cache.sqlite
+        output_dir : str, optional
+            the directory with the 'before' and 'after' directories, by default
+            the working directory
+        document : str, optional
+            the document key of the translations in the result store, for
+            several documents sharing one 'after' directory, by default ""
+        pool_size : int, optional
+            the HTTP connections kept open, the iterate functions match it to
+            their number of workers, by default 8
+        connect_timeout : float, optional
+            the seconds to open a connection, by default 10
+        stream : bool, optional
+            if it is True, the replies are streamed and the time to the first
+            token of every request is written to the run log, by default False
+        api_key : str, optional
+            the OpenAI API key, by default OPENAI_API_KEY, the config file or
+            api_key.py (see config.py); without one, only translations in the
+            cache can be used
+        memory_path : str, optional
+            the SQLite translation memory (see translation_memory.py), near
+            duplicates of stored paragraphs reuse their translation; None
+            turns it off, by default None
+        memory_reuse : float, optional
+            the similarity from which a stored translation is used as it is, by default 0.9
+        memory_partial : float, optional
+            the similarity from which only the sentences missing from the
+            stored paragraph are sent, by default 0.5
+        client : ChatClient, optional
+            an HTTP client shared with other translators (ex: one per document
+            of a corpus), by default a new one
         """
         # get OS
         os_type = platform.system()
         # get current working directory
-        parent_dir = os.path.abspath(os.getcwd())
+        parent_dir = os.path.abspath(output_dir if output_dir is not None else os.getcwd())
 
         if os_type == 'Windows':
             parent_dir = parent_dir + "\\"
@@ -34,13 +92,53 @@ class Translator:
             parent_dir = parent_dir + "/"
             path = parent_dir + "before/" 
         
-        # get api key:
-        key = api_key.api_key
+        # get api key, None is fine until an API call is needed:
+        key = get_api_key(api_key)
+        api_base = get_api_base(api_base)
         
         self.path = path
         self.parent_dir = parent_dir
         self.key = key
         self.language = language
+        self.api_base = api_base
+        self.request_timeout = request_timeout
+        # one pooled, keep-alive HTTP client shared by the worker threads:
+        if client is None:
+            client = ChatClient(
+                key, api_base = api_base, pool_size = pool_size,
+                connect_timeout = connect_timeout, read_timeout = request_timeout
+                )
+        self.client = client
+        self.model = "gpt-3.5-turbo"
+        self.params = {
+            'temperature': 0.2,
+            'max_tokens': 1024,
+            'top_p': 1,
+            'frequency_penalty': 0,
+            'presence_penalty': 0
+            }
+        self.cache = TranslationCache(cache_path) if cache_path is not None else None
+        self.memory = None
+        if memory_path is not None:
+            self.memory = TranslationMemory(
+                memory_path, reuse_threshold = memory_reuse, partial_threshold = memory_partial
+                )
+        # to split a paragraph whose reply is cut off at max_tokens:
+        self.segmenter = RuleSegmenter()
+        self.retry_policy = RetryPolicy()
+        self.limiter = None
+        self.manifest = None
+        self.ledger = None
+        self.results = None
+        self.document = document
+        self.batch_max_tokens = 2048
+        self.stream = stream
+        self.ttfts = []
+        self.writer = None
+        self.texts = dict()
+        self.metadata = None
+        self.failed_files = []
+        self.log_lock = threading.Lock()
     
     def create_directory(self):
         """This function is to create a directory in the parent_dir.
@@ -71,6 +169,12 @@ class Translator:
             # create a directory called 'after' under the parent_dir:
             # this directory is to save the translation result
             os.makedirs(self.log_path, exist_ok = True)
+            
+            # one indexed file for the translations of every paragraph:
+            self.results = ResultStore(f"{self.save_translation_path}results.sqlite")
+            
+            # one ledger for the token usage of every API call:
+            self.ledger = UsageLedger(f"{self.log_path}usage_ledger.jsonl")
         
         except FileExistsError:
             pass  
@@ -81,7 +185,9 @@ class Translator:
         Parameters
         ----------
         before : bool, optional
-            if it is True, we will get the metadata from 'before' directory, by default True
+            if it is True, we will get the metadata from 'before' directory,
+            otherwise the paragraphs of this job (get_metadata or
+            set_paragraphs) that are in the result store, by default True
             
         Returns
         -------
@@ -89,12 +195,19 @@ class Translator:
             the metadata of the given path
         """
         try:
-            if before == True:
-                file_lst = os.listdir(self.path)
-                file_lst = [ i for i in file_lst if (i.endswith('.txt')) & (i.startswith('page'))]
-            else:
-                file_lst = os.listdir(self.save_translation_path)
-                file_lst = [ i for i in file_lst if (i.endswith('.pickle')) & (i.startswith('page'))]
+            if before == False:
+                # only the paragraphs of this job, the store keeps the ones of
+                # earlier runs with another page range or paragraph size too:
+                if self.metadata is None:
+                    self.get_metadata()
+                stored = set(self.results.keys(self.document))
+                job = self.metadata
+                in_store = [(p, i) in stored for p, i in zip(job['page_num'], job['paragraph_num'])]
+                
+                return job[in_store].reset_index(drop = True)
+            
+            file_lst = os.listdir(self.path)
+            file_lst = [ i for i in file_lst if (i.endswith('.txt')) & (i.startswith('page'))]
             
             # print(file_lst)
             metadata = pd.DataFrame(file_lst, columns = ['file_name'])
@@ -102,10 +215,7 @@ class Translator:
             # get page number:
             metadata['page_num'] = metadata.file_name.map(lambda x: x.split('_')[1])
             # get paragraph number:
-            if before == True:
-                metadata['paragraph_num'] = metadata.file_name.map(lambda x: x.split("_")[-1].split('.')[0])
-            else:
-                metadata['paragraph_num'] = metadata.file_name.map(lambda x: x.split("_")[2])
+            metadata['paragraph_num'] = metadata.file_name.map(lambda x: x.split("_")[-1].split('.')[0])
                 
             #change dtype:
             num_col = ['page_num', 'paragraph_num']
@@ -125,6 +235,32 @@ class Translator:
         except Exception as err:
             print(err)
     
+    def set_paragraphs(self, paragraphs):
+        """This function is to take the paragraphs straight from the extractor
+        (PDF_to_Text.iter_paragraphs) instead of listing and reading the txt
+        files in the 'before' directory. Use it in place of get_metadata.
+
+        Parameters
+        ----------
+        paragraphs : iterable
+            Paragraph records in page/paragraph order
+
+        Returns
+        -------
+        Pandas Dataframe
+            the metadata of the paragraphs
+        """
+        texts = dict()
+        rows = []
+        for paragraph in paragraphs:
+            texts[paragraph.file_name] = paragraph.text
+            rows.append((paragraph.file_name, paragraph.page, paragraph.index))
+        
+        self.texts = texts
+        self.metadata = pd.DataFrame(rows, columns = ['file_name', 'page_num', 'paragraph_num'])
+        
+        return self.metadata
+    
     def read_txt_file(self, fname, before = True):
         """This function is to read a text file for translation.
 
@@ -141,6 +277,10 @@ class Translator:
             the paragraph for translation
         """
         try:
+            # paragraphs given by set_paragraphs are kept in memory:
+            if (before == True) and (fname in self.texts):
+                return self.texts[fname]
+            
             if before == True:
                 location = self.path + fname
             else:
@@ -153,51 +293,410 @@ class Translator:
         except Exception as err:
             print(err)
 
-    def translate(self, text):
+    @timed('translate')
+    def translate(self, text, fname = None):
         """This function is to make an API call to let ChatGPT 3.5 translate the
-        paragraph.
+        paragraph. Rate limits, server errors and timeouts are retried with
+        exponential backoff (see retry.py), and every retry is written to the
+        run log.
 
         Parameters
         ----------
         text : str
             the paragraph for translation
+        fname : str, optional
+            the text file of the paragraph, only used in the run log, by default None
 
         Returns
         -------
-        OpenAIObject, JSON
+        dict, JSON
             the return log and translation results from API call Chat Completion
+        
+        Raises
+        ------
+        RetryError
+            if the error is fatal (ex: auth, bad request) or the retries run out
+        ValueError
+            if the reply of a single sentence is cut off at max_tokens
         """
+        if self.memory is not None:
+            return self.translate_with_memory(text, fname)
+        
+        return self.translate_paragraph(text, fname)
+    
+    def translate_paragraph(self, text, fname = None):
+        """This function is to translate a paragraph in one API call. A reply
+        cut off at max_tokens is not kept: the paragraph is split in two at a
+        sentence boundary and each half is translated the same way.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph for translation
+        fname : str, optional
+            the text file of the paragraph, only used in the run log, by default None
+
+        Returns
+        -------
+        dict, JSON
+            the return log and translation results, with the usage of every
+            API call made for the paragraph
+        
+        Raises
+        ------
+        ValueError
+            if the reply of a single sentence is cut off at max_tokens
+        """
+        prompt = PROMPT_TEMPLATE.format(language = self.language, text = text)
+        result = self.request(prompt, text, PROMPT_TEMPLATE, fname)
+        
+        if result['choices'][0].get('finish_reason') != 'length':
+            return result
+        
+        sentences = self.segmenter.segment(text)
+        if len(sentences) < 2:
+            raise ValueError("the reply was cut off at max_tokens and the paragraph is a single sentence")
+        
+        self.write_run_log({
+            'event': 'split',
+            'file_name': fname,
+            'sentences': len(sentences),
+            'completion_tokens': (result.get('usage') or {}).get('completion_tokens')
+            })
+        
+        half = len(sentences) // 2
+        parts = [self.translate_paragraph(" ".join(i), fname) for i in (sentences[:half], sentences[half:])]
+        
+        # the cut-off reply was paid for too:
+        usage = {
+            k: sum((i.get('usage') or {}).get(k, 0) for i in [result] + parts)
+            for k in ('prompt_tokens', 'completion_tokens', 'total_tokens')
+            }
+        
+        result = dict(result)
+        result['choices'] = [
+            {
+                'index': 0,
+                'message': {
+                    'role': 'assistant',
+                    'content': join_sentences([i['choices'][0]['message']['content'].strip() for i in parts])
+                },
+                'finish_reason': 'stop'
+            }
+            ]
+        result['usage'] = usage
+        result['cached'] = all(i.get('cached', False) for i in [result] + parts)
+        return result
+    
+    def translate_with_memory(self, text, fname = None):
+        """This function is to look a paragraph up in the translation memory
+        before translating it. A near duplicate (memory_reuse) gives its stored
+        translation without an API call; a similar paragraph (memory_partial)
+        gives the translations of the sentences both have, and only the other
+        sentences are sent, as a JSON array. Without any sentence to reuse, the
+        paragraph is sent with the usual prompt. The new translation is added
+        to the memory.
+
+        Parameters
+        ----------
+        text : str
+            the paragraph for translation
+        fname : str, optional
+            the text file of the paragraph, only used in the run log, by default None
+
+        Returns
+        -------
+        dict, JSON
+            the return log and translation results, as from translate
+        """
+        match = self.memory.lookup(text, self.language, self.model)
+        
+        if (match is not None) and (match.similarity >= self.memory.reuse_threshold):
+            self.log_memory(fname, 'hit', match.similarity, 0)
+            return make_memory_result(match.translation, self.model)
+        
+        sentences = self.memory.split(text)
+        
+        # the sentences already translated in the stored paragraph:
+        known = dict()
+        if (match is not None) and (match.translations is not None):
+            known = {normalize(s): t for s, t in zip(match.sentences, match.translations)}
+        missing = [s for s in sentences if normalize(s) not in known]
+        
+        self.log_memory(
+            fname, 'partial' if known else 'miss',
+            match.similarity if match is not None else None, len(missing)
+            )
+        
+        if not known:
+            # nothing to reuse, the paragraph is translated as usual:
+            result = self.translate_paragraph(text, fname)
+            self.memory.add(text, result['choices'][0]['message']['content'].strip(), self.language, self.model)
+            return result
+        
+        if missing:
+            result, translations = self.translate_sentences(missing, text, fname)
+        else:
+            result, translations = make_memory_result(None, self.model), []
+        
+        if translations is None:
+            # the reply could not be split per sentence, result is the whole paragraph:
+            translation = result['choices'][0]['message']['content'].strip()
+            self.memory.add(text, translation, self.language, self.model)
+            return result
+        
+        known.update(zip(map(normalize, missing), translations))
+        translations = [known[normalize(s)] for s in sentences]
+        translation = join_sentences(translations)
+        self.memory.add(text, translation, self.language, self.model, sentences, translations)
+        
+        result = dict(result)
+        result['choices'] = [
+            {
+                'index': 0,
+                'message': {'role': 'assistant', 'content': translation},
+                'finish_reason': 'stop'
+            }
+            ]
+        return result
+    
+    def translate_sentences(self, sentences, text, fname = None):
+        """This function is to translate sentences in one API call, sent as a
+        JSON array so the reply can be stored sentence by sentence. If the
+        reply cannot be split, the paragraph is translated as it is instead.
+
+        Parameters
+        ----------
+        sentences : list
+            the sentences for translation
+        text : str
+            the whole paragraph, for the fallback
+        fname : str, optional
+            the text file of the paragraph, only used in the run log, by default None
+
+        Returns
+        -------
+        dict, list or None
+            the ChatCompletion result and the translation of each sentence,
+            None if the paragraph was translated as it is
+        """
+        segments = json.dumps(sentences, ensure_ascii = False)
+        prompt = BATCH_PROMPT_TEMPLATE.format(
+            language = self.language, n_segments = len(sentences), text = segments
+            )
+        result = self.request(prompt, segments, BATCH_PROMPT_TEMPLATE, fname)
+        
         try:
-            openai.api_key = self.key
-            
-            completion = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {'role': 'user',
-                            'content': f"Please translate the text from \
-                                English to {self.language},\
-                                and return only translated text, \
-                                not include the origin text,\
-                                here is the text: {text}"
-                            }
-                                ],
-                        temperature=0.2,
-                        max_tokens=1024,
-                        top_p=1,
-                        frequency_penalty=0,
-                        presence_penalty=0
+            if result['choices'][0].get('finish_reason') == 'length':
+                raise ValueError("the reply was cut off at max_tokens")
+            return result, split_batch_response(result['choices'][0]['message']['content'], len(sentences))
+        
+        except ValueError as err:
+            self.write_run_log({
+                'event': 'memory_fallback',
+                'file_name': fname,
+                'message': str(err)
+                })
+            return self.translate_paragraph(text, fname), None
+    
+    def log_memory(self, fname, outcome, similarity, n_sent):
+        """This function is to record a translation memory lookup in the run
+        log and the metrics.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        outcome : str
+            'hit', 'partial' or 'miss'
+        similarity : float or None
+            the similarity of the best stored paragraph
+        n_sent : int
+            the sentences sent to the API
+        """
+        METRICS.inc('memory_total', result = outcome)
+        self.write_run_log({
+            'event': 'memory',
+            'file_name': fname,
+            'result': outcome,
+            'similarity': round(similarity, 3) if similarity is not None else None,
+            'sentences_sent': n_sent
+            })
+    
+    def request(self, prompt, text, prompt_template, fname = None, **params):
+        """This function is to send one ChatCompletion request, going through
+        the translation cache, the rate limiter and the retry policy.
+
+        Parameters
+        ----------
+        prompt : str
+            the prompt with the text filled in
+        text : str
+            the text for translation, part of the cache key
+        prompt_template : str
+            the prompt before the text is filled in, part of the cache key
+        fname : str, optional
+            the text file(s) of the request, only used in the run log, by default None
+        **params
+            sampling parameters replacing the ones in self.params
+
+        Returns
+        -------
+        dict, JSON
+            the return log and translation results from API call Chat Completion
+        
+        Raises
+        ------
+        RetryError
+            if the error is fatal (ex: auth, bad request) or the retries run out
+        """
+        params = {**self.params, **params}
+        
+        # the same paragraph with the same settings is never sent twice:
+        if self.cache is not None:
+            key = TranslationCache.make_key(
+                text, self.language, self.model, prompt_template, params
+                )
+            cached = self.cache.get(key)
+            METRICS.inc('cache_total', result = 'miss' if cached is None else 'hit')
+            if cached is not None:
+                return mark_cache_hit(cached)
+        
+        def on_retry(attempt, err, wait):
+            self.log_retry(fname, attempt, err, wait)
+        
+        create = self.client.create_stream if self.stream else self.client.create
+        
+        def attempt(**kwargs):
+            # every attempt, a retry too, waits for the rate limits, max_tokens
+            # of the reply also counts:
+            if self.limiter is not None:
+                self.limiter.acquire(
+                    estimate_tokens(prompt, completion_tokens = params['max_tokens'])
+                    )
+            return create(**kwargs)
+        
+        if self.key is None:
+            raise MissingAPIKeyError()
+        
+        METRICS.add_gauge('requests_in_flight', 1)
+        begin = time.perf_counter()
+        try:
+            completion = self.retry_policy.call(
+                        attempt,
+                        on_retry=on_retry,
+                        model=self.model,
+                        messages=[{'role': 'user', 'content': prompt}],
+                        **params
                         )
-            return completion
+        except Exception:
+            METRICS.inc('requests_total', outcome = 'failed')
+            raise
+        finally:
+            METRICS.add_gauge('requests_in_flight', -1)
+            METRICS.observe('request_seconds', time.perf_counter() - begin, model = self.model)
         
-        except Exception as err:
-            print(err)
+        if self.stream:
+            self.log_stream(fname, prompt, completion)
+        
+        usage = completion.get('usage') or {}
+        METRICS.inc('requests_total', outcome = 'ok')
+        METRICS.inc('tokens_total', usage.get('prompt_tokens', 0), kind = 'prompt')
+        METRICS.inc('tokens_total', usage.get('completion_tokens', 0), kind = 'completion')
+        
+        # a reply cut off at max_tokens is not kept, the caller splits the text:
+        if (self.cache is not None) and (completion['choices'][0].get('finish_reason') != 'length'):
+            self.cache.put(key, completion)
+        
+        return completion
+    
+    def write_run_log(self, record):
+        """This function is to append one event to the run log
+        (after/log/run_log.jsonl).
+
+        Parameters
+        ----------
+        record : dict
+            the event to log
+        """
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), **record}
+        with self.log_lock:
+            with open(f"{self.log_path}run_log.jsonl", 'a', encoding = 'utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+    
+    def log_stream(self, fname, prompt, completion):
+        """This function is to record the time to the first token of a
+        streamed reply in the run log. A server that does not send the usage
+        with the stream gets it counted from the prompt and the reply.
+
+        Parameters
+        ----------
+        fname : str
+            the text file(s) of the request
+        prompt : str
+            the prompt with the text filled in
+        completion : dict, JSON
+            the ChatCompletion result from ChatClient.create_stream
+        """
+        if not completion.get('usage'):
+            encoder = get_encoder(self.model)
+            prompt_tokens = count_tokens(prompt, encoder)
+            completion_tokens = count_tokens(completion['choices'][0]['message']['content'], encoder)
+            completion['usage'] = {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+                }
+        
+        with self.log_lock:
+            if completion['ttft'] is not None:
+                self.ttfts.append(completion['ttft'])
+        
+        self.write_run_log({
+            'event': 'stream',
+            'file_name': fname,
+            'ttft': round(completion['ttft'], 3) if completion['ttft'] is not None else None,
+            'elapsed': round(completion['elapsed'], 3),
+            'completion_tokens': completion['usage']['completion_tokens']
+            })
+    
+    def log_retry(self, fname, attempt, err, wait):
+        """This function is to record a retry in the run log. On a 429 every
+        worker is held back for the wait time, not only the one that got it.
 
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        attempt : int
+            the number of attempts that failed so far
+        err : Exception
+            the error of the last attempt
+        wait : float
+            the seconds before the next attempt
+        """
+        status = get_status(err)
+        METRICS.inc('errors_total', type = type(err).__name__, status = status, outcome = 'retried')
+        self.write_run_log({
+            'event': 'retry',
+            'file_name': fname,
+            'attempt': attempt,
+            'error': type(err).__name__,
+            'status': status,
+            'message': str(err),
+            'wait': round(wait, 3)
+            })
+        
+        if (status == 429) and (self.limiter is not None):
+            self.limiter.pause(wait)
+    
+    @timed('get_translation')
     def get_translation(self, result, original_filename):
         """This function is to save the log and extract the translation text.
 
         Parameters
         ----------
-        result : OpenAIObject, JSON
+        result : dict, JSON
             the return log and translation results from API call Chat Completion
         original_filename : str
             the orignal text file for translation
@@ -214,52 +713,524 @@ class Translator:
             translation_content = result["choices"][0]["message"]["content"].strip()
             # print("finishing translation_content")
             
-            # save the translation content:
-            fname = original_filename.split(".")[0]
-            location = f"{self.save_translation_path}{fname}_translation.pickle"
-            
-            with open(location, 'ab') as f:
-                pickle.dump(translation_content, f)
+            # save the translation content, a re-run replaces the old result:
+            page, idx = parse_file_name(original_filename)
+            self.results.put(self.document, page, idx, translation_content)
             
             return df, translation_content
         
         except Exception as err:
             print(err)
     
-    def iterate(self):
+    def iterate(self, rpm = 3500, tpm = 90000, progressive = False):
         """This function is to iterate all the text files and make API call to 
         let ChatGPT translate the text into Traditional Chinese.
 
+        Parameters
+        ----------
+        rpm : int, optional
+            the requests-per-minute limit of your OpenAI account, by default 3500
+        tpm : int, optional
+            the tokens-per-minute limit of your OpenAI account, by default 90000
+        progressive : bool, optional
+            if it is True, after/merge_translation.txt is written while the
+            paragraphs are translated (see open_progressive_output), by default False
+
         Returns
         -------
         Pandas Dataframe, str
             the df with API log and the translation text
         """
         try:
-            for i in tqdm(range(len(self.metadata))):
-                
-                time.sleep(3)
-                fname = self.metadata['file_name'].iloc[i]
-                # read paragraph:
-                doc = self.read_txt_file(fname)
-                # API call ChatGPT to translate:
-                result = self.translate(doc)
-                # print("finishing translation")
-                
-                # get translation results:
-                df_log, translation_content = self.get_translation(result, fname)
+            self.limiter = RateLimiter(rpm = rpm, tpm = tpm)
+            self.failed_files = []
+            df_log, translation_content = None, None
+            pending = self.get_pending_files()
+            if progressive:
+                self.open_progressive_output(pending)
+            
+            for fname in tqdm(pending):
                 
-                # save df_log:
-                log_fname = fname.split('.')[0]
-                location = f"{self.log_path}{log_fname}_log.csv"
-                df_log.to_csv(location, index = False)
+                try:
+                    df_log, translation_content = self.translate_file(fname)
+                except Exception as err:
+                    self.log_failure(fname, err)
             
+            self.close_progressive_output()
+            self.report_failures()
             return df_log, translation_content
             # return doc
         
         except Exception as err:
             print(err)
     
+    def translate_file(self, fname):
+        """This function is to translate one paragraph txt file and save the
+        translation and its token usage.
+
+        Parameters
+        ----------
+        fname : str
+            the text file for translation
+
+        Returns
+        -------
+        Pandas Dataframe, str
+            the df with API log and the translation text
+        """
+        if self.manifest is not None:
+            self.manifest.set_state(fname, IN_FLIGHT)
+        
+        # read paragraph:
+        doc = self.read_txt_file(fname)
+        # API call ChatGPT to translate:
+        result = self.translate(doc, fname)
+        # print("finishing translation")
+        
+        return self.save_result(result, fname)
+    
+    def save_result(self, result, fname):
+        """This function is to save the translation of a paragraph, add its
+        token usage to the ledger and mark it done in the job manifest.
+
+        Parameters
+        ----------
+        result : dict, JSON
+            the return log and translation results from API call Chat Completion
+        fname : str
+            the text file for translation
+
+        Returns
+        -------
+        Pandas Dataframe, str
+            the df with API log and the translation text
+        """
+        # get translation results:
+        df_log, translation_content = self.get_translation(result, fname)
+        
+        # add the token usage to the ledger:
+        self.ledger.record(fname, result)
+        
+        # show it in the merged file as soon as the paragraphs before it are done:
+        if self.writer is not None:
+            self.writer.add(fname, translation_content)
+        
+        METRICS.add_gauge('paragraphs_remaining', -1)
+        
+        # only marked done once the translation is on disk:
+        if self.manifest is not None:
+            self.manifest.set_state(fname, DONE)
+        
+        return df_log, translation_content
+    
+    def get_pending_files(self):
+        """This function is to open the job manifest (after/job_manifest.jsonl)
+        and get the text files that still need translating. Paragraphs done in
+        an earlier run are skipped, unless their text changed or their
+        translation file is missing.
+
+        Returns
+        -------
+        list
+            the text files for translation, in page/paragraph order
+        """
+        if self.manifest is None:
+            self.manifest = JobManifest(f"{self.save_translation_path}job_manifest.jsonl")
+        
+        file_lst = list(self.metadata['file_name'])
+        pending = []
+        for fname in file_lst:
+            doc = self.read_txt_file(fname)
+            if self.needs_translation(fname, doc):
+                pending.append(fname)
+        
+        METRICS.add_gauge('paragraphs_remaining', len(pending))
+        
+        if len(pending) < len(file_lst):
+            print(f"resuming job: {len(file_lst) - len(pending)} paragraph(s) already translated, "
+                  f"{len(pending)} to go")
+        
+        return pending
+    
+    def needs_translation(self, fname, doc):
+        """This function is to add a paragraph to the job manifest and check if
+        it still needs translating.
+
+        Parameters
+        ----------
+        fname : str
+            the text file for translation
+        doc : str
+            the paragraph
+
+        Returns
+        -------
+        bool
+            False if it was translated in an earlier run and the translation
+            is in the result store
+        """
+        state = self.manifest.register(fname, doc)
+        page, idx = parse_file_name(fname)
+        
+        return not ((state == DONE) and self.results.contains(self.document, page, idx))
+    
+    def log_failure(self, fname, err):
+        """This function is to record a paragraph that could not be translated.
+
+        Parameters
+        ----------
+        fname : str
+            the text file for translation
+        err : Exception
+            the error raised while translating it
+        """
+        print(f"{fname}: {err}")
+        self.failed_files.append(fname)
+        last_error = getattr(err, 'last_error', err)
+        METRICS.inc('errors_total', type = type(last_error).__name__, status = get_status(last_error),
+                    outcome = 'failed')
+        METRICS.add_gauge('paragraphs_remaining', -1)
+        if self.writer is not None:
+            self.writer.skip(fname)
+        if self.manifest is not None:
+            self.manifest.set_state(fname, FAILED, error = str(err))
+        self.write_run_log({
+            'event': 'failed',
+            'file_name': fname,
+            'error': type(last_error).__name__,
+            'message': str(err)
+            })
+    
+    def report_failures(self, run_totals = True):
+        """This function is to print the paragraphs that could not be translated
+        and the translation cache counters, and write the metrics of the run
+        to after/log/metrics.json.
+
+        Parameters
+        ----------
+        run_totals : bool, optional
+            if it is False, only the failures, usage totals and time to first
+            token of this document are reported, for a run over several
+            documents sharing the metrics and the cache, by default True
+        """
+        if self.failed_files:
+            print(f"{len(self.failed_files)} paragraph(s) failed, see {self.log_path}run_log.jsonl:")
+            print(", ".join(self.failed_files))
+        
+        if self.ledger is not None:
+            self.ledger.save_totals()
+        
+        if self.ttfts:
+            ttfts = sorted(self.ttfts)
+            print(f"time to first token: p50 {ttfts[len(ttfts) // 2]:.2f}s, "
+                  f"p95 {ttfts[min(int(len(ttfts) * 0.95), len(ttfts) - 1)]:.2f}s, "
+                  f"max {ttfts[-1]:.2f}s over {len(ttfts)} streamed request(s)")
+        
+        if not run_totals:
+            return
+        
+        METRICS.write_json(f"{self.log_path}metrics.json")
+        
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print(f"translation cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['entries']} entries ({stats['bytes'] / 1024 ** 2:.1f} MB)")
+        
+        if self.memory is not None:
+            print(f"translation memory: {self.memory.stats()['segments']} paragraphs stored")
+    
+    def iterate_concurrent(self, max_workers = 8, rpm = 3500, tpm = 90000, progressive = False):
+        """This function is to translate all the text files with several API
+        calls in flight at the same time, instead of one by one. The results
+        are saved under the same page/paragraph file names as iterate, so
+        merge_files works the same way.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            the number of API calls in flight, by default 8
+        rpm : int, optional
+            the requests-per-minute limit of your OpenAI account, by default 3500
+        tpm : int, optional
+            the tokens-per-minute limit of your OpenAI account, by default 90000
+        progressive : bool, optional
+            if it is True, after/merge_translation.txt is written while the
+            paragraphs are translated (see open_progressive_output), by default False
+
+        Returns
+        -------
+        Pandas Dataframe, str
+            the df with API log and the translation text of the last paragraph
+        """
+        try:
+            self.limiter = RateLimiter(rpm = rpm, tpm = tpm)
+            self.client.set_pool_size(max_workers)
+            self.failed_files = []
+            
+            file_lst = self.get_pending_files()
+            if progressive:
+                self.open_progressive_output(file_lst)
+            results = dict()
+            
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                futures = {executor.submit(self.translate_file, fname): fname for fname in file_lst}
+                for future in tqdm(as_completed(futures), total = len(futures)):
+                    fname = futures[future]
+                    try:
+                        results[fname] = future.result()
+                    except Exception as err:
+                        self.log_failure(fname, err)
+            
+            self.close_progressive_output()
+            self.report_failures()
+            
+            # keep the same return as iterate (the last paragraph in order):
+            for fname in reversed(file_lst):
+                if fname in results:
+                    return results[fname]
+        
+        except Exception as err:
+            print(err)
+    
+    def open_progressive_output(self, pending):
+        """This function is to start writing after/merge_translation.txt while
+        the paragraphs are translated: a paragraph is added as soon as it and
+        all the paragraphs before it are finished, so a reader can start on
+        the first pages of a long document. Paragraphs translated in an
+        earlier run are taken from the result store. merge_files rewrites
+        the same file at the end.
+
+        Parameters
+        ----------
+        pending : list
+            the text files still to translate, from get_pending_files
+        """
+        file_lst = list(self.metadata['file_name'])
+        self.writer = OrderedWriter(
+            f"{self.save_translation_path}merge_translation.txt",
+            file_lst, list(self.metadata['page_num'])
+            )
+        
+        pending = set(pending)
+        for fname in file_lst:
+            if fname not in pending:
+                page, idx = parse_file_name(fname)
+                self.writer.add(fname, self.results.get(self.document, page, idx))
+    
+    def close_progressive_output(self):
+        """This function is to close the merged file opened by
+        open_progressive_output, if any.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+    
+    def iterate_stream(self, paragraphs, max_workers = 8, rpm = 3500, tpm = 90000):
+        """This function is to translate paragraphs while they are still being
+        extracted (see pipeline.py). A paragraph is only taken from the
+        iterable when a worker is free, so a bounded queue behind it applies
+        backpressure to the extractor.
+
+        Parameters
+        ----------
+        paragraphs : iterable
+            Paragraph records in page/paragraph order
+        max_workers : int, optional
+            the number of API calls in flight, by default 8
+        rpm : int, optional
+            the requests-per-minute limit of your OpenAI account, by default 3500
+        tpm : int, optional
+            the tokens-per-minute limit of your OpenAI account, by default 90000
+
+        Returns
+        -------
+        Pandas Dataframe
+            the metadata of all the paragraphs, as from set_paragraphs
+        """
+        self.limiter = RateLimiter(rpm = rpm, tpm = tpm)
+        self.client.set_pool_size(max_workers)
+        self.failed_files = []
+        if self.manifest is None:
+            self.manifest = JobManifest(f"{self.save_translation_path}job_manifest.jsonl")
+        
+        rows = []
+        free_workers = threading.BoundedSemaphore(max_workers)
+        
+        def on_done(future, fname):
+            free_workers.release()
+            try:
+                future.result()
+            except Exception as err:
+                self.log_failure(fname, err)
+        
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            for paragraph in tqdm(paragraphs):
+                fname = paragraph.file_name
+                self.texts[fname] = paragraph.text
+                rows.append((fname, paragraph.page, paragraph.index))
+                
+                if not self.needs_translation(fname, paragraph.text):
+                    continue
+                METRICS.add_gauge('paragraphs_remaining', 1)
+                
+                # wait for a free worker before taking the next paragraph:
+                free_workers.acquire()
+                future = executor.submit(self.translate_file, fname)
+                future.add_done_callback(lambda f, fname = fname: on_done(f, fname))
+        
+        self.report_failures()
+        self.metadata = pd.DataFrame(rows, columns = ['file_name', 'page_num', 'paragraph_num'])
+        
+        return self.metadata
+    
+    def translate_batch(self, batch):
+        """This function is to translate several paragraphs in one API call and
+        save each translation under its own page/paragraph file name. If the
+        reply cannot be split into one translation per paragraph, only this
+        batch falls back to one API call per paragraph.
+
+        Parameters
+        ----------
+        batch : list
+            (file name, paragraph) tuples from make_batches
+
+        Returns
+        -------
+        dict
+            the file name as the key and (df_log, translation_content) as the value
+        """
+        fnames = [i[0] for i in batch]
+        docs = [i[1] for i in batch]
+        results = dict()
+        
+        if len(batch) == 1:
+            results[fnames[0]] = self.translate_file(fnames[0])
+            return results
+        
+        for fname in fnames:
+            self.manifest.set_state(fname, IN_FLIGHT)
+        
+        segments = json.dumps(docs, ensure_ascii = False)
+        prompt = BATCH_PROMPT_TEMPLATE.format(
+            language = self.language, n_segments = len(docs), text = segments
+            )
+        result = self.request(
+            prompt, segments, BATCH_PROMPT_TEMPLATE, ",".join(fnames),
+            max_tokens = self.batch_max_tokens
+            )
+        
+        try:
+            if result['choices'][0].get('finish_reason') == 'length':
+                raise ValueError("the reply was cut off at max_tokens")
+            translations = split_batch_response(
+                result['choices'][0]['message']['content'], len(docs)
+                )
+        
+        except ValueError as err:
+            self.write_run_log({
+                'event': 'batch_fallback',
+                'file_name': ",".join(fnames),
+                'message': str(err)
+                })
+            for fname in fnames:
+                try:
+                    results[fname] = self.translate_file(fname)
+                except Exception as err:
+                    self.log_failure(fname, err)
+            return results
+        
+        for fname, paragraph_result in zip(fnames, make_paragraph_results(result, docs, translations)):
+            results[fname] = self.save_result(paragraph_result, fname)
+        
+        return results
+    
+    def iterate_batched(self, batch_size = 5, max_batch_tokens = 1000, batch_max_tokens = 2048,
+                        max_workers = 4, rpm = 3500, tpm = 90000):
+        """This function is to translate all the text files with several
+        paragraphs per API call, so the instruction text is sent once per
+        batch instead of once per paragraph.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            the maximum paragraphs in one API call, by default 5
+        max_batch_tokens : int, optional
+            the maximum input tokens of one API call, by default 1000
+        batch_max_tokens : int, optional
+            the max_tokens of the reply of a batch, by default 2048
+        max_workers : int, optional
+            the number of API calls in flight, by default 4
+        rpm : int, optional
+            the requests-per-minute limit of your OpenAI account, by default 3500
+        tpm : int, optional
+            the tokens-per-minute limit of your OpenAI account, by default 90000
+
+        Returns
+        -------
+        Pandas Dataframe, str
+            the df with API log and the translation text of the last paragraph
+        """
+        try:
+            self.limiter = RateLimiter(rpm = rpm, tpm = tpm)
+            self.client.set_pool_size(max_workers)
+            self.failed_files = []
+            self.batch_max_tokens = batch_max_tokens
+            
+            file_lst = self.get_pending_files()
+            docs = [(fname, self.read_txt_file(fname)) for fname in file_lst]
+            batches = make_batches(docs, batch_size, max_batch_tokens, get_encoder(self.model))
+            print(f"{len(file_lst)} paragraph(s) in {len(batches)} batch(es)")
+            results = dict()
+            
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                futures = {executor.submit(self.translate_batch, batch): batch for batch in batches}
+                for future in tqdm(as_completed(futures), total = len(futures)):
+                    batch = futures[future]
+                    try:
+                        results.update(future.result())
+                    except Exception as err:
+                        for fname, doc in batch:
+                            if fname not in results:
+                                self.log_failure(fname, err)
+            
+            self.report_failures()
+            
+            # keep the same return as iterate (the last paragraph in order):
+            for fname in reversed(file_lst):
+                if fname in results:
+                    return results[fname]
+        
+        except Exception as err:
+            print(err)
+    
+    def estimate(self, max_workers = 8, rpm = 3500, tpm = 90000):
+        """This function is to estimate the requests, tokens, price and
+        wall-clock time of translating the paragraphs, without any API call.
+        Call it after get_metadata or set_paragraphs.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            the number of API calls in flight, by default 8
+        rpm : int, optional
+            the requests-per-minute limit of your OpenAI account, by default 3500
+        tpm : int, optional
+            the tokens-per-minute limit of your OpenAI account, by default 90000
+
+        Returns
+        -------
+        dict
+            requests, input/output tokens, price (US dollars) and seconds
+        """
+        texts = [self.read_txt_file(fname) for fname in self.metadata['file_name']]
+        summary = estimate_run(
+            texts, self.language, PROMPT_TEMPLATE, model = self.model,
+            max_tokens = self.params['max_tokens'], max_workers = max_workers, rpm = rpm, tpm = tpm
+            )
+        print_estimate(summary)
+        
+        return summary
+    
     # merging all the translation result into 1 text file:
     
     def check_page_num(self):
@@ -273,20 +1244,10 @@ class Translator:
         try:
             t_metadata = self.get_metadata(before=False)
             
-            t_metadata['check_same_page'] = np.nan
-            for i in range(len(t_metadata)):
-                try:
-                    page_num = t_metadata['page_num'].iloc[i]
-                    next_item_page_num = t_metadata['page_num'].iloc[i+1]
-                    if page_num == next_item_page_num:
-                        # t_metadata['check_same_page'].iloc[i] = True
-                        t_metadata.loc[i, 'check_same_page'] = True
-                    else:
-                        # t_metadata['check_same_page'].iloc[i] = False
-                        t_metadata.loc[i, 'check_same_page'] = False
-                except IndexError:
-                    # t_metadata['check_same_page'].iloc[i] = True
-                    t_metadata.loc[i, 'check_same_page'] = True
+            # compare each page number with the next one in one pass,
+            # the last paragraph is compared with itself (True):
+            page_num = t_metadata['page_num']
+            t_metadata['check_same_page'] = page_num.eq(page_num.shift(-1).fillna(page_num))
             
             self.t_metadata = t_metadata
                 
@@ -295,48 +1256,52 @@ class Translator:
         except Exception as err:
             print(err)
     
-    def merge_files(self):
+    @timed('merge_files')
+    def merge_files(self, buffer_size = 1024 ** 2):
         """This function is to merge all the translated text files into 1 text file.
+        Each translation is written straight to the file as it is read, so
+        memory stays the same however long the document is.
+
+        Parameters
+        ----------
+        buffer_size : int, optional
+            the write buffer of the merged file in bytes, by default 1 MB
 
         Returns
         -------
         str
-            the merged translated paragraph 
+            the path of the merged translation file
         """
         try:
             self.t_metadata = self.check_page_num()
             
-            lang_translation = ""
-
-            for i in range(len(self.t_metadata['file_name'])):
-                
-                fname = self.t_metadata['file_name'].iloc[i]
-                same_page = self.t_metadata['check_same_page'].iloc[i]
-                # read the translation result:
-                location = self.save_translation_path + fname
-                with open(location, 'rb') as f:
-                    doc = pickle.load(f)
-        
-                # break lines
-                doc = doc.replace("。", "。\n")
-                
-                if same_page == True:
-                    lang_translation += doc + "\n"
-                else:
-                    lang_translation += doc + "\n\n"
+            location = f"{self.save_translation_path}merge_translation.txt"
+            
+            # the store and the metadata are both in page/paragraph order, the
+            # rows of earlier runs that are not in this job are left out:
+            job_keys = set(zip(self.t_metadata['page_num'], self.t_metadata['paragraph_num']))
+            translations = (
+                i for i in self.results.iter_translations(self.document) if (i[0], i[1]) in job_keys
+                )
             
-            # save the result:
-            location = f"{self.save_translation_path}merge_translation.txt"     
-            with open(location, 'w', encoding = 'utf-8') as f:
-                f.write(lang_translation)
+            # write a temporary file and rename it when it is complete:
+            with open(location + ".tmp", 'w', encoding = 'utf-8', buffering = buffer_size) as out:
+                for same_page, (page, idx, doc) in zip(self.t_metadata['check_same_page'], translations):
+                    # break lines
+                    out.write(doc.replace("。", "。\n"))
+                    out.write("\n" if same_page else "\n\n")
             
-            return lang_translation
+            os.replace(location + ".tmp", location)
+            
+            return location
         
         except Exception as err:
             print(err)
     
     def price_calculation(self):
-        """This function is to calculate the cumulated price for the API call per PDF file.
+        """This function is to calculate the cumulated price for the API call per PDF file,
+        from the totals of the usage ledger (after/log/usage_ledger.jsonl) and
+        the input and output prices of each model (usage_ledger.py).
 
         Returns
         -------
@@ -344,22 +1309,11 @@ class Translator:
             the total tokens, includes input and the completion (output) texts.
         """
         try:
-            file_lst = os.listdir(self.log_path)
-            file_lst = [i for i in file_lst if (i.endswith('.csv') & (i.startswith('page')))]
-            
-            df_price = pd.DataFrame()
-
-            for i in file_lst:
-                location = self.log_path + i
-                df_1 = pd.read_csv(location)
-                df_price = pd.concat([df_price, df_1])
-            
-            # total tokens for this API call:
-            total_tokens = df_price['usage.total_tokens'].sum()
-            price = (total_tokens/1000) * 0.002
+            self.ledger.save_totals()
             
             print(f"\nHere is the summary of cost for this API call:")
-            print(f"total tokens: {total_tokens}, price: ${price} (US)")  
+            # total tokens for this API call:
+            total_tokens, price = print_summary(self.ledger.summary())
             
             return total_tokens
               
@@ -0,0 +1,202 @@
+# Purpose:  This script is to record the token usage of every API call in one
+#           append-only ledger and keep running totals for the price
+
+import os
+import json
+import time
+import threading
+
+# US dollars per 1K tokens (input, output):
+MODEL_PRICES = {
+    'gpt-3.5-turbo': {'input': 0.0015, 'output': 0.002},
+    'gpt-3.5-turbo-16k': {'input': 0.003, 'output': 0.004},
+    'gpt-4': {'input': 0.03, 'output': 0.06},
+    'gpt-4-32k': {'input': 0.06, 'output': 0.12},
+    }
+
+def get_price(model, prices = MODEL_PRICES):
+    """This function is to get the price of a model. The API returns dated
+    model names (ex: gpt-3.5-turbo-0613), so the longest matching name wins.
+
+    Parameters
+    ----------
+    model : str
+        the model name from the API result
+    prices : dict, optional
+        the prices per 1K tokens, by default MODEL_PRICES
+
+    Returns
+    -------
+    dict or None
+        {'input': ..., 'output': ...}, None if the model is unknown
+    """
+    matches = [i for i in prices if model.startswith(i)]
+    if not matches:
+        return None
+    return prices[max(matches, key = len)]
+
+
+def print_summary(summary):
+    """This function is to print the tokens and price per model of a ledger.
+
+    Parameters
+    ----------
+    summary : dict
+        from UsageLedger.summary
+
+    Returns
+    -------
+    int, float
+        the total tokens (input and output) and the total price (US dollars)
+    """
+    total_tokens = sum(i['total_tokens'] for i in summary.values())
+    price = sum(i['price'] for i in summary.values() if i['price'] is not None)
+
+    for model, i in summary.items():
+        model_price = f"${i['price']:.4f}" if i['price'] is not None else "unknown price"
+        print(f"{model}: {i['requests']} requests ({i['cached']} cached), "
+              f"input tokens: {i['prompt_tokens']}, output tokens: {i['completion_tokens']}, "
+              f"{model_price}")
+    print(f"total tokens: {total_tokens}, price: ${price:.4f} (US)")
+
+    return total_tokens, price
+
+
+class UsageLedger:
+    """This class is to append one JSON line per API call to the ledger and
+    keep the totals per model. The totals are saved next to the ledger with
+    the byte offset they cover, so opening the ledger again only reads the
+    lines added since.
+    """
+
+    def __init__(self, path, prices = MODEL_PRICES):
+        """Initiate the class.
+
+        Parameters
+        ----------
+        path : str
+            the ledger file, ex: after/log/usage_ledger.jsonl
+        prices : dict, optional
+            the prices per 1K tokens, by default MODEL_PRICES
+        """
+        self.path = path
+        self.totals_path = path + ".totals.json"
+        self.prices = prices
+        self.lock = threading.Lock()
+        self.totals = dict()
+        self.offset = 0
+        self.load()
+
+    def load(self):
+        """This function is to load the saved totals and add the lines of the
+        ledger written after them.
+        """
+        if os.path.exists(self.totals_path):
+            with open(self.totals_path, 'r', encoding = 'utf-8') as f:
+                snapshot = json.load(f)
+            self.totals = snapshot['totals']
+            self.offset = snapshot['offset']
+
+        if not os.path.exists(self.path):
+            self.totals = dict()
+            self.offset = 0
+            return
+
+        # the ledger was replaced, count it again from the start:
+        if self.offset > os.path.getsize(self.path):
+            self.totals = dict()
+            self.offset = 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                # a line cut off by a crash has no newline yet:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                try:
+                    self.add_to_totals(json.loads(line))
+                except ValueError:
+                    continue
+
+    def add_to_totals(self, record):
+        """This function is to add a ledger line to the totals.
+
+        Parameters
+        ----------
+        record : dict
+            a ledger line
+        """
+        totals = self.totals.setdefault(
+            record['model'],
+            {'requests': 0, 'cached': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+            )
+        totals['requests'] += 1
+        totals['cached'] += int(record.get('cached', False))
+        totals['prompt_tokens'] += record['prompt_tokens']
+        totals['completion_tokens'] += record['completion_tokens']
+
+    def record(self, fname, result):
+        """This function is to append the usage of an API result to the ledger.
+
+        Parameters
+        ----------
+        fname : str
+            the text file of the paragraph
+        result : dict, JSON
+            the return log and translation results from API call Chat Completion
+        """
+        usage = result.get('usage') or {}
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'file_name': fname,
+            'id': result.get('id'),
+            'model': result.get('model', 'unknown'),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'cached': bool(result.get('cached', False))
+            }
+        line = (json.dumps(record) + "\n").encode('utf-8')
+
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+            self.offset += len(line)
+            self.add_to_totals(record)
+
+    def save_totals(self):
+        """This function is to save the totals, written to a temporary file and
+        renamed so a crash never leaves half a file.
+        """
+        with self.lock:
+            snapshot = {'offset': self.offset, 'totals': self.totals}
+            tmp = self.totals_path + ".tmp"
+            with open(tmp, 'w', encoding = 'utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.totals_path)
+
+    def summary(self):
+        """This function is to get the tokens and price per model.
+
+        Returns
+        -------
+        dict
+            the model as the key and requests, tokens and price (US dollars)
+            as the value
+        """
+        summary = dict()
+        with self.lock:
+            for model, totals in self.totals.items():
+                price = get_price(model, self.prices)
+                if price is None:
+                    cost = None
+                else:
+                    cost = (totals['prompt_tokens'] / 1000) * price['input'] \
+                        + (totals['completion_tokens'] / 1000) * price['output']
+                summary[model] = {
+                    **totals,
+                    'total_tokens': totals['prompt_tokens'] + totals['completion_tokens'],
+                    'price': cost
+                    }
+
+        return summary